@@ -17,6 +17,7 @@ import sys
 import shutil
 import re
 import common_lib
+import tile_lib
 
 class LicenseError3D(Exception):
     pass
@@ -45,6 +46,10 @@ if debugging == 0:
     scaleLevel = arcpy.GetParameterAsText(1)
     userLERC = arcpy.GetParameterAsText(2)
     cacheDirectory = arcpy.GetParameterAsText(3)
+    # optional: LOCAL builds the LERC compact cache with tile_lib, in parallel, instead of ManageTileCache,
+    # REFRESH only rebuilds the tiles changed since the last REFRESH run
+    localCache = arcpy.GetParameterAsText(4) if arcpy.GetArgumentCount() > 4 else ""
+    processes = arcpy.GetParameterAsText(5) if arcpy.GetArgumentCount() > 5 else ""
 #else:
     #Debug
 #    inputDataSource = r'D:\Gert\Work\Esri\Solutions\LocalGovernment\3DBaseScenes\work1.3\LocalGovernmentScenes\LocalGovernmentScenes.gdb\DTM_meters_ProjectRaster'
@@ -202,85 +207,96 @@ def ExportTileCache(input_layer, cache_directory, tile_cache):
         arcpy.AddError(e.args[0])
 
 
-try:
-    if arcpy.CheckExtension("3D") == "Available":
-        arcpy.CheckOutExtension("3D")
-    else:
-        raise LicenseError3D
+# processes for the local cache re-import this script, only run the tool in the main one
+if __name__ == '__main__':
+    try:
+        if arcpy.CheckExtension("3D") == "Available":
+            arcpy.CheckOutExtension("3D")
+        else:
+            raise LicenseError3D
 
-    if debugging == 0:
-        aprx = arcpy.mp.ArcGISProject("CURRENT")
-        homeFolder = aprx.homeFolder
+        if debugging == 0:
+            aprx = arcpy.mp.ArcGISProject("CURRENT")
+            homeFolder = aprx.homeFolder
 
-        if os.path.exists(homeFolder + "\\p20"):      # it is a package
-            homeFolder = homeFolder + "\\p20"
+            if os.path.exists(homeFolder + "\\p20"):      # it is a package
+                homeFolder = homeFolder + "\\p20"
 
-        arcpy.AddMessage("Project Home Directory is: " + homeFolder)
+            arcpy.AddMessage("Project Home Directory is: " + homeFolder)
 
-        schemeDirectory = homeFolder+"\\tiling_schemes"
-#    else:
-#        homeFolder = r'D:\Gert\Work\Esri\Solutions\LocalGovernment\3DBaseScenes\work1.3\LocalGovernmentScenes'
-#        schemeDirectory = r'D:\Gert\Work\Esri\Solutions\LocalGovernment\3DBaseScenes\work1.3\LocalGovernmentScenes\tiling_schemes'
+            schemeDirectory = homeFolder+"\\tiling_schemes"
+    #    else:
+    #        homeFolder = r'D:\Gert\Work\Esri\Solutions\LocalGovernment\3DBaseScenes\work1.3\LocalGovernmentScenes'
+    #        schemeDirectory = r'D:\Gert\Work\Esri\Solutions\LocalGovernment\3DBaseScenes\work1.3\LocalGovernmentScenes\tiling_schemes'
 
-    layerDirectory = homeFolder + "\\layer_files"
+        layerDirectory = homeFolder + "\\layer_files"
 
-    if os.path.exists(layerDirectory):
-        common_lib.rename_file_extension(layerDirectory, ".txt", ".lyrx")
+        if os.path.exists(layerDirectory):
+            common_lib.rename_file_extension(layerDirectory, ".txt", ".lyrx")
 
-    # fail safe for Europese's comma's
-    lercError = float(re.sub("[,.]", ".", userLERC))
-    scaleLevel = re.sub("[,.]", ".", scaleLevel)
+        # fail safe for Europese's comma's
+        lercError = float(re.sub("[,.]", ".", userLERC))
+        scaleLevel = re.sub("[,.]", ".", scaleLevel)
 
-    outputTilingScheme = GenerateLERCTilingScheme(inputDataSource, cacheDirectory, lercError)
-    arcpy.AddMessage("Created LERC Tiling Scheme with LERC error: "+str(lercError))
+        if localCache.lower() in ("true", "local", "refresh"):
+            tileCache = tile_lib.build_elevation_cache(inputDataSource, cacheDirectory, int(scaleLevel), lercError,
+                                                       int(processes) if processes else None, log=arcpy.AddMessage,
+                                                       refresh=localCache.lower() == "refresh")
+            arcpy.AddMessage("Created local Tile Cache with LERC error " + str(lercError) + ": " + tileCache)
 
-    tileCache = ManageTileCache(inputDataSource, cacheDirectory, outputTilingScheme, int(scaleLevel))
-    arcpy.AddMessage("Created Tile Cache...")
+            arcpy.AddMessage("Exporting to Tile Package...")
+            tilePackage = ExportTileCache(inputDataSource, cacheDirectory, tileCache)
+        else:
+            outputTilingScheme = GenerateLERCTilingScheme(inputDataSource, cacheDirectory, lercError)
+            arcpy.AddMessage("Created LERC Tiling Scheme with LERC error: "+str(lercError))
 
-    arcpy.AddMessage("Exporting to Tile Package...")
-    tilePackage = ExportTileCache(inputDataSource, cacheDirectory, tileCache)
+            tileCache = ManageTileCache(inputDataSource, cacheDirectory, outputTilingScheme, int(scaleLevel))
+            arcpy.AddMessage("Created Tile Cache...")
 
+            arcpy.AddMessage("Exporting to Tile Package...")
+            tilePackage = ExportTileCache(inputDataSource, cacheDirectory, tileCache)
 
-except LicenseError3D:
-    print("3D Analyst license is unavailable")
-    arcpy.AddError("3D Analyst license is unavailable")
 
-except LicenseErrorSpatial:
-    print("Spatial Analyst license is unavailable")
-    arcpy.AddError("Spatial Analyst license is unavailable")
+    except LicenseError3D:
+        print("3D Analyst license is unavailable")
+        arcpy.AddError("3D Analyst license is unavailable")
 
-except NoFeatures:
-    # The input has no features
-    #
-    print(('Error creating feature class'))
-    arcpy.AddError('Error creating feature class')
+    except LicenseErrorSpatial:
+        print("Spatial Analyst license is unavailable")
+        arcpy.AddError("Spatial Analyst license is unavailable")
 
-except No3DFeatures:
-    # The input has no 3D features
-    #
-    print(('2D features are not supported. Drag your 2D layer to the 3D layers section in the TOC and use the "Layer 3D to Feature Class" GP tool to create 3D features.'))
-    arcpy.AddError('2D features are not supported. Drag your 2D layer to the 3D layers section in the TOC and use the "Layer 3D to Feature Class" GP tool to create 3D features.')
+    except NoFeatures:
+        # The input has no features
+        #
+        print(('Error creating feature class'))
+        arcpy.AddError('Error creating feature class')
 
-except arcpy.ExecuteWarning:
-    print ((arcpy.GetMessages(1)))
-    arcpy.AddWarning(arcpy.GetMessages(1))
+    except No3DFeatures:
+        # The input has no 3D features
+        #
+        print(('2D features are not supported. Drag your 2D layer to the 3D layers section in the TOC and use the "Layer 3D to Feature Class" GP tool to create 3D features.'))
+        arcpy.AddError('2D features are not supported. Drag your 2D layer to the 3D layers section in the TOC and use the "Layer 3D to Feature Class" GP tool to create 3D features.')
 
-except arcpy.ExecuteError:
-    print((arcpy.GetMessages(2)))
-    arcpy.AddError(arcpy.GetMessages(2))
+    except arcpy.ExecuteWarning:
+        print ((arcpy.GetMessages(1)))
+        arcpy.AddWarning(arcpy.GetMessages(1))
+
+    except arcpy.ExecuteError:
+        print((arcpy.GetMessages(2)))
+        arcpy.AddError(arcpy.GetMessages(2))
 
-# Return any other type of error
-except:
-    # By default any other errors will be caught here
-    #
-    e = sys.exc_info()[1]
-    print((e.args[0]))
-    arcpy.AddError(e.args[0])
+    # Return any other type of error
+    except:
+        # By default any other errors will be caught here
+        #
+        e = sys.exc_info()[1]
+        print((e.args[0]))
+        arcpy.AddError(e.args[0])
 
-finally:
-    # Check in the 3D Analyst extension
-    #
-    arcpy.CheckInExtension("3D")
-    # Check in the Spatial Analyst extension
-    #
-    arcpy.CheckInExtension("spatial")
\ No newline at end of file
+    finally:
+        # Check in the 3D Analyst extension
+        #
+        arcpy.CheckInExtension("3D")
+        # Check in the Spatial Analyst extension
+        #
+        arcpy.CheckInExtension("spatial")
@@ -5,6 +5,8 @@ import time
 import sys
 import flood_impact_lib
 import common_lib
+import polygon_lib
+import raster_lib
 from common_lib import create_msg_body, msg, trace
 import settings
 from settings import *
@@ -404,7 +406,8 @@ def attribute_feature(riskType,
                         GroundSTDField,
                         lossField,
                         debug,
-                        lc_use_in_memory):
+                        lc_use_in_memory,
+                        wet_mask=None):
     try:
         # Get Attributes from User
         if debug == 0:
@@ -623,8 +626,8 @@ def attribute_feature(riskType,
                                     arcpy.Delete_management(tempRasterFP)
 
                                 # Set Pixel Size for All Raster Analysis as the Smallest Input Raster Size. Ensures Accuracy
-                                arcpy.PolygonToRaster_conversion(tempFP, featureFID, tempRasterFP, "CELL_CENTER", "NONE",
-                                                                 tolerance)
+                                # zones numbered by featureFID with featureFID in the attribute table
+                                polygon_lib.polygons_to_raster(tempFP, featureFID, tempRasterFP, tolerance, processes=None)
                                 arcpy.env.cellSize = "MINOF"
 
                                 # Define Pixel Area for Footprint
@@ -670,6 +673,14 @@ def attribute_feature(riskType,
 
                                             depthRaster = depthRasterProcessList[count][2]
 
+                                            if wet_mask:
+                                                # only the cells flooded in the wet mask count as exposed
+                                                maskedDepthRaster = os.path.join(scratch_ws, "MaskedDepthRaster{0}{1}".format(riskValues[0], row[0]))
+                                                mosaic = raster_lib.VirtualMosaic([raster_lib.RasterSource(depthRaster)],
+                                                                                  mask=raster_lib.WetMask(wet_mask))
+                                                depthRaster = raster_lib.materialize(mosaic, maskedDepthRaster,
+                                                                                     arcpy.Describe(depthRaster).spatialReference)
+
                                             depthZonalStatsTable = os.path.join(scratch_ws, "depthZonalStatsTable{0}{1}".format(riskValues[0], row[0]))
 
                                             # Begin Calculating Depth Statistics Information
@@ -876,6 +887,11 @@ def attribute_feature(riskType,
                                                     arcpy.Delete_management(depthRaster)
                                                 except:
                                                     arcpy.AddWarning("Could not delete {0}".format(depthRaster))
+                                            if wet_mask:
+                                                try:
+                                                    arcpy.Delete_management(maskedDepthRaster)
+                                                except:
+                                                    arcpy.AddWarning("Could not delete {0}".format(maskedDepthRaster))
 
                                             #  Copy the First Table as a "Master Table" for merging all additional tables to...
                                             if count == 0:
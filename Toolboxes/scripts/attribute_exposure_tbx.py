@@ -143,6 +143,7 @@ def main():
             GroundMeanField = arcpy.GetParameter(25)
             GroundSTDField = arcpy.GetParameter(26)
             lossField = arcpy.GetParameter(27)
+            wet_mask = arcpy.GetParameterAsText(30) if arcpy.GetArgumentCount() > 30 else ""
         else:
             # debug
             riskType = "NOAA Sea Level Rise"  # "NOAA Sea Level Rise", "FEMA Flood Percent", "FEMA Flood Annual", "Tidal Flood", "Storm Surge", "Riverine Flood"
@@ -177,6 +178,7 @@ def main():
             GroundMeanField = False
             GroundSTDField = False
             lossField = True
+            wet_mask = ""
 
         # fail safe for Europese's comma's
         if bufferDistance:
@@ -220,7 +222,8 @@ def main():
                                                                GroundSTDField=GroundSTDField,
                                                                lossField=lossField,
                                                                debug=debugging,
-                                                               lc_use_in_memory=in_memory_switch)
+                                                               lc_use_in_memory=in_memory_switch,
+                                                               wet_mask=wet_mask)
                 end_time = time.clock()
 
                 if success:
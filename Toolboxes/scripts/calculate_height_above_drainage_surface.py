@@ -23,6 +23,15 @@ import importlib
 import common_lib
 if 'common_lib' in sys.modules:
     importlib.reload(common_lib)
+import hand_lib
+if 'hand_lib' in sys.modules:
+    importlib.reload(hand_lib)
+import zonal_lib
+if 'zonal_lib' in sys.modules:
+    importlib.reload(zonal_lib)
+import polygon_lib
+if 'polygon_lib' in sys.modules:
+    importlib.reload(polygon_lib)
 
 from common_lib import create_msg_body, msg
 
@@ -32,67 +41,55 @@ esri_featureID = "copy_featureID"
 esri_unit = "unit"
 min_field = "MIN"
 zmin_field = "Z_MIN"
+has_field = "HAS_height"
 
-def add_minimum_height_above_HAND(lc_ws, lc_input_features, lc_input_surface, lc_had_field, lc_memory_switch):
+def add_minimum_heights(lc_input_features, lc_dem, lc_hand, lc_had_field, lc_water_surface=None,
+                        lc_surface_method="LINEAR"):
+    # height above the minimum DEM elevation of each feature, with a HAND raster the HAND height and with a
+    # water surface the height above the water surface, in one pass over the features: each raster is read
+    # once, Z_MIN comes from the feature vertices
     try:
         if arcpy.Exists(lc_input_features):
-            if arcpy.Exists(lc_input_surface):
-
-                # find minimum HAND value for each input features
-                heightsTable = os.path.join(lc_ws, "heightsTable")
-
-                if arcpy.Exists(heightsTable):
-                    arcpy.Delete_management(heightsTable)
-
-                stat_type = "MINIMUM"
-
-                arcpy.AddMessage("Calculating minimum HAND height for " + common_lib.get_name_from_feature_class(
-                    lc_input_features) + ".")
-                arcpy.sa.ZonalStatisticsAsTable(lc_input_features, esri_featureID, lc_input_surface, heightsTable,
-                                                "DATA", stat_type)
-
-                common_lib.delete_fields(lc_input_features, [min_field])
-                arcpy.JoinField_management(lc_input_features, esri_featureID, heightsTable, esri_featureID, min_field)
-
-                # add minimum HAND height to height_dem which was previously calculated
-                hand_field = "HAND"
-                common_lib.add_field(lc_input_features, hand_field, "DOUBLE", 5)
-
-                expression = "round(float(!" + lc_had_field + "! + !" + min_field + "!), 2)"
-
-                arcpy.CalculateField_management(lc_input_features, hand_field,
-                                                expression,
-                                                "PYTHON3", None)
-
-                common_lib.delete_fields(lc_input_features, [lc_had_field, min_field])
-
-                # alternative way ->
-
-                # bridge surface to points
-
-                # bridge polygons to raster
-
-                # add Z values
-
-                # find point with minimum Z value
-
-                # get HAND value point
-
-                # get DEM value for point
-
-                # subtract DEM value from minimum Z -> Height above DEM
-
-                # add this value to HAND for location
-
-            else:
-                msg_body = create_msg_body("Couldn't find input surface: " + str(lc_input_surface), 0, 0)
-                msg(msg_body, WARNING)
+            surfaces = {"DEM": lc_dem}
+            statistics = [(min_field, "DEM", "MINIMUM")]
+            heights = [(lc_had_field, [zmin_field], [min_field])]
+            fields = [zmin_field, lc_had_field]
+
+            if lc_hand:
+                if arcpy.Exists(lc_hand):
+                    arcpy.AddMessage("Calculating minimum HAND height for " +
+                                     common_lib.get_name_from_feature_class(lc_input_features) + ".")
+
+                    # add minimum HAND height to the height above the DEM
+                    surfaces["HAND"] = lc_hand
+                    statistics.append(("HAND_MIN", "HAND", "MINIMUM"))
+                    heights.append(("HAND", [lc_had_field, "HAND_MIN"], []))
+                    fields = [zmin_field, "HAND"]
+                else:
+                    msg_body = create_msg_body("Couldn't find input surface: " + str(lc_hand), 0, 0)
+                    msg(msg_body, WARNING)
+
+            if lc_water_surface:
+                if arcpy.Exists(lc_water_surface):
+                    arcpy.AddMessage("Calculating height above water surface for " +
+                                     common_lib.get_name_from_feature_class(lc_input_features) + ".")
+
+                    # minimum distance between the feature surface and the water surface, as in
+                    # calculate_height_above_water_surface
+                    surfaces["WSE"] = lc_water_surface
+                    statistics.append(("WSE_clearance", "WSE", "CLEARANCE"))
+                    heights.append((has_field, ["WSE_clearance"], []))
+                    fields.append(has_field)
+                else:
+                    msg_body = create_msg_body("Couldn't find input surface: " + str(lc_water_surface), 0, 0)
+                    msg(msg_body, WARNING)
+
+            zonal_lib.attribute_features(lc_input_features, surfaces, statistics, heights, fields,
+                                         surface_method=lc_surface_method)
         else:
             msg_body = create_msg_body("Couldn't find input feature class: " + str(lc_input_features), 0, 0)
             msg(msg_body, WARNING)
 
-        return None
-
     except arcpy.ExecuteError:
         # Get the tool error messages
         msgs = arcpy.GetMessages(2)
@@ -102,53 +99,10 @@ def add_minimum_height_above_HAND(lc_ws, lc_input_features, lc_input_surface, lc
         arcpy.AddMessage("Unhandled exception: " + str(e.args[0]))
 
 
-def add_minimum_height_above_drainage(lc_ws, lc_input_features, lc_input_surface, lc_had_field, lc_memory_switch):
-
-    try:
-        if arcpy.Exists(lc_input_features):
-            # find minimum value in input surface
-            # run zonal stats and get minimum DEM elevation for each polygon
-
-            heightsTable = os.path.join(lc_ws, "heightsTable")
-
-            if arcpy.Exists(heightsTable):
-                arcpy.Delete_management(heightsTable)
-
-            stat_type = "MINIMUM"
-
-            arcpy.sa.ZonalStatisticsAsTable(lc_input_features, esri_featureID, lc_input_surface, heightsTable,
-                                            "DATA", stat_type)
-
-            common_lib.delete_fields(lc_input_features, [min_field])
-            arcpy.JoinField_management(lc_input_features, esri_featureID, heightsTable, esri_featureID, min_field)
-
-            # add minimum Z information for input feature
-            common_lib.delete_fields(lc_input_features, zmin_field)
-            arcpy.AddZInformation_3d(lc_input_features, zmin_field, None)
-
-            # calculate height above drainage surface
-            common_lib.add_field(lc_input_features, lc_had_field, "DOUBLE", 5)
-
-            expression = "round(float(!" + zmin_field + "! - !" + min_field + "!), 2)"
-            arcpy.CalculateField_management(lc_input_features, lc_had_field, expression, "PYTHON3", None)
-
-            common_lib.delete_fields(lc_input_features, [min_field])
-        else:
-            msg_body = create_msg_body("Couldn't find input feature class: " + str(lc_input_features), 0, 0)
-            msg(msg_body, WARNING)
-
-    except arcpy.ExecuteError:
-        msgs = arcpy.GetMessages(2)        # Get the tool error messages
-
-        arcpy.AddError(msgs)
-    except Exception:
-        e = sys.exc_info()[1]
-        arcpy.AddMessage("Unhandled exception: " + str(e.args[0]))
-
-
 def calculate_height(lc_input_features, lc_ws, lc_tin_dir, lc_input_surface,
                      lc_is_hand, lc_dem, lc_output_features,
-                     lc_log_dir, lc_debug, lc_memory_switch):
+                     lc_log_dir, lc_debug, lc_memory_switch, lc_stream_area=hand_lib.STREAM_AREA,
+                     lc_water_surface=None):
 
     try:
         if arcpy.Exists(lc_input_features):
@@ -163,61 +117,44 @@ def calculate_height(lc_input_features, lc_ws, lc_tin_dir, lc_input_surface,
 
             arcpy.CopyFeatures_management(lc_input_features, bridge_polys)
 
-            # create string field for featureFID
-            oidFieldName = arcpy.Describe(bridge_polys).oidFieldName
-            common_lib.delete_add_field(bridge_polys, esri_featureID, "TEXT")
-            arcpy.CalculateField_management(bridge_polys, esri_featureID, "!" + oidFieldName + "!", "PYTHON_9.3")
-
             msg_body = create_msg_body("Calculating height above surface for: " +
                                        common_lib.get_name_from_feature_class(lc_input_features), 0, 0)
             msg(msg_body)
 
             had_field = "height_dem"
 
+            # no HAND raster yet: derive it from the DEM
+            if lc_is_hand and not (lc_input_surface and arcpy.Exists(lc_input_surface)):
+                lc_input_surface = os.path.join(lc_ws, "hand_raster")
+
+                msg_body = create_msg_body("Creating HAND raster from " +
+                                           common_lib.get_name_from_feature_class(lc_dem) +
+                                           " with streams draining at least " + str(lc_stream_area) +
+                                           " square map units.", 0, 0)
+                msg(msg_body)
+
+                hand_lib.hand_raster(lc_dem, lc_input_surface, lc_stream_area)
+
             # if HAND raster
             if lc_is_hand:
                 arcpy.AddMessage("Assuming input surface " + common_lib.get_name_from_feature_class(lc_input_surface) + " is a HAND raster.")
-                arcpy.AddMessage("First adding height above DEM to " + common_lib.get_name_from_feature_class(lc_input_features) + ".")
-                add_minimum_height_above_drainage(lc_ws, bridge_polys, lc_dem, had_field, lc_memory_switch)
-
-                arcpy.AddMessage("Now adding height above HAND raster " + common_lib.get_name_from_feature_class(lc_input_features) + ".")
-
-                add_minimum_height_above_HAND(lc_ws, bridge_polys, lc_input_surface, had_field, lc_memory_switch)
+                arcpy.AddMessage("Adding height above DEM and HAND raster to " + common_lib.get_name_from_feature_class(lc_input_features) + ".")
+                add_minimum_heights(bridge_polys, lc_dem, lc_input_surface, had_field, lc_water_surface)
             else:
                 # if just DEM
                 arcpy.AddMessage("Assuming input surface " + common_lib.get_name_from_feature_class(lc_input_surface) + " is a digital elevation model.")
                 arcpy.AddMessage("Adding height above input surface to " + common_lib.get_name_from_feature_class(lc_input_features) + ".")
-                add_minimum_height_above_drainage(lc_ws, bridge_polys, lc_input_surface, had_field, lc_memory_switch)
-
-            # create point file for labeling
-            if lc_memory_switch:
-                bridge_points = "in_memory/bridge_points"
-            else:
-                bridge_points = os.path.join(lc_ws, "bridge_points")
-                if arcpy.Exists(bridge_points):
-                    arcpy.Delete_management(bridge_points)
-
-            arcpy.FeatureToPoint_management(bridge_polys,
-                                            bridge_points,
-                                           "INSIDE")
+                add_minimum_heights(bridge_polys, lc_input_surface, None, had_field, lc_water_surface)
 
+            # 3D label points at Z_MIN with the unit, in one insert
             bridge_points3D = lc_output_features + "_points_3D"
-            if arcpy.Exists(bridge_points3D):
-                arcpy.Delete_management(bridge_points3D)
 
-            # create 3D point
-            arcpy.FeatureTo3DByAttribute_3d(bridge_points, bridge_points3D, zmin_field)
-
-            # add unit field
-            z_unit = common_lib.get_z_unit(bridge_points3D, lc_debug)
-
-            if z_unit == "Meters":
-                expression = "'m'"
-            else:
-                expression = "'ft'"
+            z_unit = common_lib.get_z_unit(bridge_polys, lc_debug)
+            unit = 'm' if z_unit == "Meters" else 'ft'
+            count = int(arcpy.GetCount_management(bridge_polys).getOutput(0))
 
-            common_lib.delete_add_field(bridge_points3D, esri_unit, "TEXT")
-            arcpy.CalculateField_management(bridge_points3D, esri_unit, expression, "PYTHON_9.3")
+            polygon_lib.write_label_points(bridge_polys, bridge_points3D, zmin_field,
+                                           {esri_unit: ("TEXT", [unit] * count)})
 
             return bridge_polys, bridge_points3D
         else:
@@ -226,6 +163,8 @@ def calculate_height(lc_input_features, lc_ws, lc_tin_dir, lc_input_surface,
 
             return None
 
+    except hand_lib.HandError as e:
+        arcpy.AddError(str(e))
     except arcpy.ExecuteError:
         # Get the tool error messages
         msgs = arcpy.GetMessages(2)
@@ -102,6 +102,7 @@ def main():
             is_hand = arcpy.GetParameter(2)
             dem = arcpy.GetParameterAsText(3)
             output_features = arcpy.GetParameterAsText(4)
+            water_surface = arcpy.GetParameterAsText(8) if arcpy.GetArgumentCount() > 8 else ""
 
             # script variables
             aprx = arcpy.mp.ArcGISProject("CURRENT")
@@ -114,6 +115,7 @@ def main():
             is_hand = False
             dem = r'D:\Gert\Work\Esri\Solutions\3DFloodImpact\work2.3\3DFloodImpact\Testing.gdb\austin_dtm'
             output_features = r'D:\Gert\Work\Esri\Solutions\3DFloodImpact\work2.3\3DFloodImpact\Testing.gdb\bridges_HAND'
+            water_surface = ""
 
             home_directory = r'D:\Gert\Work\Esri\Solutions\3DFloodImpact\work2.3\3DFloodImpact'
             project_ws = home_directory + "\\3DFloodImpact.gdb"
@@ -150,7 +152,8 @@ def main():
             z_values = arcpy.Describe(input_features).hasZ
 
             if z_values:
-                if arcpy.Exists(input_surface):
+                # a HAND raster can be derived from the DEM
+                if (input_surface and arcpy.Exists(input_surface)) or (is_hand and dem and arcpy.Exists(dem)):
                     # extract the elevation layers
                     bridges, bridge_points = calculate_height_above_drainage_surface.calculate_height(lc_input_features=input_features,
                                                                                        lc_ws=scratch_ws,
@@ -161,7 +164,8 @@ def main():
                                                                                        lc_output_features=output_features,
                                                                                        lc_log_dir=log_directory,
                                                                                        lc_debug=verbose,
-                                                                                       lc_memory_switch=in_memory_switch)
+                                                                                       lc_memory_switch=in_memory_switch,
+                                                                                       lc_water_surface=water_surface)
 
                     if bridges and bridge_points:
                         # add symbology to points and add layer
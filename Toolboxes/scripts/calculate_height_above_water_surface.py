@@ -23,6 +23,12 @@ import importlib
 import common_lib
 if 'common_lib' in sys.modules:
     importlib.reload(common_lib)
+import zonal_lib
+if 'zonal_lib' in sys.modules:
+    importlib.reload(zonal_lib)
+import polygon_lib
+if 'polygon_lib' in sys.modules:
+    importlib.reload(polygon_lib)
 
 from common_lib import create_msg_body, msg
 
@@ -34,51 +40,22 @@ min_field = "MIN"
 esri_unit = "unit"
 has_field = "HAS_height"
 
-def add_minimum_height_above_water_surface(lc_ws, lc_input_features, lc_bridge_raster, lc_input_surface,
-                                           lc_memory_switch):
+def add_minimum_height_above_water_surface(lc_ws, lc_input_features, lc_input_surface, lc_memory_switch,
+                                           lc_surface_method="LINEAR"):
 
     try:
         if arcpy.Exists(lc_input_features):
-            # subtract input surface from bridge raster to obtain heights above surface
-            if lc_memory_switch:
-                minus_raster = "in_memory/minus_3D"
-            else:
-                minus_raster = os.path.join(lc_ws, "minus_3D")
-                if arcpy.Exists(minus_raster):
-                    arcpy.Delete_management(minus_raster)
-
-            # actual subtract
+            # rasterize the deck surfaces straight onto the grid of the input surface, only the cells inside
+            # each polygon, and take the minimum distance between the surfaces per feature in the same pass
             msg_body = create_msg_body("Finding minimum distance between surfaces for each input feature...", 0, 0)
             msg(msg_body)
-            arcpy.Minus_3d(lc_bridge_raster, lc_input_surface, minus_raster)
-
-            # zonal stats to find minimum height above surface
-            heights_table = os.path.join(lc_ws, "heightsTable")
-
-            if arcpy.Exists(heights_table):
-                arcpy.Delete_management(heights_table)
-
-            stat_type = "MINIMUM"
 
             arcpy.AddMessage("Calculating Height Statistics Information for " +
                              common_lib.get_name_from_feature_class(lc_input_features) + ".")
-            arcpy.sa.ZonalStatisticsAsTable(lc_input_features, esri_featureID, minus_raster, heights_table,
-                                            "DATA", stat_type)
-
-            # join back to bridge object
-            common_lib.delete_fields(lc_input_features, [min_field])
-            arcpy.JoinField_management(lc_input_features, esri_featureID, heights_table, esri_featureID, min_field)
-
-            # add Z information
-            arcpy.AddZInformation_3d(lc_input_features, zmin_field, None)
-
-            # calculate height above surface
-            common_lib.add_field(lc_input_features, has_field, "DOUBLE", 5)
-
-            expression = "round(float(!" + min_field + "!), 2)"
-
-            arcpy.CalculateField_management(lc_input_features, has_field, expression,
-                                            "PYTHON3", None)
+            zonal_lib.attribute_features(lc_input_features, {"surface": lc_input_surface},
+                                         [("clearance", "surface", "CLEARANCE")],
+                                         [(has_field, ["clearance"], [])],
+                                         fields=[zmin_field, has_field], surface_method=lc_surface_method)
         else:
             msg_body = create_msg_body("Couldn't find input feature class: " + str(lc_input_features), 0, 0)
             msg(msg_body, WARNING)
@@ -94,7 +71,7 @@ def add_minimum_height_above_water_surface(lc_ws, lc_input_features, lc_bridge_r
 
 def calculate_height(lc_input_features, lc_ws, lc_tin_dir, lc_input_surface,
                      lc_output_features,
-                     lc_log_dir, lc_debug, lc_memory_switch):
+                     lc_log_dir, lc_debug, lc_memory_switch, lc_surface_method="LINEAR"):
 
     try:
         # create dem
@@ -117,89 +94,23 @@ def calculate_height(lc_input_features, lc_ws, lc_tin_dir, lc_input_surface,
 
             arcpy.CopyFeatures_management(lc_input_features, bridge_polys)
 
-            # create string field for featureFID
-            oidFieldName = arcpy.Describe(bridge_polys).oidFieldName
-            common_lib.delete_add_field(bridge_polys, esri_featureID, "TEXT")
-            arcpy.CalculateField_management(bridge_polys, esri_featureID, "!" + oidFieldName + "!", "PYTHON_9.3")
-
             msg_body = create_msg_body("Calculating height above surface for: " +
                                        common_lib.get_name_from_feature_class(lc_input_features), 0, 0)
             msg(msg_body)
 
-            # create bridge tin
-            out_tin = os.path.join(lc_tin_dir, "bridge_tin")
-            if arcpy.Exists(out_tin):
-                arcpy.Delete_management(out_tin)
-
-            msg_body = create_msg_body("Creating raster for: " +
-                                       common_lib.get_name_from_feature_class(lc_input_features), 0, 0)
-            msg(msg_body)
-
-            arcpy.CreateTin_3d(out_tin, arcpy.Describe(bridge_polys).spatialReference,
-                               "{} Shape.Z Hard_Clip <None>".format(bridge_polys), "DELAUNAY")
-
-            # turn to raster
-            if 0:
-                bridge_raster = "in_memory/bridge_raster"
-            else:
-                bridge_raster = os.path.join(lc_ws, "bridge_raster")
-                if arcpy.Exists(bridge_raster):
-                    arcpy.Delete_management(bridge_raster)
-
-            # use same cell size as input surface
-            cell_size = arcpy.GetRasterProperties_management(lc_input_surface, "CELLSIZEX")[0]
-
-            dataType = "FLOAT"
-            method = "LINEAR"
-            sampling = "CELLSIZE " + str(cell_size)
-            zfactor = "1"
-
-            arcpy.TinRaster_3d(out_tin,
-                               bridge_raster,
-                               dataType,
-                               method, sampling, zfactor)
-
-            add_minimum_height_above_water_surface(lc_ws, bridge_polys, bridge_raster,
-                                             lc_input_surface, lc_memory_switch)
-
-            # create point file for labeling
-            if lc_memory_switch:
-                bridge_points = "in_memory/bridge_points"
-            else:
-                bridge_points = os.path.join(lc_ws, "bridge_points")
-                if arcpy.Exists(bridge_points):
-                    arcpy.Delete_management(bridge_points)
-
-            arcpy.FeatureToPoint_management(bridge_polys,
-                                            bridge_points,
-                                           "INSIDE")
+            add_minimum_height_above_water_surface(lc_ws, bridge_polys, lc_input_surface, lc_memory_switch,
+                                                   lc_surface_method)
 
+            # 3D label points at Z_MIN with the unit where there is a height, in one insert
             bridge_points3D = lc_output_features + "_points_3D"
-            if arcpy.Exists(bridge_points3D):
-                arcpy.Delete_management(bridge_points3D)
-
-            # create 3D point
-            arcpy.FeatureTo3DByAttribute_3d(bridge_points, bridge_points3D, zmin_field)
-
-            # add unit field
-            common_lib.delete_add_field(bridge_points3D, esri_unit, "TEXT")
-
-            expression = """{} IS NOT NULL""".format(arcpy.AddFieldDelimiters(bridge_points3D, has_field))
-
-            # select all points with good elevation values
-            local_layer = common_lib.get_name_from_feature_class(bridge_points3D) + "_lyr"
-            select_lyr = arcpy.MakeFeatureLayer_management(bridge_points3D, local_layer).getOutput(0)
-            arcpy.SelectLayerByAttribute_management(select_lyr, "NEW_SELECTION", expression, None)
 
-            z_unit = common_lib.get_z_unit(bridge_points3D, lc_debug)
+            z_unit = common_lib.get_z_unit(bridge_polys, lc_debug)
+            unit = 'm' if z_unit == "Meters" else 'ft'
 
-            if z_unit == "Meters":
-                expression = "'m'"
-            else:
-                expression = "'ft'"
+            with arcpy.da.SearchCursor(bridge_polys, [has_field]) as cursor:
+                units = [None if row[0] is None else unit for row in cursor]
 
-            arcpy.CalculateField_management(select_lyr, esri_unit, expression, "PYTHON_9.3")
-            arcpy.SelectLayerByAttribute_management(select_lyr, "CLEAR_SELECTION")
+            polygon_lib.write_label_points(bridge_polys, bridge_points3D, zmin_field, {esri_unit: ("TEXT", units)})
 
             common_lib.delete_fields(bridge_polys, [min_field, zmin_field])
             common_lib.delete_fields(bridge_points3D, [min_field, zmin_field])
@@ -18,9 +18,10 @@ import time
 import traceback
 import datetime
 import logging
-import csv
 import sys
 import math
+import numpy as np
+import las_lib
 from math import *
 
 from bisect import bisect_left
@@ -507,6 +508,63 @@ def set_null_to_value_in_fields(cn_table, cn_field_list, cn_value_list, error, d
                 pass
 
 
+def set_field_from_field(cn_table, input_field, output_field, default_value, debug):
+    # replaces CalculateField "!input_field!" plus set_null_or_negative_to_value_in_fields: the input column is read
+    # once, NULL and non positive values set to default_value as an array, and written to a new DOUBLE output_field
+    # in one update pass. Without input_field all values are default_value.
+    try:
+        if debug == 1:
+            msg("--------------------------")
+            msg("Executing set_field_from_field...")
+
+        start_time = time.clock()
+        failed = True
+
+        if input_field:
+            with arcpy.da.SearchCursor(cn_table, [input_field]) as cursor:
+                values = np.array([np.nan if row[0] is None else row[0] for row in cursor], dtype=np.float64)
+            with np.errstate(invalid="ignore"):
+                values = np.where(np.isnan(values) | (values <= 0), default_value, values)
+        else:
+            values = None
+
+        delete_add_field(cn_table, output_field, "DOUBLE")
+
+        with arcpy.da.UpdateCursor(cn_table, [output_field]) as cursor:
+            if values is None:
+                for row in cursor:
+                    cursor.updateRow([default_value])
+            else:
+                for row, value in zip(cursor, values.tolist()):
+                    cursor.updateRow([value])
+
+        msg_prefix = "Function set_field_from_field completed successfully."
+        failed = False
+
+    except:
+        line, filename, synerror = trace()
+        failed = True
+        msg_prefix = ""
+        raise FunctionError(
+            {
+                "function": "set_field_from_field",
+                "line": line,
+                "filename": filename,
+                "synerror": synerror,
+                "arc": str(arcpy.GetMessages(2))
+            }
+        )
+
+    finally:
+        end_time = time.clock()
+        msg_body = create_msg_body(msg_prefix, start_time, end_time)
+        if failed:
+            msg(msg_body, ERROR)
+        else:
+            if debug == 1:
+                msg(msg_body)
+
+
 def calculate_field_from_other_field(lyr, table, input_field, output_field, operator, value, debug):
     if debug == 1:
         msg("--------------------------")
@@ -2263,36 +2321,23 @@ def unitConversion(layer_unit, input_unit, debug):
 # get lidar class code - TEMPORARY until Pro 2.3
 def get_las_class_codes(lasd, outputdir):
     try:
-        # Get LiDAR class codes
-        classCodes = []
-
-        lasStats = os.path.join(outputdir, 'lasStats_stats.csv')
-
-        if arcpy.Exists(lasStats):
-            arcpy.Delete_management(lasStats)
-
-        arcpy.LasDatasetStatistics_management(lasd, "OVERWRITE_EXISTING_STATS", lasStats, "DATASET", "COMMA",
-                                              "DECIMAL_POINT")
-
-        with open(lasStats, 'r') as f:
-            reader = csv.reader(f)
+        # Get LiDAR class codes from a histogram of the LAS files, kept per file in the tile index in outputdir
+        cache_file = os.path.join(outputdir, las_lib.INDEX_FILE)
 
-            for row in reader:
-
-                if len(row) > 1 and row[1] == 'ClassCodes':
-                    classNum, className = row[0].split('_', 1)
-
-                    omitClassCodes = ['7', '12', '13', '14', '15', '16', '18']
-
-                    if classNum not in omitClassCodes:
-                        classCodes.append(int(classNum))
+        las_files = las_lib.dataset_files(lasd, outputdir)
+        if las_files is not None:
+            classCodes = las_lib.class_codes(las_files, cache_file)
+        else:
+            # compressed las files: the LAS dataset statistics are calculated by now
+            class_code_string = arcpy.Describe(lasd).classCodes
+            classCodes = [int(code) for code in class_code_string.split(";")] if class_code_string else []
 
         arcpy.AddMessage('Detected Class codes: {}'.format(classCodes))
 
-        arcpy.Delete_management(lasStats)
-
         return classCodes
 
+    except las_lib.LasError as e:
+        arcpy.AddError(str(e))
     except arcpy.ExecuteError:
         # Get the tool error messages
         msgs = arcpy.GetMessages(2)
@@ -2,7 +2,12 @@ import arcpy
 import time
 import os
 import re
+import sys
+import importlib
 import common_lib
+import polygon_lib
+if 'polygon_lib' in sys.modules:
+    importlib.reload(polygon_lib)
 from common_lib import create_msg_body, msg, trace
 from settings import *
 
@@ -124,30 +129,20 @@ def convert(input_source, flood_elevation_attribute, esri_flood_elevation_attrib
 
                 arcpy.AddMessage("Processing input source: " + common_lib.get_name_from_feature_class(input_source))
 
-                common_lib.delete_add_field(input_source, esri_flood_elevation_attribute, "DOUBLE")
-
-                # check attribute
-                if flood_elevation_attribute:
-                    if common_lib.check_fields(input_source, [flood_elevation_attribute], False, verbose) == 0:
-                        arcpy.CalculateField_management(input_source, esri_flood_elevation_attribute, "!" + flood_elevation_attribute + "!", "PYTHON_9.3")
-                        common_lib.set_null_or_negative_to_value_in_fields(input_source, [esri_flood_elevation_attribute],
-                                                                           [default_flood_elevation_value],
-                                                                           True, verbose)
-                        return_code = 1
-                    else:  # create a default attribute
-                        arcpy.CalculateField_management(input_source, esri_flood_elevation_attribute, default_flood_elevation_value, "PYTHON_9.3")
-                        return_code = 1
+                # check attribute, without it every feature gets the default value
+                if flood_elevation_attribute and common_lib.check_fields(input_source, [flood_elevation_attribute],
+                                                                         False, verbose) == 0:
+                    source_attribute = flood_elevation_attribute
                 else:
-                    arcpy.CalculateField_management(input_source, esri_flood_elevation_attribute, default_flood_elevation_value, "PYTHON_9.3")
-                    return_code = 1
+                    source_attribute = None
 
-                # convert here
-                assignmentType = "CELL_CENTER"
-                priorityField = "#"
+                common_lib.set_field_from_field(input_source, source_attribute, esri_flood_elevation_attribute,
+                                                default_flood_elevation_value, verbose)
+                return_code = 1
 
-                # Execute PolygonToRaster
-                arcpy.PolygonToRaster_conversion(input_source, esri_flood_elevation_attribute, output_raster,
-                                                 assignmentType, priorityField, cell_size)
+                # convert here: NumPy PolygonToRaster, CELL_CENTER and no priority field
+                polygon_lib.polygons_to_raster(input_source, esri_flood_elevation_attribute, output_raster, cell_size,
+                                               processes=None)
 
                 return output_raster
 
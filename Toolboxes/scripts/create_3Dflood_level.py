@@ -1,12 +1,14 @@
 import arcpy
 import time
 import os
-import arcpy.cartography as CA
 import re
 
 import sys
 import math
 import common_lib
+import raster_lib
+import mesh_lib
+import polygon_lib
 from common_lib import create_msg_body, msg, trace
 from settings import *
 
@@ -55,20 +57,20 @@ class FunctionError(Exception):
 
 # used functions
 
-def flood_from_raster(input_source, input_type, no_flood_value, baseline_elevation_raster, baseline_elevation_value, outward_buffer, output_polygons, smoothing, debug):
+def flood_from_raster(input_source, input_type, no_flood_value, baseline_elevation_raster, baseline_elevation_value, outward_buffer, output_polygons, smoothing, debug,
+                      max_deviation=mesh_lib.MAX_DEVIATION, mesh_file=None, home_directory=None, scratch_ws=None,
+                      baseline_source=None):
     try:
         # Get Attributes from User
         if debug == 0:
-            # script variables
-            aprx = arcpy.mp.ArcGISProject("CURRENT")
-            home_directory = aprx.homeFolder
-            tiff_directory = home_directory + "\\Tiffs"
-            tin_directory = home_directory + "\\Tins"
-            scripts_directory = aprx.homeFolder + "\\Scripts"
-            rule_directory = aprx.homeFolder + "\\rule_packages"
-            log_directory = aprx.homeFolder + "\\Logs"
+            # script variables, batch runs pass the home directory as there is no current project
+            if home_directory is None:
+                aprx = arcpy.mp.ArcGISProject("CURRENT")
+                home_directory = aprx.homeFolder
+            scripts_directory = home_directory + "\\Scripts"
+            rule_directory = home_directory + "\\rule_packages"
+            log_directory = home_directory + "\\Logs"
             layer_directory = home_directory + "\\layer_files"
-            project_ws = aprx.defaultGeodatabase
 
             enableLogging = True
             DeleteIntermediateData = True
@@ -77,8 +79,6 @@ def flood_from_raster(input_source, input_type, no_flood_value, baseline_elevati
         else:
             # debug
             home_directory = r'D:\Gert\Work\Esri\Solutions\3DFloodImpact\work2.3\3DFloodImpact'
-            tiff_directory = home_directory + "\\Tiffs"
-            tin_directory = home_directory + "\\Tins"
             scripts_directory = home_directory + "\\Scripts"
             rule_directory = home_directory + "\\rule_packages"
             log_directory = home_directory + "\\Logs"
@@ -90,19 +90,15 @@ def flood_from_raster(input_source, input_type, no_flood_value, baseline_elevati
             verbose = 1
             use_in_memory = False
 
-        scratch_ws = common_lib.create_gdb(home_directory, "Intermediate.gdb")
+        # batch runs give every scenario its own scratch workspace
+        if scratch_ws is None:
+            scratch_ws = common_lib.create_gdb(home_directory, "Intermediate.gdb")
         arcpy.env.workspace = scratch_ws
         arcpy.env.overwriteOutput = True
 
         # fail safe for Europese's comma's
         baseline_elevation_value = float(re.sub("[,.]", ".", baseline_elevation_value))
 
-        if not os.path.exists(tiff_directory):
-            os.makedirs(tiff_directory)
-
-        if not os.path.exists(tin_directory):
-            os.makedirs(tin_directory)
-
         common_lib.set_up_logging(log_directory, TOOLNAME)
         start_time = time.clock()
 
@@ -138,22 +134,9 @@ def flood_from_raster(input_source, input_type, no_flood_value, baseline_elevati
                         # prep raster
                         # smooth result using focal stats
                         if smoothing > 0:
-                            if use_in_memory:
-                                focal_raster = "in_memory/focal_raster"
-                            else:
-                                focal_raster = os.path.join(scratch_ws, "focal_raster")
-                                if arcpy.Exists(focal_raster):
-                                    arcpy.Delete_management(focal_raster)
-
                             if not (1 <= smoothing <= 100):
                                 smoothing = 30
 
-                            neighborhood = arcpy.sa.NbrRectangle(smoothing, smoothing, "CELL")
-
-                            flood_elev_raster = arcpy.sa.FocalStatistics(input_source, neighborhood, "MEAN", "true")
-                            flood_elev_raster.save(focal_raster)
-
-                            # con
                             if use_in_memory:
                                 smooth_input = "in_memory/smooth_input"
                             else:
@@ -161,8 +144,11 @@ def flood_from_raster(input_source, input_type, no_flood_value, baseline_elevati
                                 if arcpy.Exists(smooth_input):
                                     arcpy.Delete_management(smooth_input)
 
-                            output = arcpy.sa.Con(is_null0, input_source, flood_elev_raster)
-                            output.save(smooth_input)
+                            # focal mean ignoring NoData, kept NoData where the input has no flooding
+                            flood_source = raster_lib.RasterSource(input_source)
+                            flood_elev_raster = raster_lib.FocalMean(flood_source, smoothing, ignore_nodata=True,
+                                                                     mask=flood_source)
+                            raster_lib.materialize(flood_elev_raster, smooth_input, spatial_ref)
 
                             input_raster = smooth_input
                         else:
@@ -212,55 +198,32 @@ def flood_from_raster(input_source, input_type, no_flood_value, baseline_elevati
                         if xy_unit:
                             cell_size = arcpy.GetRasterProperties_management(input_raster, "CELLSIZEX")
 
-                            if baseline_elevation_raster:
-                                # check celll size
-                                cell_size_base = arcpy.GetRasterProperties_management(baseline_elevation_raster, "CELLSIZEX")
-
-                                if cell_size_base.getOutput(0) == cell_size.getOutput(0):
-                                    # Execute Plus
-                                    if use_in_memory:
-                                        flood_plus_base_raster = "in_memory/flooding_plus_base"
-                                    else:
-                                        flood_plus_base_raster = os.path.join(scratch_ws, "flooding_plus_base")
-                                        if arcpy.Exists(flood_plus_base_raster):
-                                            arcpy.Delete_management(flood_plus_base_raster)
-
-                                    listRasters = []
-                                    listRasters.append(input_raster)
-                                    listRasters.append(baseline_elevation_raster)
+                            if baseline_elevation_raster or baseline_source is not None:
+                                # check cell size, batch runs share one baseline source read up front
+                                flood_source = raster_lib.RasterSource(input_raster)
+                                if baseline_source is None:
+                                    baseline_source = raster_lib.RasterSource(baseline_elevation_raster)
 
-                                    desc = arcpy.Describe(listRasters[0])
-                                    arcpy.MosaicToNewRaster_management(listRasters, scratch_ws, "flooding_plus_base", desc.spatialReference,
-                                                                        "32_BIT_FLOAT", cell_size, 1, "SUM", "")
+                                if baseline_source.grid.cell_size != flood_source.grid.cell_size:
+                                    arcpy.AddMessage("Cell size of the baseline elevation raster is different than " + input_raster + ". Resampling Base Elevation Raster to the flood raster grid.")
 
-                                    # check where there is IsNull and set the con values
-                                    if use_in_memory:
-                                        is_Null = "in_memory/is_Null"
-                                    else:
-                                        is_Null = os.path.join(scratch_ws, "is_Null")
-                                        if arcpy.Exists(is_Null):
-                                            arcpy.Delete_management(is_Null)
-
-                                    is_Null_raster = arcpy.sa.IsNull(input_raster)
-                                    is_Null_raster.save(is_Null)
+                                if use_in_memory:
+                                    flood_plus_base_raster_null = "in_memory/flooding_plus_base_null"
+                                else:
+                                    flood_plus_base_raster_null = os.path.join(scratch_ws, "flooding_plus_base_null")
+                                    if arcpy.Exists(flood_plus_base_raster_null):
+                                        arcpy.Delete_management(flood_plus_base_raster_null)
 
-                                    # Con
-                                    if use_in_memory:
-                                        flood_plus_base_raster_null = "in_memory/flooding_plus_base_null"
-                                    else:
-                                        flood_plus_base_raster_null = os.path.join(scratch_ws, "flooding_plus_base_null")
-                                        if arcpy.Exists(flood_plus_base_raster_null):
-                                            arcpy.Delete_management(flood_plus_base_raster_null)
+                                msg_body = create_msg_body("Adding baseline elevation raster to input flood layer...", 0, 0)
+                                msg(msg_body)
 
-                                    msg_body = create_msg_body("Adding baseline elevation raster to input flood layer...", 0, 0)
-                                    msg(msg_body)
+                                # sum flood and baseline on the flood raster grid, NoData where there is no flooding
+                                flood_plus_base = raster_lib.VirtualMosaic([flood_source, baseline_source],
+                                                                           "SUM", grid=flood_source.grid, mask=flood_source)
 
-                                    fpbrn = arcpy.sa.Con(is_Null, input_raster, flood_plus_base_raster)
-                                    fpbrn.save(flood_plus_base_raster_null)
+                                raster_lib.materialize(flood_plus_base, flood_plus_base_raster_null, spatial_ref)
 
-                                    input_raster = flood_plus_base_raster_null
-                                else:
-                                    arcpy.AddWarning("Cell size of " + input_raster + " is different than " + baseline_elevation_raster + ". Ignoring Base Elevation Raster.")
+                                input_raster = flood_plus_base_raster_null
                             else:
                                 if baseline_elevation_value > 0:
                                     if use_in_memory:
@@ -286,14 +249,6 @@ def flood_from_raster(input_source, input_type, no_flood_value, baseline_elevati
                             out_geom = "POLYGON"  # output geometry type
                             arcpy.RasterDomain_3d(input_raster, raster_polygons, out_geom)
 
-                            # 2. buffer it inwards so that we have a polygon only of the perimeter plus a few ???????cells inward???????.
-                            if use_in_memory:
-                                polygons_inward = "in_memory/inward_buffer"
-                            else:
-                                polygons_inward = os.path.join(scratch_ws, "inward_buffer")
-                                if arcpy.Exists(polygons_inward):
-                                    arcpy.Delete_management(polygons_inward)
-
                             x = float(re.sub("[,.]", ".", str(cell_size.getOutput(0))))
 #                            x = float(str(cell_size.getOutput(0)))
 
@@ -301,82 +256,7 @@ def flood_from_raster(input_source, input_type, no_flood_value, baseline_elevati
                                 arcpy.AddError("Raster cell size is 0. Can't continue. Please check the raster properties.")
                                 raise ValueError
                             else:
-                                buffer_in = 3 * int(x)
-
-                                if xy_unit == "Feet":
-                                    buffer_text = "-" + str(buffer_in) + " Feet"
-                                else:
-                                    buffer_text = "-" + str(buffer_in) + " Meters"
-
-                                sideType = "OUTSIDE_ONLY"
-                                arcpy.Buffer_analysis(raster_polygons, polygons_inward, buffer_text, sideType)
-
-                                msg_body = create_msg_body("Buffering flood edges...", 0, 0)
-                                msg(msg_body)
-
-                                # 3. mask in ExtractByMask: gives just boundary raster with a few cells inwards
-                                if use_in_memory:
-                                    extract_mask_raster = "in_memory/extract_mask"
-                                else:
-                                    extract_mask_raster = os.path.join(scratch_ws, "extract_mask")
-                                    if arcpy.Exists(extract_mask_raster):
-                                        arcpy.Delete_management(extract_mask_raster)
-
-                                extract_temp_raster = arcpy.sa.ExtractByMask(input_raster, polygons_inward)
-                                extract_temp_raster.save(extract_mask_raster)
-
-                                # 4. convert the output to points
-                                if use_in_memory:
-                                    extract_mask_points = "in_memory/extract_points"
-                                else:
-                                    extract_mask_points = os.path.join(scratch_ws, "extract_points")
-                                    if arcpy.Exists(extract_mask_points):
-                                        arcpy.Delete_management(extract_mask_points)
-
-                                arcpy.RasterToPoint_conversion(extract_mask_raster, extract_mask_points, "VALUE")
-
-                                msg_body = create_msg_body("Create flood points...", 0, 0)
-                                msg(msg_body)
-
-                                # 5. Interpolate: this will also interpolate outside the flood boundary which is
-                                # what we need so we get a nice 3D poly that extends into the surrounding DEM
-                                if use_in_memory:
-                                    interpolated_raster = "in_memory/interpolate_raster"
-                                else:
-                                    interpolated_raster = os.path.join(scratch_ws, "interpolate_raster")
-                                    if arcpy.Exists(interpolated_raster):
-                                        arcpy.Delete_management(interpolated_raster)
-
-                                zField = "grid_code"
-                                power = 2
-                                searchRadius = arcpy.sa.RadiusVariable(12, 150000)
-
-                                msg_body = create_msg_body("Interpolating flood points...", 0, 0)
-                                msg(msg_body)
-
-                                # Execute IDW
-                                out_IDW = arcpy.sa.Idw(extract_mask_points, zField, cell_size, power)
-
-                                # Save the output
-                                out_IDW.save(interpolated_raster)
-
-                                extent_poly = common_lib.get_extent_feature(scratch_ws, polygons_inward)
-
-                                msg_body = create_msg_body("Clipping terrain...", 0, 0)
-                                msg(msg_body)
-
-                                # clip the input surface
-                                if use_in_memory:
-                                    extent_clip_idwraster = "in_memory/extent_clip_idw"
-                                else:
-                                    extent_clip_idwraster = os.path.join(scratch_ws, "extent_clip_idw")
-                                    if arcpy.Exists(extent_clip_idwraster):
-                                        arcpy.Delete_management(extent_clip_idwraster)
-
-                                # clip terrain to extent
-                                arcpy.Clip_management(interpolated_raster, "#", extent_clip_idwraster, extent_poly)
-
-                                # 6. clip the interpolated raster by (outward buffered) outline polygon
+                                # 2. outward buffered outline polygon, used for clipping the flood surface
                                 if use_in_memory:
                                     polygons_outward = "in_memory/outward_buffer"
                                 else:
@@ -397,77 +277,31 @@ def flood_from_raster(input_source, input_type, no_flood_value, baseline_elevati
 
                                     raster_polygons = polygons_outward
 
-                                # clip the input surface
-                                if use_in_memory:
-                                    flood_clip_raster = "in_memory/flood_clip_raster"
-                                else:
-                                    flood_clip_raster = os.path.join(scratch_ws, "flood_clip_raster")
-                                    if arcpy.Exists(flood_clip_raster):
-                                        arcpy.Delete_management(flood_clip_raster)
-
-                                msg_body = create_msg_body("Clipping flood raster...", 0, 0)
-                                msg(msg_body)
-
-                                # clip terrain to extent
-    #                            arcpy.Clip_management(interpolated_raster, "#", flood_clip_raster, raster_polygons)    Check again
-                                arcpy.Clip_management(interpolated_raster, "#", flood_clip_raster, raster_polygons)
-
-                                # 7. Isnull, and Con to grab values from flood_clip_raster for
-                               # create NUll mask
-                                if use_in_memory:
-                                    is_Null = "in_memory/is_Null"
-                                else:
-                                    is_Null = os.path.join(scratch_ws, "is_Null")
-                                    if arcpy.Exists(is_Null):
-                                        arcpy.Delete_management(is_Null)
-
-                                is_Null_raster = arcpy.sa.IsNull(input_raster)
-                                is_Null_raster.save(is_Null)
-
-                               # Con
+                                # 3. Interpolate: IDW from the flood cells within 3 cells of the flood edge into the
+                                # non flooded cells just outside it, so we get a nice 3D poly that extends into
+                                # the surrounding DEM. Only cells up to the outward buffer (plus a margin) are filled.
                                 if use_in_memory:
                                     con_raster = "in_memory/con_raster"
                                 else:
                                     con_raster = os.path.join(scratch_ws, "con_raster")
                                     if arcpy.Exists(con_raster):
                                         arcpy.Delete_management(con_raster)
-                                temp_con_raster = arcpy.sa.Con(is_Null, interpolated_raster, input_raster)
-                                temp_con_raster.save(con_raster)
-
-                                msg_body = create_msg_body("Merging rasters...", 0, 0)
-                                msg(msg_body)
-
-                                # 8. focal stats on raster to smooth?
 
-                                # 9. copy raster to geotiff
-                                if use_in_memory:
-                                    con_raster_tif = "in_memory/con_raster_tif"
-                                else:
-                                    con_raster_tif = os.path.join(tiff_directory, "con_raster.tif")
-                                    if arcpy.Exists(con_raster_tif):
-                                        arcpy.Delete_management(con_raster_tif)
-
-                                arcpy.CopyRaster_management(con_raster, con_raster_tif, "#", "#", "#", "#", "#",
-                                                           "32_BIT_FLOAT")
-
-                                msg_body = create_msg_body("Copying to tiff...", 0, 0)
+                                msg_body = create_msg_body("Interpolating flood edges...", 0, 0)
                                 msg(msg_body)
 
-                                # 10. raster to TIN
-                                zTol = 0.1
-                                maxPts = 1500000
-                                zFactor = 1
-                                con_tin = os.path.join(tin_directory, "con_tin")
-                                if arcpy.Exists(con_tin):
-                                    arcpy.Delete_management(con_tin)
+                                ring_width = max(int(round(3 * int(x) / x)), 1)
+                                fill_width = int(math.ceil(outward_buffer / x)) + 2
 
-                                # Execute RasterTin
-                                arcpy.RasterTin_3d(con_raster_tif, con_tin, zTol, maxPts, zFactor)
+                                extrapolated = raster_lib.IdwFill(raster_lib.RasterSource(input_raster),
+                                                                  ring_width, fill_width, k=12, power=2)
+                                raster_lib.materialize(extrapolated, con_raster, spatial_ref)
 
-                                msg_body = create_msg_body("Creating TIN...", 0, 0)
+                                msg_body = create_msg_body("Merging rasters...", 0, 0)
                                 msg(msg_body)
 
-                                # 11. TIN triangles
+                                # 9. triangulate the water surface straight from the raster, within the vertical
+                                # tolerance RasterTin used, and write the triangles as 3D polygons
                                 if use_in_memory:
                                     con_triangles = "in_memory/con_triangles"
                                 else:
@@ -475,13 +309,20 @@ def flood_from_raster(input_source, input_type, no_flood_value, baseline_elevati
                                     if arcpy.Exists(con_triangles):
                                         arcpy.Delete_management(con_triangles)
 
-                                arcpy.TinTriangle_3d(con_tin, con_triangles)
-
-                                msg_body = create_msg_body("Creating polygons...", 0, 0)
+                                msg_body = create_msg_body("Creating triangles...", 0, 0)
                                 msg(msg_body)
 
-                                # 12. make 2D polygons feature to feature class
-                                arcpy.FeatureClassToFeatureClass_conversion(con_triangles, scratch_ws, "con_triangles_2D")
+                                vertices, faces = mesh_lib.triangulate(raster_lib.RasterSource(con_raster), mesh_lib.Z_TOLERANCE)
+
+                                # merge near planar water into large faces, the boundary may move up to a cell:
+                                # the surface reaches past the smooth polygons it is clipped with below
+                                if max_deviation:
+                                    msg_body = create_msg_body("Decimating " + str(len(faces)) + " triangles...", 0, 0)
+                                    msg(msg_body)
+                                    vertices, faces = mesh_lib.decimate(vertices, faces, max_deviation,
+                                                                        boundary_deviation=x)
+
+                                mesh_lib.write_triangle_features(vertices, faces, con_triangles, spatial_ref)
 
                                 # 12. clip with smooth polygon
                                 smooth_polygons = os.path.join(scratch_ws, "smooth_raster_polygons")
@@ -491,8 +332,26 @@ def flood_from_raster(input_source, input_type, no_flood_value, baseline_elevati
                                 msg_body = create_msg_body("Smoothing edges...", 0, 0)
                                 msg(msg_body)
 
-                                CA.SmoothPolygon(os.path.join(raster_polygons), smooth_polygons, "PAEK", x, "",
-                                                "FLAG_ERRORS")
+                                # corner cutting keeps the rings apart, so one clip is enough
+                                polygon_lib.smooth_polygons(raster_polygons, smooth_polygons,
+                                                            spatial_reference=spatial_ref)
+
+                                # optionally stream the surface to a local .obj, .ply or .gltf mesh, clipped to
+                                # the smooth polygons at cell resolution: only cells with their center inside
+                                # are meshed, where the multipatch below is clipped exactly
+                                if mesh_file:
+                                    msg_body = create_msg_body("Exporting mesh to " + mesh_file + "...", 0, 0)
+                                    msg(msg_body)
+
+                                    if baseline_source is not None:
+                                        baseline = baseline_source
+                                    else:
+                                        baseline = baseline_elevation_value
+
+                                    con_source = raster_lib.RasterSource(con_raster)
+                                    mesh_lib.export_mesh(con_source, mesh_file, baseline, max_deviation=max_deviation,
+                                                         mask=polygon_lib.polygon_mask(smooth_polygons,
+                                                                                       con_source.grid))
 
                                 if use_in_memory:
                                     clip_smooth_triangles = "in_memory/clip_smooth_triangles"
@@ -507,58 +366,12 @@ def flood_from_raster(input_source, input_type, no_flood_value, baseline_elevati
                                 # clip terrain to extent
                                 arcpy.Clip_analysis(con_triangles, smooth_polygons, clip_smooth_triangles)
 
-                                # clip to slightly lesser extent because of InterpolateShape fail.
-                                area_extent = common_lib.get_extent_feature(scratch_ws, clip_smooth_triangles)
-
-                                if use_in_memory:
-                                    extent_inward = "in_memory/inward_extent_buffer"
-                                else:
-                                    extent_inward = os.path.join(scratch_ws, "inward_extent_buffer")
-                                    if arcpy.Exists(extent_inward):
-                                        arcpy.Delete_management(extent_inward)
-
-                                buffer_in = 3
-
-                                if xy_unit == "Feet":
-                                    buffer_text = "-" + str(buffer_in) + " Feet"
-                                else:
-                                    buffer_text = "-" + str(buffer_in) + " Meters"
-
-                                sideType = "FULL"
-                                arcpy.Buffer_analysis(area_extent, extent_inward, buffer_text, sideType)
-
-                                if use_in_memory:
-                                    clip2_smooth_triangles = "in_memory/clip2_smooth_triangles"
-                                else:
-                                    clip2_smooth_triangles = os.path.join(scratch_ws, "clip2_smooth_triangles")
-                                    if arcpy.Exists(clip2_smooth_triangles):
-                                        arcpy.Delete_management(clip2_smooth_triangles)
-
-                                msg_body = create_msg_body("Clipping smooth edges a second time...", 0, 0)
-                                msg(msg_body)
-
-                                # clip terrain to extent
-                                arcpy.Clip_analysis(clip_smooth_triangles, extent_inward, clip2_smooth_triangles)
-
-                                # 13. interpolate on TIN
-                                if use_in_memory:
-                                    clip_smooth_triangles3D = "in_memory/clip_smooth_traingles3D"
-                                else:
-                                    clip_smooth_triangles3D = os.path.join(scratch_ws, "clip_smooth_triangles3D")
-                                    if arcpy.Exists(clip_smooth_triangles3D):
-                                        arcpy.Delete_management(clip_smooth_triangles3D)
-
-                                msg_body = create_msg_body("Interpolating polygons on TIN", 0, 0)
-                                msg(msg_body)
-                                arcpy.InterpolateShape_3d(con_tin, clip2_smooth_triangles, clip_smooth_triangles3D, "#", 1,
-                                                         "LINEAR", "VERTICES_ONLY")
-
                                 # 13. to multipatch
-                                z_unit = common_lib.get_z_unit(clip_smooth_triangles3D, verbose)
+                                z_unit = common_lib.get_z_unit(clip_smooth_triangles, verbose)
 
                                 # temp layer
                                 flood_level_layer = "flood_level_layer"
-                                arcpy.MakeFeatureLayer_management(clip_smooth_triangles3D, flood_level_layer)
+                                arcpy.MakeFeatureLayer_management(clip_smooth_triangles, flood_level_layer)
 
                                 # flood_level_mp = os.path.join(project_ws, common_lib.get_name_from_feature_class(input_raster) + "_3D")
                                 flood_level_mp = output_polygons + "_3D"
@@ -566,7 +379,8 @@ def flood_from_raster(input_source, input_type, no_flood_value, baseline_elevati
                                 if arcpy.Exists(flood_level_mp):
                                     arcpy.Delete_management(flood_level_mp)
 
-                                arcpy.Layer3DToFeatureClass_3d(flood_level_layer, flood_level_mp)
+                                # one multipatch per connected water surface instead of one per triangle
+                                arcpy.Layer3DToFeatureClass_3d(flood_level_layer, flood_level_mp, "Component")
 
                                 # layer to be added to TOC
                                 flood_level_layer_mp = common_lib.get_name_from_feature_class(flood_level_mp)
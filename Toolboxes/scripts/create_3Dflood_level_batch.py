@@ -0,0 +1,262 @@
+# -------------------------------------------------------------------------------
+# Name:        create_3Dflood_level_batch.py
+# Purpose:     runs create_3Dflood_level.flood_from_raster for many flood rasters
+#              against one baseline elevation raster, in parallel
+#
+# Author:      Gert van Maren
+#
+# Created:     19/10/2026
+# Copyright:   (c) Esri 2026
+# updated:
+# updated:
+# updated:
+
+# Required:    3D Analyst and Spatial Analyst. Run from the ArcGIS Pro python
+#              environment, e.g.
+#              python create_3Dflood_level_batch.py <flood folder> <output gdb>
+#                     <baseline raster> <baseline value> <no flood value> <smoothing>
+#                     <home directory> <processes> <outward buffer>
+
+# -------------------------------------------------------------------------------
+
+import arcpy
+import os
+import time
+
+import common_lib
+import raster_lib
+import create_3Dflood_level
+from common_lib import create_msg_body, msg, trace
+
+# constants
+ERROR = "error"
+WARNING = "warning"
+TOOLNAME = "Create3DFloodLevelBatch"
+
+
+# error classes
+
+class NoRasterLayer(Exception):
+    pass
+
+
+class NoOutput(Exception):
+    pass
+
+
+# ----------------------------Scenarios---------------------------- #
+
+def list_flood_rasters(flood_rasters):
+    # a folder or workspace with rasters, one raster or a list of rasters
+    if isinstance(flood_rasters, str):
+        if arcpy.Describe(flood_rasters).dataType in ("Folder", "Workspace"):
+            arcpy.env.workspace = flood_rasters
+            return [os.path.join(flood_rasters, raster) for raster in arcpy.ListRasters()]
+        return [flood_rasters]
+
+    return list(flood_rasters)
+
+
+def scenario_names(rasters, output_workspace):
+    # valid, unique output names from the raster names
+    names = []
+    for raster in rasters:
+        name = arcpy.ValidateTableName(os.path.splitext(os.path.basename(raster))[0], output_workspace)
+        unique = name
+        i = 1
+        while unique in names:
+            unique = name + "_" + str(i)
+            i += 1
+        names.append(unique)
+
+    return names
+
+
+def _run_scenario(scenario):
+    # worker: one flood raster, intermediate data in its own scratch geodatabase, which flood_from_raster
+    # empties when done, outputs in its own output geodatabase until the parent copies them
+    start_time = time.time()
+    output = None
+    error = None
+
+    try:
+        scratch_ws = common_lib.create_gdb(scenario["scratch_folder"], scenario["name"] + ".gdb")
+        output_ws = common_lib.create_gdb(scenario["scratch_folder"], scenario["name"] + "_output.gdb")
+
+        baseline_source = None
+        if scenario["baseline"]:
+            baseline_source = raster_lib.open_memmap(*scenario["baseline"])
+
+        result = create_3Dflood_level.flood_from_raster(input_source=scenario["raster"],
+                                                        input_type="RasterDataset",
+                                                        no_flood_value=scenario["no_flood_value"],
+                                                        baseline_elevation_raster=None,
+                                                        baseline_elevation_value=scenario["baseline_elevation_value"],
+                                                        outward_buffer=scenario["outward_buffer"],
+                                                        output_polygons=os.path.join(output_ws, scenario["name"]),
+                                                        smoothing=scenario["smoothing"],
+                                                        debug=0,
+                                                        mesh_file=scenario["mesh_file"],
+                                                        home_directory=scenario["home_directory"],
+                                                        scratch_ws=scratch_ws,
+                                                        baseline_source=baseline_source)
+        if result:
+            output = os.path.join(output_ws, scenario["name"] + "_3D")
+        else:
+            error = "no output created, see the log in " + scenario["home_directory"] + "\\Logs"
+
+    except Exception:
+        line, filename, synerror = trace()
+        error = "line %s: %s" % (line, synerror)
+
+    return {"name": scenario["name"], "raster": scenario["raster"], "output": output, "error": error,
+            "seconds": time.time() - start_time}
+
+
+# ----------------------------Batch---------------------------- #
+
+def flood_from_raster_batch(flood_rasters, output_workspace, baseline_elevation_raster=None,
+                            baseline_elevation_value="0", no_flood_value="NoData", smoothing=0,
+                            home_directory=None, processes=None, mesh_folder=None, mesh_format=".gltf",
+                            outward_buffer=0):
+    """
+    Creates <name>_3D flood level multipatches in output_workspace for every flood
+    raster. The baseline raster is read once into a memory mapped file shared by
+    all workers. Each scenario runs in its own process, scratch and output
+    geodatabase. outward_buffer is as in create_3Dflood_level.flood_from_raster.
+    Returns a list with name, raster, output, error and seconds per scenario.
+    """
+    start_time = time.time()
+
+    if home_directory is None:
+        home_directory = os.path.dirname(output_workspace)
+
+    rasters = list_flood_rasters(flood_rasters)
+    if not rasters:
+        raise NoRasterLayer
+
+    scratch_folder = os.path.join(home_directory, "BatchScratch")
+    if not os.path.exists(scratch_folder):
+        os.makedirs(scratch_folder)
+
+    if mesh_folder and not os.path.exists(mesh_folder):
+        os.makedirs(mesh_folder)
+
+    # read the baseline once
+    baseline = None
+    if baseline_elevation_raster:
+        msg_body = create_msg_body("Reading baseline elevation raster " + baseline_elevation_raster + "...", 0, 0)
+        msg(msg_body)
+
+        baseline_file = os.path.join(scratch_folder, "baseline.npy")
+        source = raster_lib.to_memmap(raster_lib.RasterSource(baseline_elevation_raster), baseline_file)
+        baseline = (baseline_file, source.grid)
+        del source
+
+    scenarios = []
+    for raster, name in zip(rasters, scenario_names(rasters, output_workspace)):
+        scenarios.append({"raster": raster, "name": name, "scratch_folder": scratch_folder,
+                          "home_directory": home_directory, "baseline": baseline,
+                          "baseline_elevation_value": str(baseline_elevation_value),
+                          "no_flood_value": no_flood_value, "smoothing": smoothing,
+                          "outward_buffer": outward_buffer,
+                          "mesh_file": os.path.join(mesh_folder, name + mesh_format) if mesh_folder else None})
+
+    processes = raster_lib.pool_size(processes, len(scenarios))
+
+    msg_body = create_msg_body("Processing " + str(len(scenarios)) + " flood rasters with " + str(processes) +
+                               " processes...", 0, 0)
+    msg(msg_body)
+
+    pool = None
+    if processes > 1:
+        pool = raster_lib.process_pool(processes)
+        results = pool.imap_unordered(_run_scenario, scenarios)
+    else:
+        results = map(_run_scenario, scenarios)
+
+    # copy outputs one at a time, the workers never write to the same geodatabase
+    report = []
+    try:
+        for result in results:
+            if result["output"] and arcpy.Exists(result["output"]):
+                output = os.path.join(output_workspace, result["name"] + "_3D")
+                if arcpy.Exists(output):
+                    arcpy.Delete_management(output)
+                arcpy.CopyFeatures_management(result["output"], output)
+                result["output"] = output
+
+                msg_body = create_msg_body(result["name"] + " completed in " + str(round(result["seconds"], 1)) +
+                                           " seconds.", 0, 0)
+                msg(msg_body)
+            else:
+                result["output"] = None
+                msg_body = create_msg_body(result["name"] + " failed after " + str(round(result["seconds"], 1)) +
+                                           " seconds: " + str(result["error"]), 0, 0)
+                msg(msg_body, WARNING)
+
+            report.append(result)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    done = len([result for result in report if result["output"]])
+    msg_body = create_msg_body("Batch completed: " + str(done) + " of " + str(len(report)) + " flood rasters in " +
+                               str(round(time.time() - start_time, 1)) + " seconds.", 0, 0)
+    msg(msg_body)
+
+    return report
+
+
+# ----------------------------Main Function---------------------------- #
+
+def main():
+    try:
+        flood_rasters = arcpy.GetParameterAsText(0)
+        output_workspace = arcpy.GetParameterAsText(1)
+        baseline_elevation_raster = arcpy.GetParameterAsText(2)
+        baseline_elevation_value = arcpy.GetParameterAsText(3) or "0"
+        no_flood_value = arcpy.GetParameterAsText(4) or "NoData"
+        smoothing = int(arcpy.GetParameterAsText(5) or 0)
+        home_directory = arcpy.GetParameterAsText(6) or None
+        processes = int(arcpy.GetParameterAsText(7)) if arcpy.GetParameterAsText(7) else None
+        outward_buffer = 0
+        if arcpy.GetArgumentCount() > 8 and arcpy.GetParameterAsText(8):
+            outward_buffer = float(arcpy.GetParameterAsText(8))
+
+        if ";" in flood_rasters:
+            flood_rasters = flood_rasters.split(";")
+
+        report = flood_from_raster_batch(flood_rasters, output_workspace, baseline_elevation_raster or None,
+                                         baseline_elevation_value, no_flood_value, smoothing, home_directory,
+                                         processes, outward_buffer=outward_buffer)
+
+        if not any(result["output"] for result in report):
+            raise NoOutput
+
+    except NoRasterLayer:
+        print("Can't find flood rasters. Exiting...")
+        arcpy.AddError("Can't find flood rasters. Exiting...")
+
+    except NoOutput:
+        print("Can't create output. Exiting...")
+        arcpy.AddError("Can't create output. Exiting...")
+
+    except arcpy.ExecuteError:
+        line, filename, synerror = trace()
+        msg("Error on %s" % line, ERROR)
+        msg("Error in file name:  %s" % filename, ERROR)
+        msg("With error message:  %s" % synerror, ERROR)
+        msg("ArcPy Error Message:  %s" % arcpy.GetMessages(2), ERROR)
+
+    except:
+        line, filename, synerror = trace()
+        msg("Error on %s" % line, ERROR)
+        msg("Error in file name:  %s" % filename, ERROR)
+        msg("with error message:  %s" % synerror, ERROR)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -139,6 +139,8 @@ def main():
             baseline_elevation_value = arcpy.GetParameterAsText(3)
             smooth_factor = arcpy.GetParameter(4)
             output_features = arcpy.GetParameterAsText(5)
+            # optional .obj, .ply or .gltf mesh of the flood surface, after the output layers (6, 7)
+            mesh_file = arcpy.GetParameterAsText(8) if arcpy.GetArgumentCount() > 8 else ""
 
             # script variables
             aprx = arcpy.mp.ArcGISProject("CURRENT")
@@ -155,6 +157,7 @@ def main():
             baseline_elevation_value = "0"
             smooth_factor = 0
             output_features = r'D:\Gert\Work\Esri\Solutions\3DFloodImpact\work2.3\3DFloodImpact\3DFloodImpact.gdb\FloodPolys'
+            mesh_file = ""
 
             home_directory = r'D:\Gert\Work\Esri\Solutions\3DFloodImpact\work2.3\3DFloodImpact'
             layer_directory = home_directory + "\\layer_files"
@@ -193,7 +196,8 @@ def main():
                                         outward_buffer=0,
                                         output_polygons=output_features,
                                         smoothing=smooth_factor,
-                                        debug=debugging)
+                                        debug=debugging,
+                                        mesh_file=mesh_file or None)
 
             # create layer, set layer file
             # apply transparency here // checking if symbology layer is present
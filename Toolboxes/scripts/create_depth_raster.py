@@ -5,6 +5,7 @@ import re
 
 import sys
 import common_lib
+import raster_lib
 from common_lib import create_msg_body, msg, trace
 from settings import *
 
@@ -64,7 +65,8 @@ WARNING = "warning"
 
 # used functions
 
-def create_raster(input_source, depth_raster, depth_value, boundary_size, boundary_offset, output_raster, debug):
+def create_raster(input_source, depth_raster, depth_value, boundary_size, boundary_offset, output_raster, debug,
+                  wet_mask=None):
     try:
         # Get Attributes from User
         if debug == 0:
@@ -413,57 +415,37 @@ def create_raster(input_source, depth_raster, depth_value, boundary_size, bounda
                             else:
                                 minus_raster2 = minus_raster
 
-                            if 0: #use_in_memory:
-                                mosaic_raster = "in_memory/mosaic"
-                            else:
-                                mosaic_raster = os.path.join(scratch_ws, "mosaic")
-                                if arcpy.Exists(mosaic_raster):
-                                    arcpy.Delete_management(mosaic_raster)
-
-                            listRasters = []
-                            listRasters.append(extract_mask_raster)
-                            listRasters.append(minus_raster2)
-
-                            desc = arcpy.Describe(listRasters[0])
-
-                            # grab the original outside cells and the pushed down depth elevation raster
-                            arcpy.MosaicToNewRaster_management(listRasters, os.path.dirname(mosaic_raster), os.path.basename(mosaic_raster),
-                                                               desc.spatialReference,
-                                                               "32_BIT_FLOAT", x, 1, "FIRST", "")
-
-                            # now we do an isnull on raster domain poly
-                            assignmentType = "CELL_CENTER"
-                            priorityField = "#"
-
-                            # Execute PolygonToRaster
-                            calc_field = "value_field"
-                            common_lib.delete_add_field(raster_polygons, calc_field, "DOUBLE")
-                            arcpy.CalculateField_management(raster_polygons, calc_field, 1, "PYTHON_9.3")
+                            # grab the original outside cells first, then the pushed down depth elevation raster
+                            mosaic = raster_lib.VirtualMosaic([raster_lib.RasterSource(extract_mask_raster),
+                                                               raster_lib.RasterSource(minus_raster2)], "FIRST")
 
-                            if use_in_memory:
-                                poly_raster = "in_memory/poly_raster"
+                            if wet_mask:
+                                # the wet mask written by Set Flood Elevation Value For Raster holds the flooded cells
+                                mosaic.mask = raster_lib.WetMask(wet_mask)
                             else:
-                                poly_raster = os.path.join(scratch_ws, "poly_raster")
-                                if arcpy.Exists(poly_raster):
-                                    arcpy.Delete_management(poly_raster)
+                                # now we do an isnull on raster domain poly
+                                assignmentType = "CELL_CENTER"
+                                priorityField = "#"
 
-                            arcpy.PolygonToRaster_conversion(raster_polygons, calc_field, poly_raster, assignmentType, priorityField, x)
+                                # Execute PolygonToRaster
+                                calc_field = "value_field"
+                                common_lib.delete_add_field(raster_polygons, calc_field, "DOUBLE")
+                                arcpy.CalculateField_management(raster_polygons, calc_field, 1, "PYTHON_9.3")
 
-                            # create isnull
-                            if use_in_memory:
-                                is_null2 = "in_memory/isnull_copy2"
-                            else:
-                                is_null2 = os.path.join(scratch_ws, "isnull_copy2")
+                                if use_in_memory:
+                                    poly_raster = "in_memory/poly_raster"
+                                else:
+                                    poly_raster = os.path.join(scratch_ws, "poly_raster")
+                                    if arcpy.Exists(poly_raster):
+                                        arcpy.Delete_management(poly_raster)
 
-                                if arcpy.Exists(is_null2):
-                                    arcpy.Delete_management(is_null2)
+                                arcpy.PolygonToRaster_conversion(raster_polygons, calc_field, poly_raster, assignmentType, priorityField, x)
 
-                            is_Null_raster2 = arcpy.sa.IsNull(poly_raster)
-                            is_Null_raster2.save(is_null2)
+                                # mosaic only where poly raster has values
+                                mosaic.mask = raster_lib.RasterSource(poly_raster)
 
-                            # con on mosaic
-                            finalRaster = arcpy.sa.Con(is_null2, poly_raster, mosaic_raster)
-                            finalRaster.save(output_raster)
+                            # written straight to the output
+                            raster_lib.materialize(mosaic, output_raster, arcpy.Describe(minus_raster).spatialReference)
                         else:
                             arcpy.AddWarning(
                                 "Cell size of " + common_lib.get_name_from_feature_class(input_source) + " is different than " + org_depth_raster + ". Exiting...")
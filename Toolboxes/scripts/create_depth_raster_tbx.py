@@ -139,6 +139,7 @@ def main():
             boundary_size = arcpy.GetParameterAsText(3)
             boundary_offset = arcpy.GetParameterAsText(4)
             output_raster = arcpy.GetParameterAsText(5)
+            wet_mask = arcpy.GetParameterAsText(7) if arcpy.GetArgumentCount() > 7 else ""
 
             # script variables
             aprx = arcpy.mp.ArcGISProject("CURRENT")
@@ -156,6 +157,7 @@ def main():
             boundary_size = 1
             boundary_offset = 0.2
             output_raster = r'D:\Temporary\Flood\3DFloodImpact\3DFloodImpact.gdb\DepthElevationRaster_debug'
+            wet_mask = ""
 
             home_directory = r'D:\Temporary\Flood\3DFloodImpact'
             layer_directory = home_directory + "\\layer_files"
@@ -182,7 +184,8 @@ def main():
                                     depth_value=depth_value,
                                     boundary_size=boundary_size,
                                     boundary_offset=boundary_offset,
-                                    output_raster=output_raster, debug=debugging)
+                                    output_raster=output_raster, debug=debugging,
+                                    wet_mask=wet_mask)
 
         if depth_elevation_raster:
             if arcpy.Exists(depth_elevation_raster):
@@ -4,6 +4,7 @@ import os
 
 import re
 import common_lib
+import raster_lib
 from common_lib import create_msg_body, msg, trace
 from settings import *
 
@@ -98,46 +99,19 @@ def create_raster(depth_raster, dtm, smoothing, output_raster, use_in_memory, de
                 arcpy.AddMessage("Processing input source: " + common_lib.get_name_from_feature_class(depth_raster))
                 arcpy.AddMessage("Processing input source: " + common_lib.get_name_from_feature_class(dtm))
 
-                # add depth raster and DTM together
-                if use_in_memory:
-                    plus_raster = "in_memory/depth_plus_dtm"
-                else:
-                    plus_raster = os.path.join(scratch_ws, "depth_plus_dtm")
-                    if arcpy.Exists(plus_raster):
-                        arcpy.Delete_management(plus_raster)
-
-                arcpy.Plus_3d(depth_raster, dtm, plus_raster)
-
-                # smooth result using focal stats
-                if use_in_memory:
-                    focal_raster = "in_memory/focal_raster"
-                else:
-                    focal_raster = os.path.join(scratch_ws, "focal_raster")
-                    if arcpy.Exists(focal_raster):
-                        arcpy.Delete_management(focal_raster)
-
                 if not (1 <= smoothing <= 100):
                     smoothing = 30
 
-                neighborhood = arcpy.sa.NbrRectangle(smoothing, smoothing, "CELL")
-
-                flood_elev_raster = arcpy.sa.FocalStatistics(plus_raster, neighborhood, "MEAN", "true")
-                flood_elev_raster.save(focal_raster)
+                # depth plus DTM, rectangle focal mean ignoring NoData and NoData where there is no depth, fused
+                # into one tiled pass: no intermediate rasters, the DTM is resampled to the depth grid if needed
+                depth_source = raster_lib.RasterSource(depth_raster)
+                dtm_source = raster_lib.RasterSource(dtm)
+                if not raster_lib.is_aligned(depth_source.grid, dtm_source.grid):
+                    arcpy.AddMessage("DTM is not aligned with the depth raster. Resampling the DTM to the depth raster grid.")
 
-                # clip with IsNull from depth because we don't want DEM values where there is no depth.
-                if use_in_memory:
-                    is_null = "in_memory/is_null"
-                else:
-                    is_null = os.path.join(scratch_ws, "is_null")
-                    if arcpy.Exists(is_null):
-                        arcpy.Delete_management(is_null)
-
-                is_null_raster = arcpy.sa.IsNull(depth_raster)
-                is_null_raster.save(is_null)
-
-                # con
-                output = arcpy.sa.Con(is_null, depth_raster, flood_elev_raster)
-                output.save(output_raster)
+                flood_elev_raster = raster_lib.FocalPlus(depth_source, dtm_source, smoothing, ignore_nodata=True)
+                raster_lib.materialize(flood_elev_raster, output_raster, arcpy.Describe(depth_raster).spatialReference,
+                                       processes=None)
 
                 end_time = time.clock()
                 msg_body = create_msg_body("Create Flood Elevation Raster From Depth Raster completed successfully.", start_time, end_time)
@@ -21,9 +21,20 @@ import os
 import time
 import importlib
 
+import numpy as np
+
 import common_lib
 if 'common_lib' in sys.modules:
     importlib.reload(common_lib)
+import raster_lib
+if 'raster_lib' in sys.modules:
+    importlib.reload(raster_lib)
+import las_lib
+if 'las_lib' in sys.modules:
+    importlib.reload(las_lib)
+import polygon_lib
+if 'polygon_lib' in sys.modules:
+    importlib.reload(polygon_lib)
 
 from common_lib import create_msg_body, msg
 
@@ -33,31 +44,6 @@ WARNING = "warning"
 def extrapolate_raster(lc_ws, lc_dsm, lc_cell_size, lc_log_dir, lc_debug, lc_memory_switch):
 
     try:
-        if lc_memory_switch:
-            raster_polygons = "memory/raster_polygons"
-        else:
-            raster_polygons = os.path.join(lc_ws, "raster_polygons")
-            if arcpy.Exists(raster_polygons):
-                arcpy.Delete_management(raster_polygons)
-
-        out_geom = "POLYGON"  # output geometry type
-        arcpy.RasterDomain_3d(lc_dsm, raster_polygons, out_geom)
-
-        # 2. buffer it inwards so that we have a polygon only of the perimeter plus a few cells inward?.
-        if lc_memory_switch:
-            polygons_inward = "memory/inward_buffer"
-        else:
-            polygons_inward = os.path.join(lc_ws, "inward_buffer")
-            if arcpy.Exists(polygons_inward):
-                arcpy.Delete_management(polygons_inward)
-
-        if lc_memory_switch:
-            polygons_outward = "memory/outward_buffer"
-        else:
-            polygons_outward = os.path.join(lc_ws, "outward_buffer")
-            if arcpy.Exists(polygons_outward):
-                arcpy.Delete_management(polygons_outward)
-
         x = float(lc_cell_size)
 
         if x < 0.1:
@@ -65,88 +51,19 @@ def extrapolate_raster(lc_ws, lc_dsm, lc_cell_size, lc_log_dir, lc_debug, lc_mem
             raise ValueError
             return None
         else:
-            buffer_in = 6 * x
-
-            xy_unit = common_lib.get_xy_unit(lc_dsm, 0)
-
-            if xy_unit == "Feet":
-                buffer_text = "-" + str(buffer_in) + " Feet"
-            else:
-                buffer_text = "-" + str(buffer_in) + " Meters"
-
-            sideType = "OUTSIDE_ONLY"
-            arcpy.Buffer_analysis(raster_polygons, polygons_inward, buffer_text, sideType)
-
-            # create outside buffer for extent only.
-            if xy_unit == "Feet":
-                buffer_text = str(buffer_in) + " Feet"
-            else:
-                buffer_text = str(buffer_in) + " Meters"
-
-            arcpy.Buffer_analysis(raster_polygons, polygons_outward, buffer_text, sideType)
-
-            msg_body = create_msg_body("Buffering flood edges...", 0, 0)
-            msg(msg_body)
-
-            # 3. mask in ExtractByMask: gives just boundary raster with a few cells inwards
-            if lc_memory_switch:
-                extract_mask_raster = "in_memory/extract_mask"
-            else:
-                extract_mask_raster = os.path.join(lc_ws, "extract_mask")
-                if arcpy.Exists(extract_mask_raster):
-                    arcpy.Delete_management(extract_mask_raster)
-
-            extract_temp_raster = arcpy.sa.ExtractByMask(lc_dsm, polygons_inward)
-            extract_temp_raster.save(extract_mask_raster)
-
-            # 4. convert the output to points
-            if lc_memory_switch:
-                extract_mask_points = "in_memory/extract_points"
-            else:
-                extract_mask_points = os.path.join(lc_ws, "extract_points")
-                if arcpy.Exists(extract_mask_points):
-                    arcpy.Delete_management(extract_mask_points)
-
-            arcpy.RasterToPoint_conversion(extract_mask_raster, extract_mask_points, "VALUE")
-
-            msg_body = create_msg_body("Create flood points...", 0, 0)
+            # IDW from the dsm cells within 6 cells of the bridge edges into a 6 cell rim around them.
+            # The grid grows by the rim so the dsm can be extrapolated past its own extent.
+            msg_body = create_msg_body("Interpolating bridge raster edges...", 0, 0)
             msg(msg_body)
 
-            # 5. Interpolate: this will also interpolate outside the bridge extent
-            if lc_memory_switch:
-                interpolated_raster = "in_memory/interpolate_raster"
-            else:
-                interpolated_raster = os.path.join(lc_ws, "interpolate_raster")
-                if arcpy.Exists(interpolated_raster):
-                    arcpy.Delete_management(interpolated_raster)
-
-            zField = "grid_code"
-            power = 2
-
-            msg_body = create_msg_body("Interpolating bridge raster points...", 0, 0)
-            msg(msg_body)
-
-            arcpy.env.extent = polygons_outward
-
-            # Execute IDW
-            out_IDW = arcpy.sa.Idw(extract_mask_points, zField, lc_cell_size, power)
-
-            # Save the output
-            out_IDW.save(interpolated_raster)
+            rim = 6
+            dsm_source = raster_lib.RasterSource(lc_dsm)
+            extrapolated = raster_lib.IdwFill(dsm_source, rim, rim, k=12, power=2,
+                                              grid=raster_lib.expand_grid(dsm_source.grid, rim))
 
-            arcpy.ResetEnvironments()
-            arcpy.env.workspace = lc_ws
-            arcpy.env.overwriteOutput = True
-
-            # extract the outer rim only
-            extract_mask_raster2 = os.path.join(lc_ws, "extract_mask2")
-            if arcpy.Exists(extract_mask_raster2):
-                arcpy.Delete_management(extract_mask_raster2)
-
-            extract_temp_raster = arcpy.sa.ExtractByMask(interpolated_raster, polygons_outward)
-            extract_temp_raster.save(extract_mask_raster2)
+            dsm_plus_outer = os.path.join(lc_ws, "dms_plus_outer")
 
-            return extract_mask_raster2
+            return raster_lib.materialize(extrapolated, dsm_plus_outer, arcpy.Describe(lc_dsm).spatialReference)
 
     except arcpy.ExecuteError:
         # Get the tool error messages
@@ -158,7 +75,7 @@ def extrapolate_raster(lc_ws, lc_dsm, lc_cell_size, lc_log_dir, lc_debug, lc_mem
 
 
 def extract(lc_lasd, lc_ws, lc_class_code, lc_cell_size, lc_min_bridge_area, lc_extrapolate,
-            lc_output_features, lc_log_dir, lc_debug, lc_memory_switch):
+            lc_output_features, lc_log_dir, lc_debug, lc_memory_switch, lc_aoi=None):
 
     try:
         # create dem
@@ -179,10 +96,11 @@ def extract(lc_lasd, lc_ws, lc_class_code, lc_cell_size, lc_min_bridge_area, lc_
         msg_body = create_msg_body("Looking for class code: " + str(lc_class_code), 0, 0)
         msg(msg_body)
 
-        class_code_list = class_code_string.split(";")
+        class_code_list = class_code_string.split(";") if class_code_string else []
 
-        # old way
-        # class_code_list = common_lib.get_las_class_codes(lc_lasd, lc_log_dir)
+        # no statistics on the las dataset: histogram the las files, cached per file
+        if not class_code_list:
+            class_code_list = [str(code) for code in common_lib.get_las_class_codes(lc_lasd, lc_log_dir) or []]
 
         # Generate raster from lasd
         if str(lc_class_code) in class_code_list:
@@ -194,10 +112,14 @@ def extract(lc_lasd, lc_ws, lc_class_code, lc_cell_size, lc_min_bridge_area, lc_
                                        str(lc_class_code), 0, 0)
             msg(msg_body)
 
-            bridge_ld_layer = arcpy.CreateUniqueName('bridge_ld_lyr')
+            # only the las files with bridge points in the area of interest, from the tile index
+            extent = None
+            if lc_aoi:
+                aoi_extent = arcpy.Describe(lc_aoi).extent
+                extent = (aoi_extent.XMin, aoi_extent.YMin, aoi_extent.XMax, aoi_extent.YMax)
 
-            # Filter for bridge points
-            arcpy.MakeLasDatasetLayer_management(lc_lasd, bridge_ld_layer, class_code=str(lc_class_code))
+            # the las files of the dataset, None if not all of them can be read here (zLAS, LAZ)
+            las_files = las_lib.dataset_files(lc_lasd, lc_log_dir)
 
             # create dsm from las with just bridge codes
             if lc_memory_switch:
@@ -210,68 +132,111 @@ def extract(lc_lasd, lc_ws, lc_class_code, lc_cell_size, lc_min_bridge_area, lc_
             if arcpy.Exists(dsm):
                 arcpy.Delete_management(dsm)
 
-            arcpy.conversion.LasDatasetToRaster(bridge_ld_layer, dsm, 'ELEVATION',
-                                                'BINNING MAXIMUM LINEAR',
-                                                sampling_type='CELLSIZE',
-                                                sampling_value=lc_cell_size)
-
-            arcpy.ResetEnvironments()
-            arcpy.env.workspace = lc_ws
-            arcpy.env.overwriteOutput = True
+            if las_files is not None:
+                las_index = las_lib.LasIndex(os.path.join(lc_log_dir, las_lib.INDEX_FILE))
+                las_files = las_index.query(las_files, extent, [int(lc_class_code)])
+
+                if not las_files:
+                    msg_body = create_msg_body("No las files with class code " + str(lc_class_code) +
+                                               " points in the area of interest.", 0, 0)
+                    msg(msg_body, WARNING)
+                    return None
+
+                msg_body = create_msg_body("Reading " + str(len(las_files)) + " las files...", 0, 0)
+                msg(msg_body)
+
+                # bin the bridge points of all las files in one read: maximum elevation for the dsm and
+                # point counts at twice the cell size for the footprints. The bins are memory mapped files,
+                # each las file is binned on its own and merged into them
+                dsm_grid = las_lib.las_grid(las_files, float(lc_cell_size), extent=extent)
+                stats_grid = las_lib.las_grid(las_files, 2 * float(lc_cell_size), dsm_grid, extent)
+
+                bins_prefix = os.path.join(arcpy.env.scratchFolder, "bridge_bins")
+                dsm_bins, stats_bins = las_lib.bin_las_files(las_files, [dsm_grid, stats_grid],
+                                                             [["MAXIMUM"], ["COUNT"]],
+                                                             class_codes=[int(lc_class_code)], extent=extent,
+                                                             prefixes=[bins_prefix + "_dsm", bins_prefix + "_stats"])
+
+                # fill small voids between the bins like the LINEAR void fill of LasDatasetToRaster, written
+                # block by block
+                void_fill = raster_lib.IdwFill(dsm_bins.source("MAXIMUM"), 2, 2)
+                raster_lib.materialize(void_fill, dsm, desc.spatialReference)
+                dsm_bins.delete()
+
+                # cells with bridge points, one byte per footprint cell
+                occupied = np.zeros((stats_grid.nrows, stats_grid.ncols), dtype=bool)
+                for row, col, block in raster_lib.read_blocks(stats_bins.source("COUNT")):
+                    occupied[row:row + block.shape[0], col:col + block.shape[1]] = block > 0
+                stats_bins.delete()
+            else:
+                msg_body = create_msg_body("Not all files of " + common_lib.get_name_from_feature_class(lc_lasd) +
+                                           " are uncompressed las files, reading them with the LAS dataset tools...",
+                                           0, 0)
+                msg(msg_body)
 
-            # extrapolate dsm for better interpolation
-            if lc_extrapolate:
-                dsm_outer = extrapolate_raster(lc_ws, dsm, lc_cell_size, lc_log_dir, lc_debug, lc_memory_switch)
+                bridge_ld_layer = arcpy.CreateUniqueName('bridge_ld_lyr')
 
-                # merge rasters
-                listRasters = []
-                listRasters.append(dsm)
-                listRasters.append(dsm_outer)
-                outer_dsm_name = "dms_plus_outer"
+                # Filter for bridge points
+                arcpy.MakeLasDatasetLayer_management(lc_lasd, bridge_ld_layer, class_code=str(lc_class_code))
 
-                desc = arcpy.Describe(listRasters[0])
-                arcpy.MosaicToNewRaster_management(listRasters, lc_ws, outer_dsm_name, desc.spatialReference,
-                                                   "32_BIT_FLOAT", lc_cell_size, 1, "MEAN", "")
+                if lc_aoi:
+                    arcpy.env.extent = arcpy.Describe(lc_aoi).extent
 
-                dsm = os.path.join(lc_ws, outer_dsm_name)
+                arcpy.conversion.LasDatasetToRaster(bridge_ld_layer, dsm, 'ELEVATION',
+                                                    'BINNING MAXIMUM LINEAR',
+                                                    sampling_type='CELLSIZE',
+                                                    sampling_value=lc_cell_size)
 
-            # create raster using LASPointStatisticsAsRaster
-            if lc_memory_switch:
-                las_point_stats = "in_memory/las_point_stats"
-            else:
+                # create raster using LASPointStatisticsAsRaster
                 las_point_stats = os.path.join(lc_ws, "las_point_stats")
                 if arcpy.Exists(las_point_stats):
                     arcpy.Delete_management(las_point_stats)
 
-            if arcpy.Exists(las_point_stats):
-                arcpy.Delete_management(las_point_stats)
+                msg_body = create_msg_body("Creating points statistics raster using the following class codes: " +
+                                           str(lc_class_code), 0, 0)
+                msg(msg_body)
 
-            msg_body = create_msg_body("Creating points statistics raster using the following class codes: " +
-                                       str(lc_class_code), 0, 0)
-            msg(msg_body)
+                arcpy.management.LasPointStatsAsRaster(bridge_ld_layer,
+                                                       las_point_stats,
+                                                       "PREDOMINANT_CLASS", "CELLSIZE", 2*lc_cell_size)
 
-            arcpy.management.LasPointStatsAsRaster(bridge_ld_layer,
-                                                   las_point_stats,
-                                                   "PREDOMINANT_CLASS", "CELLSIZE", 2*lc_cell_size)
+                # cells with bridge points, one byte per footprint cell
+                stats_source = raster_lib.RasterSource(las_point_stats)
+                stats_grid = stats_source.grid
+                occupied = np.zeros((stats_grid.nrows, stats_grid.ncols), dtype=bool)
+                for row, col, block in raster_lib.read_blocks(stats_source):
+                    occupied[row:row + block.shape[0], col:col + block.shape[1]] = ~np.isnan(block)
 
-            lc_memory_switch = False
+            arcpy.ResetEnvironments()
+            arcpy.env.workspace = lc_ws
+            arcpy.env.overwriteOutput = True
 
-            # convert to polygon
-            if lc_memory_switch:
-                bridge_polys = "in_memory/bridge_polys"
-            else:
-                bridge_polys = os.path.join(lc_ws, "bridge_polys")
-                if arcpy.Exists(bridge_polys):
-                    arcpy.Delete_management(bridge_polys)
+            # extrapolate dsm for better interpolation
+            if lc_extrapolate:
+                dsm = extrapolate_raster(lc_ws, dsm, lc_cell_size, lc_log_dir, lc_debug, lc_memory_switch)
 
-            msg_body = create_msg_body("Creating polygons from raster", 0, 0)
+            msg_body = create_msg_body("Creating polygons from bridge points using the following class codes: " +
+                                       str(lc_class_code), 0, 0)
             msg(msg_body)
 
-            arcpy.conversion.RasterToPolygon(las_point_stats,
-                                             bridge_polys,
-                                             "SIMPLIFY", "Value", "SINGLE_OUTER_PART", None)
+            # bridge footprints as 4-connected components of the cells with bridge points: holes
+            # smaller than 20 square meters are filled and components smaller than the minimum bridge
+            # area dropped before tracing, so only real bridges become polygons
+            if unit == 'Feet':
+                max_hole_area = 20 / (0.3048 * 0.3048)
+            else:
+                max_hole_area = 20
+
+            components, count = raster_lib.filter_components(occupied,
+                                                             stats_grid.cell_size * stats_grid.cell_size,
+                                                             float(lc_min_bridge_area), max_hole_area)
+            if count == 0:
+                msg_body = create_msg_body("No bridges larger than " + str(lc_min_bridge_area) + " found.", 0, 0)
+                msg(msg_body, WARNING)
+                return None
+
+            lc_memory_switch = False
 
-            # eliminate holes
             if lc_memory_switch:
                 bridge_polys2 = "memory/bridge_polys2"
             else:
@@ -279,12 +244,12 @@ def extract(lc_lasd, lc_ws, lc_class_code, lc_cell_size, lc_min_bridge_area, lc_
                 if arcpy.Exists(bridge_polys2):
                     arcpy.Delete_management(bridge_polys2)
 
-            msg_body = create_msg_body("Eliminating holes from polygons", 0, 0)
+            msg_body = create_msg_body("Tracing " + str(count) + " bridge polygons", 0, 0)
             msg(msg_body)
 
-            arcpy.management.EliminatePolygonPart(bridge_polys,
-                                                  bridge_polys2,
-                                                  "AREA", "20 SquareMeters", 0, "ANY")
+            polygon_lib.write_rings(polygon_lib.trace_rings(components, stats_grid), bridge_polys2,
+                                    desc.spatialReference)
+
             # regularize footprints
             if lc_memory_switch:
                 bridge_polys3 = "memory/bridge_polys3"
@@ -311,6 +276,12 @@ def extract(lc_lasd, lc_ws, lc_class_code, lc_cell_size, lc_min_bridge_area, lc_
             msg_body = create_msg_body("Interpolating polygons...", 0, 0)
             msg(msg_body)
 
+            # vertices every 10 meters
+            if unit == 'Feet':
+                densify_distance = 10 / 0.3048
+            else:
+                densify_distance = 10
+
             if not lc_extrapolate:
                 if lc_memory_switch:
                     bridge_polys4 = "memory/bridge_polys4"
@@ -329,20 +300,10 @@ def extract(lc_lasd, lc_ws, lc_class_code, lc_cell_size, lc_min_bridge_area, lc_
                                       buffer_text, "FULL", "ROUND", "NONE", None, "PLANAR")
 
                 # densify buffer so the bridge surface will follow the dsm
-                arcpy.edit.Densify(bridge_polys4, "DISTANCE", "10 Meters", "0.1 Meters", 10)
-
-                arcpy.ddd.InterpolateShape(dsm,
-                                           bridge_polys4,
-                                           bridge_polys5,
-                                           None, 1, "BILINEAR", "VERTICES_ONLY", 0, "EXCLUDE")
+                polygon_lib.drape_polygons(bridge_polys4, bridge_polys5, dsm, densify_distance)
             else:
                 # densify buffer so the bridge surface will follow the dsm
-                arcpy.edit.Densify(bridge_polys3, "DISTANCE", "10 Meters", "0.1 Meters", 10)
-
-                arcpy.ddd.InterpolateShape(dsm,
-                                           bridge_polys3,
-                                           bridge_polys5,
-                                           None, 1, "BILINEAR", "VERTICES_ONLY", 0, "EXCLUDE")
+                polygon_lib.drape_polygons(bridge_polys3, bridge_polys5, dsm, densify_distance)
 
             valueAttribute = "Shape_Area"
             expression = """{} > {}""".format(arcpy.AddFieldDelimiters(bridge_polys5, valueAttribute),
@@ -371,6 +332,8 @@ def extract(lc_lasd, lc_ws, lc_class_code, lc_cell_size, lc_min_bridge_area, lc_
 
             return None
 
+    except las_lib.LasError as e:
+        arcpy.AddError(str(e))
     except arcpy.ExecuteError:
         # Get the tool error messages
         msgs = arcpy.GetMessages(2)
@@ -121,6 +121,9 @@ def main():
             minimum_bridge_area = arcpy.GetParameterAsText(3)
             extrapolate_surface = arcpy.GetParameter(4)
             output_features = arcpy.GetParameterAsText(5)
+            # optional area of interest after the output layer (6) and first_time (7): only las files with bridge
+            # points in it are read
+            area_of_interest = arcpy.GetParameterAsText(8) if arcpy.GetArgumentCount() > 8 else ""
 
             # script variables
             aprx = arcpy.mp.ArcGISProject("CURRENT")
@@ -133,6 +136,7 @@ def main():
             minimum_bridge_area = str(20)
             extrapolate_surface = False
             output_features = r'D:\Gert\Work\Esri\Solutions\3DFloodImpact\work2.3\3DFloodImpact\Testing.gdb\bridges'
+            area_of_interest = ""
 
             home_directory = r'D:\Gert\Work\Esri\Solutions\3DFloodImpact\work2.3\3DFloodImpact'
             project_ws = home_directory + "\\3DFloodImpact.gdb"
@@ -177,7 +181,8 @@ def main():
                                                        lc_output_features=output_features,
                                                        lc_log_dir=log_directory,
                                                        lc_debug=verbose,
-                                                       lc_memory_switch=in_memory_switch)
+                                                       lc_memory_switch=in_memory_switch,
+                                                       lc_aoi=area_of_interest or None)
 
             if bridges:
                 if arcpy.Exists(bridges):
@@ -0,0 +1,742 @@
+# -------------------------------------------------------------------------------
+# Name:        hand_lib
+# Purpose:     NumPy HAND (height above nearest drainage) engine: tiled
+#              priority-flood depression filling, D8 flow directions, flow
+#              accumulation, stream extraction and nearest drainage elevations.
+#
+# Author:      Gert van Maren
+#
+# Created:     19/10/2026
+# Copyright:   (c) Esri 2026
+# updated:
+# updated:
+# updated:
+
+# Required:    numpy. arcpy only for reading the DEM and writing the rasters.
+#              The DEM is processed in tiles of TILE_SIZE cells, the working arrays
+#              are memory mapped files, so the size of the DEM is limited by disk
+#              space only. Flows across tiles are solved on graphs of tile edge
+#              cells (Barnes 2016, 2017), the results don't depend on the tile size.
+
+# -------------------------------------------------------------------------------
+
+import os
+import heapq
+from array import array
+from collections import deque
+
+import numpy as np
+
+import raster_lib
+
+try:
+    import arcpy
+except ImportError:  # the engines don't need arcpy, e.g. for testing
+    arcpy = None
+
+# Constants
+STREAM_AREA = 1000000.0     # default contributing area of a stream in square map units
+OUTLET = -1                 # downstream index of cells flowing off the DEM, or out of a tile
+OCEAN = 0                   # label of the cells draining off the DEM in the tiled flood
+TILE_SIZE = 1024            # tile rows and columns, a tile floods in a few seconds
+UNREACHED = np.iinfo(np.int32).max
+
+# D8 neighbours as (row, col) steps, in Esri flow direction order: E, SE, S, SW, W, NW, N, NE
+D8_STEPS = [(0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1)]
+D8_CODES = [1, 2, 4, 8, 16, 32, 64, 128]
+D8_DISTANCE = [1.0, 2 ** 0.5, 1.0, 2 ** 0.5, 1.0, 2 ** 0.5, 1.0, 2 ** 0.5]
+
+
+class HandError(Exception):
+    pass
+
+
+# ----------------------------Tiles---------------------------- #
+
+class Tiles(object):
+    """
+    Tiles of tile_size x tile_size cells over a DEM of nrows x ncols cells, row by
+    row, and the working arrays of the tiled passes. Arrays are in memory or with
+    a prefix memory mapped .npy files <prefix>_<name>.npy. Padded arrays have a one
+    cell rim, so a tile with its neighbouring cells is a plain slice.
+    """
+
+    def __init__(self, nrows, ncols, tile_size=TILE_SIZE, prefix=None):
+        self.nrows = nrows
+        self.ncols = ncols
+        self.tile_size = tile_size
+        self.prefix = prefix
+        self.tile_cols = (ncols + tile_size - 1) // tile_size
+        self.windows = list(raster_lib.iter_blocks(raster_lib.RasterGrid(0.0, 0.0, 1.0, ncols, nrows), tile_size))
+        self.files = {}
+
+    def array(self, name, dtype, fill, padded=False):
+        shape = (self.nrows + 2, self.ncols + 2) if padded else (self.nrows, self.ncols)
+        if self.prefix is None:
+            return np.full(shape, fill, dtype=dtype)
+
+        filename = self.prefix + "_" + name + ".npy"
+        values = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=shape)
+        for row in range(0, shape[0], self.tile_size):
+            values[row:row + self.tile_size] = fill
+        self.files[name] = filename
+        return values
+
+    def delete(self, name):
+        # removes the file of an array, all references to the array must be gone
+        filename = self.files.pop(name, None)
+        if filename:
+            os.remove(filename)
+
+    def tile_of(self, cells):
+        # tile index of flat DEM indices
+        rows, cols = np.divmod(cells, self.ncols)
+        return (rows // self.tile_size) * self.tile_cols + cols // self.tile_size
+
+    def neighbours(self, index):
+        # indices of the tiles around a tile
+        tile_rows = len(self.windows) // self.tile_cols
+        tile_row, tile_col = divmod(index, self.tile_cols)
+        return [r * self.tile_cols + c
+                for r in range(max(tile_row - 1, 0), min(tile_row + 2, tile_rows))
+                for c in range(max(tile_col - 1, 0), min(tile_col + 2, self.tile_cols))
+                if (r, c) != (tile_row, tile_col)]
+
+    def edge_cells(self, row, col, nrows, ncols):
+        # local and flat DEM indices of the cells on the edge of a tile
+        edge = np.ones((nrows, ncols), dtype=bool)
+        edge[1:-1, 1:-1] = False
+        local = np.flatnonzero(edge)
+        rows, cols = np.divmod(local, ncols)
+        return local, (row + rows) * self.ncols + col + cols
+
+    def cells(self, row, col, nrows, ncols):
+        # flat DEM indices of the cells of a tile, row by row
+        rows, cols = np.divmod(np.arange(nrows * ncols), ncols)
+        return (row + rows) * self.ncols + col + cols
+
+
+def _by_tile(tiles, cells, *values):
+    # sorts flat DEM indices and values by tile, returns them and the start of each tile
+    order = np.argsort(tiles.tile_of(cells), kind="stable")
+    starts = np.searchsorted(tiles.tile_of(cells[order]), np.arange(len(tiles.windows) + 1))
+    return [cells[order]] + [v[order] for v in values] + [starts]
+
+
+def _lookup(keys, values, queries, missing):
+    # values of sorted keys at queries, missing where a query isn't a key
+    position = np.minimum(np.searchsorted(keys, queries), max(len(keys) - 1, 0))
+    if not len(keys):
+        return np.full(len(queries), missing, dtype=values.dtype)
+    return np.where(keys[position] == queries, values[position], missing)
+
+
+# ----------------------------Depression filling---------------------------- #
+
+def flood(halo):
+    """
+    Priority-flood depression filling (Barnes et al. 2014) of one tile, halo is
+    the tile with a one cell rim of its neighbours, NaN for NoData and outside the
+    DEM. Cells next to NoData drain off the DEM and are labelled OCEAN, the other
+    cells on the tile edge are seeds with labels of their own, 1, 2, ... Cells are
+    flooded inwards in order of elevation with a heap, cells in depressions
+    through a plain queue at the spill elevation, O(n log n), and take the label
+    of the cell they are flooded from. Returns the filled tile, its labels (-1 for
+    NoData) and the spill edges (label a, label b, elevation) where the floods of
+    two labels meet. A tile that is the whole DEM only has OCEAN and is filled.
+    """
+    height, width = halo.shape
+    nodata = np.isnan(halo)
+    inner = np.zeros(halo.shape, dtype=bool)
+    inner[1:-1, 1:-1] = True
+    valid = inner & ~nodata
+
+    near_nodata = np.zeros(halo.shape, dtype=bool)
+    for dr, dc in D8_STEPS:
+        near_nodata[1:-1, 1:-1] |= nodata[1 + dr:height - 1 + dr, 1 + dc:width - 1 + dc]
+    edge = inner.copy()
+    edge[2:-2, 2:-2] = False
+    ocean = valid & near_nodata
+    seeds = valid & (near_nodata | edge)
+
+    labels = np.full(halo.shape, -1, dtype=np.int32)
+    labels[ocean] = OCEAN
+    own = seeds & ~ocean
+    labels[own] = np.arange(1, np.count_nonzero(own) + 1)
+
+    filled = array("d")
+    filled.frombytes(np.where(nodata, 0.0, halo).tobytes())
+    label = array("i")
+    label.frombytes(labels.tobytes())
+    closed = bytearray((~valid | seeds).ravel().astype(np.uint8).tobytes())
+
+    offsets = [dr * width + dc for dr, dc in D8_STEPS]
+    cells = np.flatnonzero(seeds)
+    heap = list(zip(halo.ravel()[cells].tolist(), cells.tolist()))
+    heapq.heapify(heap)
+
+    edges = {}
+    pit = deque()
+    heappush, heappop = heapq.heappush, heapq.heappop
+    while heap or pit:
+        if pit:
+            cell = pit.popleft()
+            z = filled[cell]
+        else:
+            z, cell = heappop(heap)
+        current = label[cell]
+
+        for offset in offsets:
+            neighbour = cell + offset
+            if closed[neighbour]:
+                # floods of two labels meet, the rim and NoData have none
+                other = label[neighbour]
+                if other != current and other >= 0:
+                    key = (current, other) if current < other else (other, current)
+                    spill = filled[neighbour] if filled[neighbour] > z else z
+                    if spill < edges.get(key, np.inf):
+                        edges[key] = spill
+                continue
+            closed[neighbour] = 1
+            label[neighbour] = current
+            if filled[neighbour] <= z:
+                filled[neighbour] = z
+                pit.append(neighbour)
+            else:
+                heappush(heap, (filled[neighbour], neighbour))
+
+    filled = np.frombuffer(filled, dtype=np.float64).reshape(halo.shape)[1:-1, 1:-1].copy()
+    filled[nodata[1:-1, 1:-1]] = np.nan
+    labels = np.frombuffer(label, dtype=np.int32).reshape(halo.shape)[1:-1, 1:-1].copy()
+
+    pairs = np.array(list(edges.keys()), dtype=np.int64).reshape(-1, 2)
+    spills = np.array(list(edges.values()), dtype=np.float64)
+
+    return filled, labels, (pairs[:, 0], pairs[:, 1], spills)
+
+
+def spill_levels(a, b, spills, count):
+    """
+    Elevation at which the water of every label leaves the DEM: a priority-flood
+    over the graph of count labels, from OCEAN along the spill edges between
+    labels a and b. Labels that never drain stay at -inf, like OCEAN.
+    """
+    sources = np.concatenate([a, b])
+    targets = np.concatenate([b, a])
+    spills = np.concatenate([spills, spills])
+
+    # lowest spill per pair of labels, edges of a label together
+    order = np.lexsort((spills, targets, sources))
+    sources, targets, spills = sources[order], targets[order], spills[order]
+    first = np.ones(len(sources), dtype=bool)
+    first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+    sources, targets, spills = sources[first], targets[first], spills[first]
+
+    starts = np.searchsorted(sources, np.arange(count + 1)).tolist()
+    targets = targets.tolist()
+    spills = spills.tolist()
+
+    levels = [np.inf] * count
+    levels[OCEAN] = -np.inf
+    done = bytearray(count)
+    heap = [(-np.inf, OCEAN)]
+    while heap:
+        level, current = heapq.heappop(heap)
+        if done[current]:
+            continue
+        done[current] = 1
+        for i in range(starts[current], starts[current + 1]):
+            other = targets[i]
+            if done[other]:
+                continue
+            spill = spills[i] if spills[i] > level else level
+            if spill < levels[other]:
+                levels[other] = spill
+                heapq.heappush(heap, (spill, other))
+
+    levels = np.array(levels)
+    levels[levels == np.inf] = -np.inf
+    return levels
+
+
+def _flood_tile(job):
+    # pool worker: flood of one tile of the DEM source
+    source, grid, row, col, nrows, ncols = job
+    return (row, col) + flood(raster_lib.read_window(source, grid, row - 1, col - 1, nrows + 2, ncols + 2))
+
+
+def _crossing_edges(filled, labels, tiles):
+    # spill edges of all D8 neighbours on either side of the tile boundaries, the edge cells keep their elevation
+    nrows, ncols, size = tiles.nrows, tiles.ncols, tiles.tile_size
+    edges = []
+
+    def add(label_a, label_b, z_a, z_b):
+        keep = (label_a >= 0) & (label_b >= 0) & (label_a != label_b)
+        edges.append((label_a[keep], label_b[keep], np.maximum(z_a[keep], z_b[keep])))
+
+    # padded column x is DEM column x - 1: the last column of the tiles left of the boundary
+    for x in range(size, ncols, size):
+        label_a, z_a = np.asarray(labels[1:nrows + 1, x]), np.asarray(filled[1:nrows + 1, x])
+        for dr in (-1, 0, 1):
+            add(label_a, np.asarray(labels[1 + dr:nrows + 1 + dr, x + 1]), z_a,
+                np.asarray(filled[1 + dr:nrows + 1 + dr, x + 1]))
+
+    for y in range(size, nrows, size):
+        label_a, z_a = np.asarray(labels[y, 1:ncols + 1]), np.asarray(filled[y, 1:ncols + 1])
+        for dc in (-1, 0, 1):
+            add(label_a, np.asarray(labels[y + 1, 1 + dc:ncols + 1 + dc]), z_a,
+                np.asarray(filled[y + 1, 1 + dc:ncols + 1 + dc]))
+
+    return edges
+
+
+def fill(source, tiles, processes=1):
+    """
+    Fills the depressions of the DEM source tile by tile (Barnes 2016): every tile
+    is flooded from its edge, the floods of neighbouring tiles are joined by the
+    spill edges between their labels across the tile boundaries, and the spill
+    level of every label from the flood of that graph raises the tile. Tiles are
+    flooded in processes processes. Returns the padded filled DEM, NaN for NoData.
+    """
+    grid = source.grid
+    filled = tiles.array("filled", np.float64, np.nan, padded=True)
+    labels = tiles.array("labels", np.int32, -1, padded=True)
+
+    jobs = [(source, grid) + window for window in tiles.windows]
+    processes = raster_lib.pool_size(processes, len(jobs))
+    if processes > 1:
+        pool = raster_lib.process_pool(processes)
+        results = pool.imap(_flood_tile, jobs)
+    else:
+        pool = None
+        results = (_flood_tile(job) for job in jobs)
+
+    # labels of the tiles numbered on from the labels of the tiles before
+    edges = []
+    count = OCEAN + 1
+    try:
+        for row, col, tile_filled, tile_labels, (a, b, spills) in results:
+            nrows, ncols = tile_filled.shape
+            own = int(tile_labels.max()) if tile_labels.size else 0
+            shift = count - 1
+
+            filled[row + 1:row + 1 + nrows, col + 1:col + 1 + ncols] = tile_filled
+            labels[row + 1:row + 1 + nrows, col + 1:col + 1 + ncols] = np.where(tile_labels > OCEAN,
+                                                                                tile_labels + shift, tile_labels)
+            edges.append((np.where(a > OCEAN, a + shift, a), np.where(b > OCEAN, b + shift, b), spills))
+            count += max(own, 0)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    edges += _crossing_edges(filled, labels, tiles)
+    levels = spill_levels(np.concatenate([e[0] for e in edges]), np.concatenate([e[1] for e in edges]),
+                          np.concatenate([e[2] for e in edges]), count)
+
+    # raise every cell to the spill level of its label
+    for row, col, nrows, ncols in tiles.windows:
+        window = (slice(row + 1, row + 1 + nrows), slice(col + 1, col + 1 + ncols))
+        tile_labels = np.asarray(labels[window])
+        filled[window] = np.maximum(filled[window], levels[np.maximum(tile_labels, 0)])
+
+    del labels
+    tiles.delete("labels")
+
+    return filled
+
+
+# ----------------------------Flow directions---------------------------- #
+
+def steepest_descent(halo):
+    """
+    D8 index (0-7) of the steepest strictly lower neighbour of the cells of a
+    tile, -1 without one, and the flat cells: no lower neighbour and not next to
+    NoData, where cells without a lower neighbour are outlets. halo is the filled
+    tile with a one cell rim.
+    """
+    height, width = halo.shape
+    center = halo[1:-1, 1:-1]
+    best = np.zeros(center.shape)
+    direction = np.full(center.shape, -1, dtype=np.int8)
+    near_nodata = np.zeros(center.shape, dtype=bool)
+
+    with np.errstate(invalid="ignore"):
+        for k, (dr, dc) in enumerate(D8_STEPS):
+            neighbour = halo[1 + dr:height - 1 + dr, 1 + dc:width - 1 + dc]
+            near_nodata |= np.isnan(neighbour)
+            drop = (center - neighbour) / D8_DISTANCE[k]
+            steeper = drop > best
+            best[steeper] = drop[steeper]
+            direction[steeper] = k
+
+    flat = (direction < 0) & ~near_nodata & ~np.isnan(center)
+    return direction, flat
+
+
+def flat_distances(halo, distance):
+    """
+    Steps from every flat cell of a tile over cells of the same elevation to the
+    nearest cell that drains, in place on the padded distance of the tile: 0 for
+    the cells that drain, UNREACHED for flat cells not reached yet, known steps in
+    the rim. A shortest path search with a heap, from the cells next to the flats.
+    """
+    height, width = halo.shape
+    flat = np.zeros(halo.shape, dtype=bool)
+    flat[1:-1, 1:-1] = distance[1:-1, 1:-1] != 0
+
+    # cells with a distance next to a flat cell of the same elevation
+    sources = np.zeros(halo.shape, dtype=bool)
+    reached = distance != UNREACHED
+    inner_flat = flat[1:-1, 1:-1]
+    for dr, dc in D8_STEPS:
+        window = (slice(1 + dr, height - 1 + dr), slice(1 + dc, width - 1 + dc))
+        sources[window] |= inner_flat & reached[window] & (halo[window] == halo[1:-1, 1:-1])
+
+    z = halo.ravel().tolist()
+    steps = distance.ravel().tolist()
+    is_flat = bytearray(flat.ravel().astype(np.uint8).tobytes())
+    size = len(z)
+    offsets = [dr * width + dc for dr, dc in D8_STEPS]
+
+    cells = np.flatnonzero(sources)
+    heap = list(zip(distance.ravel()[cells].tolist(), cells.tolist()))
+    heapq.heapify(heap)
+    while heap:
+        d, cell = heapq.heappop(heap)
+        if d > steps[cell]:
+            continue
+        for offset in offsets:
+            neighbour = cell + offset
+            # the rim wraps onto the rim, only rows can run off the tile
+            if 0 <= neighbour < size and is_flat[neighbour] and z[neighbour] == z[cell] and steps[neighbour] > d + 1:
+                steps[neighbour] = d + 1
+                heapq.heappush(heap, (d + 1, neighbour))
+
+    distance[...] = np.array(steps, dtype=np.int32).reshape(halo.shape)
+
+
+def flow_directions(filled, tiles):
+    """
+    D8 flow directions (0-7, -1 for outlets and NoData) on the padded filled DEM:
+    the steepest descent, and on flats the step towards the nearest cell of the
+    flat that drains, the first in D8 order (Garbrecht and Martz 1997 without the
+    gradient away from higher terrain). Descent lowers the elevation and steps on
+    flats the distance, so the flow has no cycles. Flats across tiles are solved
+    by passing the distances on the tile edges on until none change.
+    """
+    direction = tiles.array("direction", np.int8, -1)
+    distance = tiles.array("distance", np.int32, 0, padded=True)
+
+    flat_tiles = []
+    for index, (row, col, nrows, ncols) in enumerate(tiles.windows):
+        steepest, flat = steepest_descent(np.asarray(filled[row:row + nrows + 2, col:col + ncols + 2]))
+        direction[row:row + nrows, col:col + ncols] = steepest
+        if flat.any():
+            distance[row + 1:row + 1 + nrows, col + 1:col + 1 + ncols] = np.where(flat, UNREACHED, 0)
+            flat_tiles.append(index)
+
+    # distances until no tile edge changes
+    has_flats = set(flat_tiles)
+    pending = deque(flat_tiles)
+    queued = set(flat_tiles)
+    while pending:
+        index = pending.popleft()
+        queued.discard(index)
+        row, col, nrows, ncols = tiles.windows[index]
+        window = (slice(row, row + nrows + 2), slice(col, col + ncols + 2))
+
+        tile_distance = np.array(distance[window])
+        before = tile_distance[1:-1, 1:-1].copy()
+        flat_distances(np.asarray(filled[window]), tile_distance)
+        distance[row + 1:row + 1 + nrows, col + 1:col + 1 + ncols] = tile_distance[1:-1, 1:-1]
+
+        after = tile_distance[1:-1, 1:-1]
+        changed = before != after
+        if changed[0].any() or changed[-1].any() or changed[:, 0].any() or changed[:, -1].any():
+            for neighbour in tiles.neighbours(index):
+                if neighbour in has_flats and neighbour not in queued:
+                    queued.add(neighbour)
+                    pending.append(neighbour)
+
+    for index in flat_tiles:
+        row, col, nrows, ncols = tiles.windows[index]
+        window = (slice(row, row + nrows + 2), slice(col, col + ncols + 2))
+        halo, tile_distance = np.asarray(filled[window]), np.asarray(distance[window])
+        height, width = halo.shape
+
+        steps = tile_distance[1:-1, 1:-1]
+        tile_direction = np.array(direction[row:row + nrows, col:col + ncols])
+        todo = (steps > 0) & (steps != UNREACHED)
+        for k, (dr, dc) in enumerate(D8_STEPS):
+            neighbour = (slice(1 + dr, height - 1 + dr), slice(1 + dc, width - 1 + dc))
+            closer = todo & (halo[neighbour] == halo[1:-1, 1:-1]) & (tile_distance[neighbour] == steps - 1)
+            tile_direction[closer] = k
+            todo &= ~closer
+        direction[row:row + nrows, col:col + ncols] = tile_direction
+
+    del distance
+    tiles.delete("distance")
+
+    return direction
+
+
+def tile_flow(direction, tiles, row, col, nrows, ncols):
+    """
+    Flow of one tile: per cell the index of its downstream cell in the tile,
+    OUTLET where the flow leaves the tile or the DEM; the cells the flow leaves
+    the tile from (exits) and the flat DEM index of the cells they flow into.
+    """
+    k = np.asarray(direction[row:row + nrows, col:col + ncols]).ravel()
+    rows, cols = np.divmod(np.arange(nrows * ncols), ncols)
+    steps = np.array(D8_STEPS)
+    linked = k >= 0
+    to_rows = rows + steps[np.maximum(k, 0), 0]
+    to_cols = cols + steps[np.maximum(k, 0), 1]
+
+    inside = linked & (to_rows >= 0) & (to_rows < nrows) & (to_cols >= 0) & (to_cols < ncols)
+    downstream = np.where(inside, to_rows * ncols + to_cols, OUTLET)
+    exits = linked & ~inside
+    targets = (row + to_rows[exits]) * tiles.ncols + col + to_cols[exits]
+
+    return downstream, exits, targets
+
+
+def d8_codes(direction):
+    # Esri flow direction codes (1 E ... 128 NE) of D8 indices, 0 for outlets
+    codes = np.array([0] + D8_CODES, dtype=np.int32)
+    return codes[np.asarray(direction) + 1]
+
+
+# ----------------------------Flow accumulation---------------------------- #
+
+def flow_accumulation(downstream, weights=None):
+    """
+    Number of cells (or the sum of weights) draining through every cell, itself
+    included. Cells are peeled off in waves: a cell is passed on once all its
+    upstream cells are done, linear in the number of cells.
+    """
+    n = len(downstream)
+    accumulation = np.ones(n) if weights is None else np.array(weights, dtype=np.float64)
+    linked = downstream >= 0
+    upstream = np.bincount(downstream[linked], minlength=n)
+
+    wave = np.flatnonzero((upstream == 0) & linked)
+    while len(wave):
+        targets = downstream[wave]
+        np.add.at(accumulation, targets, accumulation[wave])
+        np.subtract.at(upstream, targets, 1)
+
+        # targets with all their upstream cells done and a cell of their own to pass on to
+        targets = np.unique(targets)
+        wave = targets[(upstream[targets] == 0) & linked[targets]]
+
+    return accumulation
+
+
+def extract_streams(filled, direction, tiles, minimum_cells):
+    """
+    Streams: the cells with at least minimum_cells cells draining through them.
+    Every tile is accumulated on its own, the accumulation leaving a tile is passed
+    on over the graph of the exits of the tiles (Barnes 2017) and added where it
+    enters the next tile, which is then accumulated again.
+    """
+    exit_cells, exit_targets, exit_totals, edge_cells, edge_exits = [], [], [], [], []
+    for row, col, nrows, ncols in tiles.windows:
+        downstream, exits, targets = tile_flow(direction, tiles, row, col, nrows, ncols)
+        accumulation = flow_accumulation(downstream)
+        cells = tiles.cells(row, col, nrows, ncols)
+
+        exit_cells.append(cells[exits])
+        exit_targets.append(targets)
+        exit_totals.append(accumulation[exits])
+
+        # the exit the flow of an edge cell leaves the tile from
+        first_exit = nearest_drainage(downstream, exits)
+        local, edge = tiles.edge_cells(row, col, nrows, ncols)
+        edge_cells.append(edge)
+        edge_exits.append(np.where(first_exit[local] >= 0, cells[np.maximum(first_exit[local], 0)], OUTLET))
+
+    exit_cells, exit_targets, exit_totals = [np.concatenate(x) for x in (exit_cells, exit_targets, exit_totals)]
+    order = np.argsort(exit_cells)
+    exit_cells, exit_targets, exit_totals = exit_cells[order], exit_targets[order], exit_totals[order]
+    edge_cells, edge_exits = np.concatenate(edge_cells), np.concatenate(edge_exits)
+    order = np.argsort(edge_cells)
+    edge_cells, edge_exits = edge_cells[order], edge_exits[order]
+
+    # exit to exit: the next exit is the one the cell an exit flows into leaves its tile from
+    next_exit = _lookup(edge_cells, edge_exits, exit_targets, OUTLET)
+    next_node = np.where(next_exit >= 0, np.searchsorted(exit_cells, next_exit), OUTLET)
+    totals = flow_accumulation(next_node, exit_totals)
+
+    entries, position = np.unique(exit_targets, return_inverse=True)
+    inflow = np.bincount(position.ravel(), weights=totals, minlength=len(entries))
+    entries, inflow, starts = _by_tile(tiles, entries, inflow)
+
+    streams = tiles.array("streams", np.bool_, False)
+    for index, (row, col, nrows, ncols) in enumerate(tiles.windows):
+        downstream, exits, targets = tile_flow(direction, tiles, row, col, nrows, ncols)
+        weights = np.ones(nrows * ncols)
+        entry_rows, entry_cols = np.divmod(entries[starts[index]:starts[index + 1]], tiles.ncols)
+        weights[(entry_rows - row) * ncols + entry_cols - col] += inflow[starts[index]:starts[index + 1]]
+
+        valid = ~np.isnan(np.asarray(filled[row + 1:row + 1 + nrows, col + 1:col + 1 + ncols]))
+        streams[row:row + nrows, col:col + ncols] = (flow_accumulation(downstream, weights) >=
+                                                     minimum_cells).reshape(nrows, ncols) & valid
+
+    return streams
+
+
+# ----------------------------Nearest drainage---------------------------- #
+
+def nearest_drainage(downstream, streams):
+    """
+    Flat index of the first stream cell down the flow path of every cell, -1 if
+    the path leaves the DEM first. Pointer jumping: every round each cell jumps to
+    the target of its target, so a path of length L takes log2(L) rounds.
+    """
+    n = len(downstream)
+    cells = np.arange(n)
+    target = np.where(streams, cells, downstream)
+    active = np.flatnonzero(~streams & (target >= 0))
+
+    while len(active):
+        jumped = target[target[active]]
+        done = streams[target[active]]
+        target[active[~done]] = jumped[~done]
+        active = active[~done]
+        active = active[target[active] >= 0]
+
+    return target
+
+
+def _tile_drainage(source, direction, streams, tiles, row, col, nrows, ncols):
+    # DEM of a tile, per cell its first stream cell or exit (-1 for none) and the stream elevation, NaN for exits
+    downstream, exits, targets = tile_flow(direction, tiles, row, col, nrows, ncols)
+    dem = raster_lib.read_window(source, source.grid, row, col, nrows, ncols).ravel()
+    tile_streams = np.asarray(streams[row:row + nrows, col:col + ncols]).ravel()
+
+    stop = nearest_drainage(downstream, tile_streams | exits)
+    reached = stop >= 0
+    elevation = np.full(len(stop), np.nan)
+    elevation[reached] = np.where(tile_streams[stop[reached]], dem[stop[reached]], np.nan)
+
+    return dem, stop, elevation, exits, targets
+
+
+def drainage_elevations(source, direction, streams, tiles):
+    """
+    HAND: the elevation of every cell of the DEM source above the first stream
+    cell down its flow path, NaN where the path leaves the DEM first. Every tile
+    finds the first stream or exit down the paths of its cells, the elevations
+    reached through exits are resolved on the graph of the exits by pointer
+    jumping and handed back to the tiles.
+    """
+    exit_cells, exit_targets, edge_cells, edge_exits, edge_elevations = [], [], [], [], []
+    for row, col, nrows, ncols in tiles.windows:
+        dem, stop, elevation, exits, targets = _tile_drainage(source, direction, streams, tiles,
+                                                              row, col, nrows, ncols)
+        cells = tiles.cells(row, col, nrows, ncols)
+        tile_streams = np.asarray(streams[row:row + nrows, col:col + ncols]).ravel()
+
+        # exits that aren't streams pass the elevation of the cell they flow into on
+        passing = exits & ~tile_streams
+        exit_cells.append(cells[passing])
+        exit_targets.append(targets[np.flatnonzero(passing[exits])])
+
+        local, edge = tiles.edge_cells(row, col, nrows, ncols)
+        via = (stop[local] >= 0) & ~tile_streams[np.maximum(stop[local], 0)]
+        edge_cells.append(edge)
+        edge_exits.append(np.where(via, cells[np.maximum(stop[local], 0)], OUTLET))
+        edge_elevations.append(elevation[local])
+
+    exit_cells, exit_targets = np.concatenate(exit_cells), np.concatenate(exit_targets)
+    order = np.argsort(exit_cells)
+    exit_cells, exit_targets = exit_cells[order], exit_targets[order]
+    edge_cells, edge_exits, edge_elevations = [np.concatenate(x) for x in (edge_cells, edge_exits, edge_elevations)]
+    order = np.argsort(edge_cells)
+    edge_cells, edge_exits, edge_elevations = edge_cells[order], edge_exits[order], edge_elevations[order]
+
+    # elevation of every exit: that of the cell it flows into, or the one of the next exit
+    next_exit = _lookup(edge_cells, edge_exits, exit_targets, OUTLET)
+    values = _lookup(edge_cells, edge_elevations, exit_targets, np.nan)
+    next_node = np.where(next_exit >= 0, np.searchsorted(exit_cells, next_exit), OUTLET)
+    active = np.flatnonzero(next_node >= 0)
+    while len(active):
+        targets = next_node[active]
+        jumped = next_node[targets]
+        done = jumped < 0
+        values[active[done]] = values[targets[done]]
+        next_node[active] = np.where(done, OUTLET, jumped)
+        active = active[~done]
+
+    heights = tiles.array("hand", np.float64, np.nan)
+    for row, col, nrows, ncols in tiles.windows:
+        dem, stop, elevation, exits, targets = _tile_drainage(source, direction, streams, tiles,
+                                                              row, col, nrows, ncols)
+        cells = tiles.cells(row, col, nrows, ncols)
+        through_exit = (stop >= 0) & np.isnan(elevation)
+        through_exit &= ~np.asarray(streams[row:row + nrows, col:col + ncols]).ravel()[np.maximum(stop, 0)]
+        elevation[through_exit] = _lookup(exit_cells, values, cells[stop[through_exit]], np.nan)
+
+        with np.errstate(invalid="ignore"):
+            heights[row:row + nrows, col:col + ncols] = np.maximum(dem - elevation, 0.0).reshape(nrows, ncols)
+
+    return heights
+
+
+def hand(source, stream_cells, tile_size=TILE_SIZE, prefix=None, processes=1):
+    """
+    Height above nearest drainage of the DEM source (NaN is NoData): the
+    elevation above the first stream cell down the D8 flow path, where streams are
+    the cells with at least stream_cells cells draining through them. The DEM is
+    read tile by tile, tiles are flooded in processes processes. Returns HAND and
+    the stream mask, NaN where the flow leaves the DEM before reaching a stream.
+    With a prefix they are the memory mapped files <prefix>_hand.npy and
+    <prefix>_streams.npy, the other working files are removed.
+    """
+    grid = source.grid
+    tiles = Tiles(grid.nrows, grid.ncols, tile_size, prefix)
+
+    filled = fill(source, tiles, processes)
+    direction = flow_directions(filled, tiles)
+    streams = extract_streams(filled, direction, tiles, stream_cells)
+    del filled
+    tiles.delete("filled")
+
+    heights = drainage_elevations(source, direction, streams, tiles)
+    del direction
+    tiles.delete("direction")
+
+    return heights, streams
+
+
+# ----------------------------arcpy bridge---------------------------- #
+
+def hand_raster(dem_raster, output_raster, stream_area=STREAM_AREA, streams_raster=None, spatial_reference=None,
+                processes=None):
+    # HAND raster from a DEM, streams where the contributing area is at least stream_area (square map units)
+    source = raster_lib.RasterSource(dem_raster)
+    grid = source.grid
+    if spatial_reference is None:
+        spatial_reference = arcpy.Describe(dem_raster).spatialReference
+
+    minimum_cells = max(int(round(stream_area / (grid.cell_size * grid.cell_size))), 1)
+    prefix = os.path.join(arcpy.env.scratchFolder, "hand")
+    heights, streams = hand(source, minimum_cells, prefix=prefix, processes=processes)
+    if not any(np.asarray(streams[row:row + TILE_SIZE]).any() for row in range(0, grid.nrows, TILE_SIZE)):
+        del heights, streams
+        for name in ("hand", "streams"):
+            os.remove(prefix + "_" + name + ".npy")
+        raise HandError("No streams of " + str(minimum_cells) + " cells or more on the DEM, use a smaller "
+                        "stream area.")
+
+    raster_lib.materialize(raster_lib.ArraySource(heights, grid), output_raster, spatial_reference)
+    if streams_raster:
+        raster_lib.materialize(raster_lib.ArraySource(streams, grid, nodata=0), streams_raster, spatial_reference)
+
+    del heights, streams
+    for name in ("hand", "streams"):
+        os.remove(prefix + "_" + name + ".npy")
+
+    return output_raster
@@ -0,0 +1,592 @@
+# -------------------------------------------------------------------------------
+# Name:        las_lib
+# Purpose:     NumPy LAS engine: LAS 1.2 - 1.4 headers and point records (point
+#              formats 0 - 10) memory mapped as structured arrays, with vectorized
+#              class code, return and extent filters.
+#
+# Author:      Gert van Maren
+#
+# Created:     19/10/2026
+# Copyright:   (c) Esri 2026
+# updated:
+# updated:
+# updated:
+
+# Required:    numpy. arcpy only to list the files of a LAS dataset. Compressed
+#              LAZ / zLAS files are not supported, the LAS dataset tools read those.
+
+# -------------------------------------------------------------------------------
+
+import os
+import csv
+import json
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+import raster_lib
+
+try:
+    import arcpy
+except ImportError:  # the engines don't need arcpy, e.g. for testing
+    arcpy = None
+
+# Constants
+LAS_SIGNATURE = b"LASF"
+CHUNK_POINTS = 4 * 1024 * 1024
+
+RETURN_FILTERS = ["FIRST", "LAST", "SINGLE", "FIRST_OF_MANY", "LAST_OF_MANY"]
+
+# class codes never reported as present: overlap, reserved and noise classes
+OMIT_CLASS_CODES = [7, 12, 13, 14, 15, 16, 18]
+
+# histogram name and number of bins, intensity is binned by its high byte
+HISTOGRAMS = [("classification", 256), ("return_number", 16), ("number_of_returns", 16), ("intensity", 256)]
+
+INDEX_FILE = "las_index.json"
+STATISTICS_FILE = "lasd_statistics.csv"
+MEMBER_EXTENSIONS = [".las", ".zlas", ".laz"]
+OCCUPANCY_SIZE = 32     # occupancy grid cells along each side of a tile in the index
+
+# point record layouts by point format, all little endian
+_CORE_LEGACY = [("X", "<i4"), ("Y", "<i4"), ("Z", "<i4"), ("intensity", "<u2"), ("return_byte", "u1"),
+                ("classification", "u1"), ("scan_angle_rank", "i1"), ("user_data", "u1"),
+                ("point_source_id", "<u2")]
+_CORE_14 = [("X", "<i4"), ("Y", "<i4"), ("Z", "<i4"), ("intensity", "<u2"), ("return_byte", "u1"),
+            ("flag_byte", "u1"), ("classification", "u1"), ("user_data", "u1"), ("scan_angle", "<i2"),
+            ("point_source_id", "<u2"), ("gps_time", "<f8")]
+_GPS = [("gps_time", "<f8")]
+_RGB = [("red", "<u2"), ("green", "<u2"), ("blue", "<u2")]
+_NIR = [("nir", "<u2")]
+_WAVE = [("wave_packet_descriptor", "u1"), ("wave_offset", "<u8"), ("wave_size", "<u4"),
+         ("wave_return_location", "<f4"), ("x_t", "<f4"), ("y_t", "<f4"), ("z_t", "<f4")]
+
+POINT_FORMATS = {0: _CORE_LEGACY,
+                 1: _CORE_LEGACY + _GPS,
+                 2: _CORE_LEGACY + _RGB,
+                 3: _CORE_LEGACY + _GPS + _RGB,
+                 4: _CORE_LEGACY + _GPS + _WAVE,
+                 5: _CORE_LEGACY + _GPS + _RGB + _WAVE,
+                 6: _CORE_14,
+                 7: _CORE_14 + _RGB,
+                 8: _CORE_14 + _RGB + _NIR,
+                 9: _CORE_14 + _WAVE,
+                 10: _CORE_14 + _RGB + _NIR + _WAVE}
+
+# filtered points of one chunk, coordinates scaled to map units
+LasPoints = namedtuple("LasPoints", ["x", "y", "z", "classification", "intensity", "return_number",
+                                     "number_of_returns"])
+
+
+class LasError(Exception):
+    pass
+
+
+def point_dtype(point_format, record_length=None):
+    # structured dtype of a point format, padded to the record length for extra bytes
+    if point_format not in POINT_FORMATS:
+        raise LasError("Unsupported point data format: " + str(point_format))
+
+    dtype = np.dtype(POINT_FORMATS[point_format])
+    if record_length is None or record_length == dtype.itemsize:
+        return dtype
+    if record_length < dtype.itemsize:
+        raise LasError("Point record length " + str(record_length) + " too short for point format " +
+                       str(point_format))
+
+    return np.dtype({"names": dtype.names, "formats": [dtype.fields[name][0] for name in dtype.names],
+                     "offsets": [dtype.fields[name][1] for name in dtype.names], "itemsize": record_length})
+
+
+# ----------------------------LAS file---------------------------- #
+
+class LasFile(object):
+    """
+    Public header of a LAS file and its point records as a read only memory mapped
+    structured array (points), in the file's integer coordinates. Nothing else is
+    read until points are used.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, "rb") as f:
+            header = f.read(375)
+
+        if len(header) < 227 or header[:4] != LAS_SIGNATURE:
+            raise LasError(path + " is not a LAS file")
+
+        self.version = (header[24], header[25])
+        self.header_size, self.point_offset = struct.unpack_from("<HI", header, 94)
+        point_format, self.record_length, legacy_count = struct.unpack_from("<BHI", header, 104)
+
+        # bit 7 (and 6) flag compressed points
+        if point_format & 0xC0:
+            raise LasError(path + " is compressed, LAZ is not supported")
+
+        self.point_format = point_format
+        self.scale = np.array(struct.unpack_from("<3d", header, 131))
+        self.offset = np.array(struct.unpack_from("<3d", header, 155))
+        max_x, min_x, max_y, min_y, max_z, min_z = struct.unpack_from("<6d", header, 179)
+        self.bounds = (min_x, min_y, min_z, max_x, max_y, max_z)
+
+        self.point_count = legacy_count
+        if self.version >= (1, 4) and len(header) >= 375 and self.header_size >= 375:
+            count = struct.unpack_from("<Q", header, 247)[0]
+            if count:
+                self.point_count = count
+
+        self.dtype = point_dtype(point_format, self.record_length)
+        self._points = None
+
+    @property
+    def points(self):
+        if self._points is None:
+            if self.point_count:
+                self._points = np.memmap(self.path, dtype=self.dtype, mode="r", offset=self.point_offset,
+                                         shape=(self.point_count,))
+            else:
+                self._points = np.zeros(0, dtype=self.dtype)
+        return self._points
+
+    @property
+    def legacy(self):
+        # point formats 0 - 5 pack classification and returns differently than 6 - 10
+        return self.point_format < 6
+
+    def raw_extent(self, x_min, y_min, x_max, y_max):
+        # an extent in the file's integer coordinates, the records inside it in map units
+        low = np.ceil((np.array([x_min, y_min]) - self.offset[:2]) / self.scale[:2])
+        high = np.floor((np.array([x_max, y_max]) - self.offset[:2]) / self.scale[:2])
+        return low[0], low[1], high[0], high[1]
+
+    def intersects(self, extent):
+        x_min, y_min, x_max, y_max = extent
+        return not (self.bounds[3] < x_min or self.bounds[0] > x_max or
+                    self.bounds[4] < y_min or self.bounds[1] > y_max)
+
+    def iter_records(self, chunk_size=CHUNK_POINTS):
+        # memory mapped slices of the point records, no copies
+        points = self.points
+        for start in range(0, len(points), chunk_size):
+            yield points[start:start + chunk_size]
+
+    def iter_points(self, class_codes=None, returns=None, extent=None, withheld=False, chunk_size=CHUNK_POINTS):
+        # filtered LasPoints per chunk, chunks without points are skipped
+        if extent is not None and not self.intersects(extent):
+            return
+
+        for records in self.iter_records(chunk_size):
+            mask = point_mask(self, records, class_codes, returns, extent, withheld)
+            if mask is not None:
+                records = records[mask]
+            if len(records):
+                yield las_points(self, records)
+
+
+# ----------------------------Point fields---------------------------- #
+
+def classification(las, records):
+    if las.legacy:
+        return records["classification"] & 0x1F
+    return records["classification"]
+
+
+def return_numbers(las, records):
+    # return number and number of returns
+    byte = records["return_byte"]
+    if las.legacy:
+        return byte & 0x07, (byte >> 3) & 0x07
+    return byte & 0x0F, (byte >> 4) & 0x0F
+
+
+def withheld_flags(las, records):
+    if las.legacy:
+        return (records["classification"] & 0x80) != 0
+    return (records["flag_byte"] & 0x04) != 0
+
+
+def coordinates(las, records):
+    # x, y, z in map units
+    return (records["X"] * las.scale[0] + las.offset[0],
+            records["Y"] * las.scale[1] + las.offset[1],
+            records["Z"] * las.scale[2] + las.offset[2])
+
+
+def las_points(las, records):
+    x, y, z = coordinates(las, records)
+    return_number, number_of_returns = return_numbers(las, records)
+    return LasPoints(x, y, z, classification(las, records), np.asarray(records["intensity"]),
+                     return_number, number_of_returns)
+
+
+def point_mask(las, records, class_codes=None, returns=None, extent=None, withheld=False):
+    """
+    Boolean mask of the records passing the filters, None if nothing is filtered.
+    class_codes is a list of codes, returns a list of return numbers or one of
+    RETURN_FILTERS, extent (x_min, y_min, x_max, y_max) in map units; withheld
+    points are dropped unless withheld is True.
+    """
+    mask = None
+
+    def combine(current, condition):
+        return condition if current is None else current & condition
+
+    if class_codes is not None:
+        mask = combine(mask, np.isin(classification(las, records), np.asarray(list(class_codes), dtype=np.int64)))
+
+    if returns is not None:
+        number, count = return_numbers(las, records)
+        if returns == "FIRST":
+            condition = number == 1
+        elif returns == "LAST":
+            condition = number == count
+        elif returns == "SINGLE":
+            condition = count == 1
+        elif returns == "FIRST_OF_MANY":
+            condition = (number == 1) & (count > 1)
+        elif returns == "LAST_OF_MANY":
+            condition = (number == count) & (count > 1)
+        else:
+            condition = np.isin(number, np.asarray(list(returns), dtype=np.int64))
+        mask = combine(mask, condition)
+
+    if extent is not None:
+        # compare in the integer coordinates, no scaling of points outside the extent
+        x_min, y_min, x_max, y_max = las.raw_extent(*extent)
+        x, y = records["X"], records["Y"]
+        mask = combine(mask, (x >= x_min) & (x <= x_max) & (y >= y_min) & (y <= y_max))
+
+    if not withheld:
+        mask = combine(mask, ~withheld_flags(las, records))
+
+    return mask
+
+
+# ----------------------------LAS collections---------------------------- #
+
+def readable(files):
+    """
+    True if every file is a plain .las file this engine can read: present, with a
+    LAS header and uncompressed points.
+    """
+    for path in files:
+        if os.path.splitext(path)[1].lower() != ".las" or not os.path.isfile(path):
+            return False
+        try:
+            LasFile(path)
+        except LasError:
+            return False
+    return True
+
+
+# ----------------------------Tile index---------------------------- #
+# Persistent index of LAS tiles in a JSON file, one entry per file path with the
+# size and mtime it was built from: header bounds and point count, histograms and
+# per class a coarse occupancy grid over the tile bounds. Entries are only rebuilt
+# for files that changed, so statistics and area of interest queries on large
+# collections read the headers of nothing but new or changed tiles.
+
+def file_histograms(path, chunk_size=CHUNK_POINTS, occupancy_size=OCCUPANCY_SIZE):
+    """
+    Class code, return and intensity histograms (HISTOGRAMS) of all points in one
+    pass, withheld points included, and with occupancy_size the per class point
+    counts on an occupancy_size x occupancy_size grid over the tile bounds (key
+    "occupancy", shape (256, occupancy_size ** 2)).
+    """
+    las = LasFile(path)
+    counts = dict((name, np.zeros(bins, dtype=np.int64)) for name, bins in HISTOGRAMS)
+
+    cells = occupancy_size * occupancy_size if occupancy_size else 0
+    if cells:
+        counts["occupancy"] = np.zeros(256 * cells, dtype=np.int64)
+        x_min, y_min, z_min, x_max, y_max, z_max = las.bounds
+        cell_width = max(x_max - x_min, 1e-9) / occupancy_size
+        cell_height = max(y_max - y_min, 1e-9) / occupancy_size
+
+    for records in las.iter_records(chunk_size):
+        codes = classification(las, records)
+        return_number, number_of_returns = return_numbers(las, records)
+        values = {"classification": codes, "return_number": return_number,
+                  "number_of_returns": number_of_returns, "intensity": records["intensity"] >> 8}
+        for name, bins in HISTOGRAMS:
+            counts[name] += np.bincount(values[name], minlength=bins)[:bins]
+
+        if cells:
+            x, y, z = coordinates(las, records)
+            cols = np.clip(((x - x_min) / cell_width).astype(np.int64), 0, occupancy_size - 1)
+            rows = np.clip(((y_max - y) / cell_height).astype(np.int64), 0, occupancy_size - 1)
+            index = codes.astype(np.int64) * cells + rows * occupancy_size + cols
+            counts["occupancy"] += np.bincount(index, minlength=256 * cells)
+
+    if cells:
+        counts["occupancy"] = counts["occupancy"].reshape(256, cells)
+
+    return counts
+
+
+def _index_entry(job):
+    # worker: index entry of one file, JSON ready
+    path, occupancy_size = job
+    status = os.stat(path)
+    las = LasFile(path)
+    histograms = file_histograms(path, occupancy_size=occupancy_size)
+
+    entry = {"size": status.st_size, "mtime": status.st_mtime, "bounds": list(las.bounds),
+             "point_count": las.point_count, "point_format": las.point_format,
+             "version": "%d.%d" % las.version, "occupancy_size": occupancy_size}
+    for name, bins in HISTOGRAMS:
+        entry[name] = histograms[name].tolist()
+
+    # occupied cells per class as packed bits in hex
+    if occupancy_size:
+        entry["occupancy"] = dict((str(code), np.packbits(histograms["occupancy"][code] > 0).tobytes().hex())
+                                  for code in np.flatnonzero(histograms["classification"]))
+    return path, entry
+
+
+class LasIndex(object):
+    """ Tile index of LAS files, persisted in index_file (JSON) if given. """
+
+    def __init__(self, index_file=None, occupancy_size=OCCUPANCY_SIZE):
+        self.index_file = index_file
+        self.occupancy_size = occupancy_size
+        self.entries = {}
+
+        if index_file and os.path.exists(index_file):
+            try:
+                with open(index_file, "r") as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                self.entries = {}
+
+    def is_current(self, path):
+        entry = self.entries.get(path)
+        if not entry or entry.get("occupancy_size") != self.occupancy_size:
+            return False
+        status = os.stat(path)
+        return entry["size"] == status.st_size and entry["mtime"] == status.st_mtime
+
+    def update(self, files, processes=None):
+        # (re)builds the entries of new and changed files, drops files that no longer exist; returns the paths
+        files = [os.path.abspath(path) for path in files]
+        stale = [path for path in files if not self.is_current(path)]
+        removed = [path for path in self.entries if not os.path.exists(path)]
+
+        if stale:
+            jobs = [(path, self.occupancy_size) for path in stale]
+            processes = raster_lib.pool_size(processes, len(jobs))
+            if processes > 1:
+                pool = raster_lib.process_pool(processes)
+                try:
+                    results = pool.map(_index_entry, jobs)
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                results = [_index_entry(job) for job in jobs]
+
+            self.entries.update(dict(results))
+
+        for path in removed:
+            del self.entries[path]
+
+        if (stale or removed) and self.index_file:
+            with open(self.index_file, "w") as f:
+                json.dump(self.entries, f)
+
+        return files
+
+    def histograms(self, path):
+        return dict((name, np.array(self.entries[path][name], dtype=np.int64)) for name, bins in HISTOGRAMS)
+
+    def _occupied(self, entry, extent, class_codes):
+        # any occupied occupancy cell of the classes within the extent
+        size = entry.get("occupancy_size")
+        if not size or "occupancy" not in entry:
+            return True
+
+        x_min, y_min, z_min, x_max, y_max, z_max = entry["bounds"]
+        cell_width = max(x_max - x_min, 1e-9) / size
+        cell_height = max(y_max - y_min, 1e-9) / size
+        col0 = int(np.clip(np.floor((extent[0] - x_min) / cell_width), 0, size - 1))
+        col1 = int(np.clip(np.floor((extent[2] - x_min) / cell_width), 0, size - 1))
+        row0 = int(np.clip(np.floor((y_max - extent[3]) / cell_height), 0, size - 1))
+        row1 = int(np.clip(np.floor((y_max - extent[1]) / cell_height), 0, size - 1))
+
+        codes = class_codes if class_codes is not None else [int(code) for code in entry["occupancy"]]
+        for code in codes:
+            bits = entry["occupancy"].get(str(int(code)))
+            if bits:
+                occupied = np.unpackbits(np.frombuffer(bytes.fromhex(bits), dtype=np.uint8))[:size * size]
+                if occupied.reshape(size, size)[row0:row1 + 1, col0:col1 + 1].any():
+                    return True
+        return False
+
+    def query(self, files, extent=None, class_codes=None, processes=None):
+        """
+        Files of the collection with points of class_codes within extent
+        (x_min, y_min, x_max, y_max): header bounds, class counts and the occupancy
+        grids are checked without opening the files. Updates the index first.
+        """
+        selected = []
+        for path in self.update(files, processes):
+            entry = self.entries[path]
+            if class_codes is not None and not any(entry["classification"][int(code)] for code in class_codes):
+                continue
+
+            if extent is not None:
+                x_min, y_min, z_min, x_max, y_max, z_max = entry["bounds"]
+                if x_max < extent[0] or x_min > extent[2] or y_max < extent[1] or y_min > extent[3]:
+                    continue
+                if not self._occupied(entry, extent, class_codes):
+                    continue
+
+            selected.append(path)
+
+        return selected
+
+
+def las_statistics(files, cache_file=None, processes=None):
+    """
+    Histograms (HISTOGRAMS) per LAS file, {path: {name: counts}}, from the tile
+    index in cache_file: files are read in parallel and only when they changed.
+    """
+    index = LasIndex(cache_file)
+    return dict((path, index.histograms(path)) for path in index.update(files, processes))
+
+
+def total_histograms(statistics):
+    # histograms summed over all files of las_statistics
+    totals = dict((name, np.zeros(bins, dtype=np.int64)) for name, bins in HISTOGRAMS)
+    for histograms in statistics.values():
+        for name, bins in HISTOGRAMS:
+            totals[name] += histograms[name]
+    return totals
+
+
+def class_codes(files, cache_file=None, omit=OMIT_CLASS_CODES, processes=None):
+    # class codes with points, without the omitted codes
+    counts = total_histograms(las_statistics(files, cache_file, processes))["classification"]
+    return [int(code) for code in np.flatnonzero(counts) if code not in omit]
+
+
+# ----------------------------Point binning---------------------------- #
+
+def las_extent(files):
+    # x_min, y_min, x_max, y_max of the headers of all files
+    bounds = np.array([LasFile(path).bounds for path in files])
+    return (float(bounds[:, 0].min()), float(bounds[:, 1].min()),
+            float(bounds[:, 3].max()), float(bounds[:, 4].max()))
+
+
+def las_grid(files, cell_size, snap_grid=None, extent=None):
+    # grid over the LAS files, or their part within extent, with points on the maximum x / minimum y edges inside
+    x_min, y_min, x_max, y_max = las_extent(files)
+    if extent is not None:
+        x_min, y_min = max(x_min, extent[0]), max(y_min, extent[1])
+        x_max, y_max = min(x_max, extent[2]), min(y_max, extent[3])
+    grid = raster_lib.grid_for_extent(x_min, y_min, x_max, y_max, cell_size, snap_grid)
+    ncols = int(np.floor((x_max - grid.x_min) / cell_size)) + 1
+    nrows = int(np.floor((grid.y_max - y_min) / cell_size)) + 1
+    return raster_lib.RasterGrid(float(grid.x_min), float(grid.y_max), cell_size, ncols, nrows)
+
+
+def _bin_file(job):
+    # worker: bins the filtered points of one file into windows of the grids its bounds touch
+    path, grids, statistics, class_codes, returns, extent = job
+    las = LasFile(path)
+    x_min, y_min, z_min, x_max, y_max, z_max = las.bounds
+
+    windows = []
+    for grid, grid_statistics in zip(grids, statistics):
+        # a cell of margin for headers rounded differently than the points
+        margin = grid.cell_size
+        window = raster_lib.window_for_extent(grid, x_min - margin, y_min - margin, x_max + margin, y_max + margin)
+        if window is None:
+            windows.append(None)
+        else:
+            row, col, nrows, ncols = window
+            windows.append((row, col, raster_lib.PointBinner(raster_lib.block_grid(grid, row, col, nrows, ncols),
+                                                             grid_statistics)))
+
+    if any(windows):
+        for points in las.iter_points(class_codes, returns, extent):
+            for window in windows:
+                if window:
+                    window[2].add(points.x, points.y, points.z)
+
+    return windows
+
+
+def bin_las_files(files, grids, statistics, class_codes=None, returns=None, extent=None, processes=None,
+                  prefixes=None):
+    """
+    Bins the filtered points of LAS files into several grids in one read, e.g. a
+    maximum elevation DSM and a point count grid. statistics holds a list of
+    raster_lib.BIN_STATISTICS per grid. Files are binned in parallel, one process
+    per file, each into windows of the grids around the file which are merged into
+    one PointBinner per grid here. Points outside extent are skipped while reading.
+    With prefixes, one per grid, the binners are memory mapped files (see
+    raster_lib.PointBinner), so no more than a file window per grid is in memory.
+    """
+    if prefixes is None:
+        prefixes = [None] * len(grids)
+    binners = [raster_lib.PointBinner(grid, grid_statistics, prefix)
+               for grid, grid_statistics, prefix in zip(grids, statistics, prefixes)]
+    jobs = [(path, grids, statistics, class_codes, returns, extent) for path in files]
+
+    processes = raster_lib.pool_size(processes, len(jobs))
+    if processes > 1:
+        pool = raster_lib.process_pool(processes)
+        try:
+            for windows in pool.imap_unordered(_bin_file, jobs):
+                for binner, window in zip(binners, windows):
+                    if window:
+                        binner.merge(window[2], window[0], window[1])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for job in jobs:
+            for binner, window in zip(binners, _bin_file(job)):
+                if window:
+                    binner.merge(window[2], window[0], window[1])
+
+    return binners
+
+
+# ----------------------------arcpy bridge---------------------------- #
+
+def dataset_files(lasd, out_folder):
+    """
+    Member files of a LAS dataset as listed by LasDatasetStatistics at the LAS_FILES
+    level, its csv written to out_folder, and resolved against the folder of the
+    .lasd. None if not every member is a plain .las file this engine can read,
+    e.g. zLAS, LAZ or missing files: the LAS dataset tools have to read those.
+    Statistics missing in the LAS dataset are calculated.
+    """
+    statistics_file = os.path.join(out_folder, STATISTICS_FILE)
+    if os.path.exists(statistics_file):
+        os.remove(statistics_file)
+
+    arcpy.LasDatasetStatistics_management(lasd, "SKIP_EXISTING_STATS", statistics_file, "LAS_FILES", "COMMA",
+                                          "DECIMAL_POINT")
+
+    folder = os.path.dirname(os.path.abspath(str(lasd)))
+    files = []
+    with open(statistics_file, "r") as f:
+        for row in csv.DictReader(f):
+            name = (row.get("FileName") or "").strip()
+            # the rows of the dataset summary have no member file name
+            if os.path.splitext(name)[1].lower() not in MEMBER_EXTENSIONS:
+                continue
+            path = os.path.normpath(name if os.path.isabs(name) else os.path.join(folder, name))
+            if path not in files:
+                files.append(path)
+
+    if len(files) != arcpy.Describe(lasd).fileCount or not readable(files):
+        return None
+
+    return files
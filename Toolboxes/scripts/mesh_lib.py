@@ -0,0 +1,889 @@
+# -------------------------------------------------------------------------------
+# Name:        mesh_lib
+# Purpose:     NumPy mesh engine for 3D flood surfaces: adaptive triangulation of
+#              a water surface raster straight into vertex and face arrays,
+#              error bounded decimation of those meshes and streaming export to
+#              OBJ, binary PLY and glTF.
+#
+# Author:      Gert van Maren
+#
+# Created:     19/10/2026
+# Copyright:   (c) Esri 2026
+# updated:
+# updated:
+# updated:
+
+# Required:    numpy. arcpy only for writing feature classes.
+
+# -------------------------------------------------------------------------------
+
+import os
+import json
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+import raster_lib
+
+try:
+    import arcpy
+except ImportError:  # the mesh engines don't need arcpy, e.g. for testing
+    arcpy = None
+
+# Constants
+TILE_SIZE = 512     # cells per mesh tile, must be a power of 2
+CHECK_CELLS = 4 * 1024 * 1024   # cells checked at once for the true error of triangles
+Z_TOLERANCE = 0.1   # same vertical tolerance RasterTin used
+MAX_DEVIATION = 0.1     # default vertical deviation decimation may add
+BOUNDARY_DEVIATION = 0.0    # default horizontal deviation of the mesh boundary, 0 only merges straight runs
+MAX_VALENCE = 12        # vertices with more neighbours are only removed where their star is flat
+DECIMATE_CHUNK = 32768  # vertices of valence MAX_VALENCE evaluated at once during decimation
+PRECISION = 0.001       # quantization step of exported vertex coordinates, in map units
+
+
+# ----------------------------Adaptive triangulation---------------------------- #
+# Right-triangulated irregular network (RTIN): a (2^n + 1) grid is split recursively
+# into right triangles along the longest edge. The error of a split vertex is the
+# worst vertical error of every triangle that depends on it, so any error tolerance
+# gives a crack free mesh. The midpoint error of a triangle only estimates its
+# error; with a tolerance the triangles estimated within it get the true largest
+# error of the cells they cover, so the mesh at that tolerance is within it. NoData
+# counts as infinite error and triangles with a NoData corner are dropped, which
+# clips the mesh to the data.
+
+def _triangle_coords(ids, tile_size):
+    # corner coordinates (col, row) of RTIN triangles by id, a / b on the hypotenuse
+    ids = np.asarray(ids, dtype=np.int64)
+    first = (ids & 1) == 1
+
+    ax = np.where(first, 0, tile_size)
+    ay = np.where(first, 0, tile_size)
+    bx = np.where(first, tile_size, 0)
+    by = np.where(first, tile_size, 0)
+    cx = np.where(first, tile_size, 0)
+    cy = np.where(first, 0, tile_size)
+
+    bits = ids >> 1
+    while True:
+        step = bits > 1
+        if not step.any():
+            break
+
+        mx, my = (ax + bx) >> 1, (ay + by) >> 1
+        left = step & ((bits & 1) == 1)
+        right = step & ~left
+
+        ax, ay, bx, by = (np.where(left, cx, np.where(right, bx, ax)), np.where(left, cy, np.where(right, by, ay)),
+                          np.where(left, ax, np.where(right, cx, bx)), np.where(left, ay, np.where(right, cy, by)))
+        cx, cy = np.where(step, mx, cx), np.where(step, my, cy)
+        bits = np.where(step, bits >> 1, bits)
+
+    return ax, ay, bx, by, cx, cy
+
+
+def triangle_errors(heights, ax, ay, bx, by, cx, cy):
+    # largest vertical error of the grid cells in (or on) each triangle against the plane of its corners, inf for NaN
+    grid_size = heights.shape[0]
+    x0, y0 = np.minimum(np.minimum(ax, bx), cx), np.minimum(np.minimum(ay, by), cy)
+    width = int((np.maximum(np.maximum(ax, bx), cx) - x0).max()) + 1
+    height = int((np.maximum(np.maximum(ay, by), cy) - y0).max()) + 1
+    offset_y, offset_x = [offsets.ravel() for offsets in np.mgrid[0:height, 0:width]]
+
+    errors = np.zeros(len(ax))
+    chunk = max(CHECK_CELLS // (width * height), 1)
+    for start in range(0, len(ax), chunk):
+        part = slice(start, start + chunk)
+        x = np.minimum(x0[part, None] + offset_x, grid_size - 1)
+        y = np.minimum(y0[part, None] + offset_y, grid_size - 1)
+
+        # barycentric weights from edge functions, exact in integers
+        tax, tay, tbx, tby, tcx, tcy = [corner[part, None] for corner in (ax, ay, bx, by, cx, cy)]
+        area = (tbx - tax) * (tcy - tay) - (tby - tay) * (tcx - tax)
+        wa = (tbx - x) * (tcy - y) - (tby - y) * (tcx - x)
+        wb = (tcx - x) * (tay - y) - (tcy - y) * (tax - x)
+        wc = area - wa - wb
+        inside = (wa * area >= 0) & (wb * area >= 0) & (wc * area >= 0)
+
+        flat = heights.ravel()
+        with np.errstate(invalid="ignore"):
+            plane = (wa * flat[tay * grid_size + tax] + wb * flat[tby * grid_size + tbx] +
+                     wc * flat[tcy * grid_size + tcx]) / area
+            error = np.abs(plane - flat[y * grid_size + x])
+        error[np.isnan(error)] = np.inf
+        errors[part] = np.where(inside, error, 0.0).max(axis=1)
+
+    return errors
+
+
+def rtin_errors(heights, forced=None, z_tolerance=None):
+    """
+    Split vertex errors for a (2^n + 1) square height grid. NaN heights and cells
+    in the optional boolean forced grid get infinite error so they are always split.
+    With z_tolerance, triangles whose estimated error is within it are checked
+    cell by cell (triangle_errors).
+    """
+    grid_size = heights.shape[0]
+    tile_size = grid_size - 1
+    flat = heights.ravel()
+
+    errors = np.zeros(grid_size * grid_size)
+    if forced is not None:
+        errors[forced.ravel()] = np.inf
+
+    num_triangles = tile_size * tile_size * 2 - 2
+    num_parents = num_triangles - tile_size * tile_size
+    depth_max = int(num_triangles + 1).bit_length() - 1
+
+    # deepest triangles first, all triangles of one depth at once
+    for depth in range(depth_max, 0, -1):
+        ids = np.arange(2 ** depth, min(2 ** (depth + 1), num_triangles + 2))
+        ax, ay, bx, by, cx, cy = _triangle_coords(ids, tile_size)
+
+        mx, my = (ax + bx) >> 1, (ay + by) >> 1
+        middle = my * grid_size + mx
+
+        a = flat[ay * grid_size + ax]
+        b = flat[by * grid_size + bx]
+        m = flat[middle]
+        with np.errstate(invalid="ignore"):
+            error = np.abs((a + b) / 2.0 - m)
+        error[np.isnan(error)] = np.inf
+
+        if z_tolerance is not None:
+            check = np.flatnonzero(error <= z_tolerance)
+            if check.size:
+                error[check] = np.maximum(error[check], triangle_errors(heights, ax[check], ay[check], bx[check],
+                                                                        by[check], cx[check], cy[check]))
+
+        parents = (ids - 2) < num_parents
+        if parents.any():
+            left = ((ay + cy) >> 1) * grid_size + ((ax + cx) >> 1)
+            right = ((by + cy) >> 1) * grid_size + ((bx + cx) >> 1)
+            error = np.where(parents, np.maximum(error, np.maximum(errors[left], errors[right])), error)
+
+        np.maximum.at(errors, middle, error)
+
+    return errors
+
+
+def rtin_triangles(heights, z_tolerance, errors=None):
+    # faces (m, 3) of grid indices (row * grid_size + col) for a (2^n + 1) height grid
+    grid_size = heights.shape[0]
+    tile_size = grid_size - 1
+    if errors is None:
+        errors = rtin_errors(heights, z_tolerance=z_tolerance)
+
+    valid = ~np.isnan(heights.ravel())
+
+    ax = np.array([0, tile_size]); ay = np.array([0, tile_size])
+    bx = np.array([tile_size, 0]); by = np.array([tile_size, 0])
+    cx = np.array([tile_size, 0]); cy = np.array([0, tile_size])
+
+    faces = []
+    while ax.size:
+        mx, my = (ax + bx) >> 1, (ay + by) >> 1
+        splittable = (np.abs(ax - cx) + np.abs(ay - cy)) > 1
+        split = splittable & (errors[my * grid_size + mx] > z_tolerance)
+
+        done = ~split
+        face = np.stack([ay[done] * grid_size + ax[done],
+                         by[done] * grid_size + bx[done],
+                         cy[done] * grid_size + cx[done]], axis=1)
+        faces.append(face[valid[face].all(axis=1)])
+
+        # children: (c, a, m) and (b, c, m)
+        ax, ay, bx, by, cx, cy = (np.concatenate((cx[split], bx[split])), np.concatenate((cy[split], by[split])),
+                                  np.concatenate((ax[split], cx[split])), np.concatenate((ay[split], cy[split])),
+                                  np.concatenate((mx[split], mx[split])), np.concatenate((my[split], my[split])))
+
+    return np.concatenate(faces) if faces else np.zeros((0, 3), dtype=np.int64)
+
+
+def iter_mesh_tiles(source, z_tolerance=Z_TOLERANCE, tile_size=TILE_SIZE, mask=None):
+    """
+    Triangulates a raster source tile by tile. Yields vertex keys (global cell index
+    row * ncols + col, shared by neighbouring tiles), vertices (n, 3) at cell centers
+    in map units and faces (m, 3) indexing the tile vertices, counter clockwise.
+    Tile borders are split to full resolution so tiles join without cracks.
+    Cells where the optional mask source is NoData are left out.
+    """
+    grid = source.grid
+
+    for row in range(0, max(grid.nrows - 1, 1), tile_size):
+        for col in range(0, max(grid.ncols - 1, 1), tile_size):
+            heights = source.read_native(row, col, tile_size + 1, tile_size + 1)
+            if mask is not None:
+                heights[np.isnan(raster_lib.read_window(mask, grid, row, col, tile_size + 1, tile_size + 1))] = np.nan
+
+            if np.isnan(heights).all():
+                continue
+
+            # split along borders shared with other tiles
+            forced = np.zeros(heights.shape, dtype=bool)
+            if row > 0:
+                forced[0, :] = True
+            if col > 0:
+                forced[:, 0] = True
+            if row + tile_size < grid.nrows - 1:
+                forced[-1, :] = True
+            if col + tile_size < grid.ncols - 1:
+                forced[:, -1] = True
+
+            faces = rtin_triangles(heights, z_tolerance, rtin_errors(heights, forced, z_tolerance))
+            if not faces.size:
+                continue
+
+            used, faces = np.unique(faces, return_inverse=True)
+            faces = faces.reshape(-1, 3)
+
+            rows = row + used // (tile_size + 1)
+            cols = col + used % (tile_size + 1)
+            vertices = np.stack([grid.x_min + (cols + 0.5) * grid.cell_size,
+                                 grid.y_max - (rows + 0.5) * grid.cell_size,
+                                 heights.ravel()[used]], axis=1)
+
+            yield rows * grid.ncols + cols, vertices, orient_faces(vertices, faces)
+
+
+def orient_faces(vertices, faces):
+    # counter clockwise in x / y
+    a, b, c = vertices[faces[:, 0]], vertices[faces[:, 1]], vertices[faces[:, 2]]
+    area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+    faces = faces.copy()
+    flip = area < 0
+    faces[flip] = faces[flip][:, [0, 2, 1]]
+    return faces
+
+
+def merge_tiles(tiles):
+    # one vertex / face array from iter_mesh_tiles output, shared vertices merged
+    keys, vertices, faces = [], [], []
+    offset = 0
+    for tile_keys, tile_vertices, tile_faces in tiles:
+        keys.append(tile_keys)
+        vertices.append(tile_vertices)
+        faces.append(tile_faces + offset)
+        offset += len(tile_keys)
+
+    if not keys:
+        return np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+
+    keys = np.concatenate(keys)
+    unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+    return np.concatenate(vertices)[first], inverse[np.concatenate(faces)]
+
+
+def triangulate(source, z_tolerance=Z_TOLERANCE, tile_size=TILE_SIZE, mask=None):
+    # vertices (n, 3) and faces (m, 3) for a raster source
+    return merge_tiles(iter_mesh_tiles(source, z_tolerance, tile_size, mask))
+
+
+# ----------------------------Decimation---------------------------- #
+# Half edge collapse: a vertex v moves onto its neighbour u and its star is
+# re-triangulated as a fan around u. Targets are ranked by the quadric error of
+# the planes v has absorbed; a collapse is only done if it keeps the surface
+# within the vertical deviation. The old and new surface only differ inside the
+# star, are both piecewise linear there and agree on its border, so their largest
+# difference is at v or where an old spoke (v, w) crosses a new spoke (u, w').
+# Each face carries a bound on its deviation from the input mesh, adding up over
+# collapses. A boundary vertex only moves along the boundary, onto the neighbour
+# that opens its star, and only if every input boundary vertex the new boundary
+# edge replaces is within the horizontal boundary deviation of it; the default 0
+# merges straight runs only, which keeps the flood boundary. Vertices with more
+# than max_valence neighbours are only removed where their star is flat within
+# the deviation.
+
+def _cross(a, b):
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def plane_quadrics(vertices, faces):
+    # (n, 4, 4) sum of the plane quadrics of the faces around every vertex
+    a, b, c = vertices[faces[:, 0]], vertices[faces[:, 1]], vertices[faces[:, 2]]
+    normal = np.cross(b - a, c - a)
+    length = np.linalg.norm(normal, axis=1)
+    normal[length > 0] /= length[length > 0, None]
+    plane = np.concatenate([normal, -(normal * a).sum(axis=1)[:, None]], axis=1)
+    products = (plane[:, :, None] * plane[:, None, :]).reshape(-1, 16)
+
+    corners = faces.ravel()
+    quadrics = np.empty((len(vertices), 16))
+    for i in range(16):
+        quadrics[:, i] = np.bincount(corners, weights=np.repeat(products[:, i], 3), minlength=len(vertices))
+
+    return quadrics.reshape(-1, 4, 4)
+
+
+def _boundary_chains(faces, num_vertices):
+    """
+    Vertices on the boundary with one edge in and one out, in order along the
+    boundary edges (faces run counter clockwise), a closed chain listed twice so
+    any run along it is one slice. Returns the sequence, the position of every
+    such vertex in it and its chain, -1 for other vertices, and the size of every
+    chain and whether it is closed.
+    """
+    directed = faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+    keys = directed[:, 0] * num_vertices + directed[:, 1]
+    edges = directed[~np.isin(keys, directed[:, 1] * num_vertices + directed[:, 0])]
+    regular = ((np.bincount(edges[:, 0], minlength=num_vertices) == 1) &
+               (np.bincount(edges[:, 1], minlength=num_vertices) == 1))
+    edges = edges[regular[edges[:, 0]] & regular[edges[:, 1]]]
+
+    following = np.full(num_vertices, -1, dtype=np.int64)
+    preceding = np.full(num_vertices, -1, dtype=np.int64)
+    following[edges[:, 0]] = edges[:, 1]
+    preceding[edges[:, 1]] = edges[:, 0]
+    following, preceding = following.tolist(), preceding.tolist()
+
+    sequence, sizes, closed = [], [], []
+    position = [-1] * num_vertices
+    chain_of = [-1] * num_vertices
+    for vertex in np.flatnonzero(regular).tolist():
+        if position[vertex] >= 0:
+            continue
+
+        start = vertex
+        while preceding[start] >= 0 and preceding[start] != vertex:
+            start = preceding[start]
+
+        chain = []
+        current = start
+        while current >= 0 and position[current] < 0:
+            position[current] = len(sequence) + len(chain)
+            chain_of[current] = len(sizes)
+            chain.append(current)
+            current = following[current]
+
+        sequence.extend(chain)
+        if current == start:
+            sequence.extend(chain)
+        sizes.append(len(chain))
+        closed.append(current == start)
+
+    return (np.array(sequence, dtype=np.int64), np.array(position, dtype=np.int64),
+            np.array(chain_of, dtype=np.int64), np.array(sizes, dtype=np.int64), np.array(closed, dtype=bool))
+
+
+def _stars(vertices, faces, max_valence, max_deviation, boundary_moves=True):
+    """
+    Removable vertices with their star faces rotated so each row reads (v, a, b),
+    -1 padded. For boundary vertices also the neighbour that opens the star (only
+    in a) and the one that closes it (only in b), -1 for interior vertices.
+    """
+    num_vertices = len(vertices)
+    edges = np.sort(faces[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    keys, edge_count = np.unique(edges[:, 0] * num_vertices + edges[:, 1], return_counts=True)
+    boundary_keys = keys[edge_count == 1]
+    boundary_edges = (np.bincount(boundary_keys // num_vertices, minlength=num_vertices) +
+                      np.bincount(boundary_keys % num_vertices, minlength=num_vertices))
+    manifold = np.ones(num_vertices, dtype=bool)
+    manifold[keys[edge_count > 2] // num_vertices] = False
+    manifold[keys[edge_count > 2] % num_vertices] = False
+
+    # z range of every star, flat stars may have any valence
+    z = vertices[:, 2]
+    low, high = z.copy(), z.copy()
+    np.minimum.at(low, edges[:, 0], z[edges[:, 1]])
+    np.minimum.at(low, edges[:, 1], z[edges[:, 0]])
+    np.maximum.at(high, edges[:, 0], z[edges[:, 1]])
+    np.maximum.at(high, edges[:, 1], z[edges[:, 0]])
+    flat = high - low <= max_deviation
+
+    corners = faces.ravel()
+    valence = np.bincount(corners, minlength=num_vertices)
+    interior = (boundary_edges == 0) & (valence >= 3)
+    boundary = (boundary_edges == 2) & (valence >= 2) & boundary_moves
+    candidates = manifold & (interior | boundary) & ((valence <= max_valence) | flat)
+
+    order = np.argsort(corners, kind="stable")
+    starts = np.cumsum(valence) - valence
+    rank = np.arange(len(order)) - starts[corners[order]]
+    keep = candidates[corners[order]]
+    order, rank = order[keep], rank[keep]
+
+    centers = np.flatnonzero(candidates)
+    row_of = np.full(num_vertices, -1, dtype=np.int64)
+    row_of[centers] = np.arange(len(centers))
+    rows = row_of[corners[order]]
+
+    width = int(valence[centers].max()) if len(centers) else 0
+    star = np.full((len(centers), width), -1, dtype=np.int64)
+    a = np.full((len(centers), width), -1, dtype=np.int64)
+    b = np.full((len(centers), width), -1, dtype=np.int64)
+
+    face, corner = order // 3, order % 3
+    star[rows, rank] = face
+    a[rows, rank] = faces[face, (corner + 1) % 3]
+    b[rows, rank] = faces[face, (corner + 2) % 3]
+
+    # the open ends of boundary stars
+    a_keys = rows * num_vertices + a[rows, rank]
+    b_keys = rows * num_vertices + b[rows, rank]
+    opening = np.full(len(centers), -1, dtype=np.int64)
+    closing = np.full(len(centers), -1, dtype=np.int64)
+    only_a = ~np.isin(a_keys, b_keys)
+    only_b = ~np.isin(b_keys, a_keys)
+    opening[rows[only_a]] = a[rows, rank][only_a]
+    closing[rows[only_b]] = b[rows, rank][only_b]
+
+    return centers, star, a, b, opening, closing
+
+
+def _collapse_errors(vertices, quadrics, face_error, chains, centers, star, a, b, opening, closing,
+                     boundary_deviation):
+    # best target and the deviation bound after collapsing for each star, inf if none is valid
+    valid = star >= 0
+    xy, z = vertices[:, :2], vertices[:, 2]
+    v_xy, v_z = xy[centers], z[centers]
+    on_boundary = closing >= 0
+
+    # quadric cost of every neighbour as target, boundary vertices only move onto the opening neighbour
+    points = np.concatenate([vertices[np.where(valid, a, 0)], np.ones(a.shape + (1,))], axis=2)
+    cost = np.einsum("cki,cij,ckj->ck", points, quadrics[centers], points)
+    cost = np.where(on_boundary[:, None] & (a != opening[:, None]), np.inf, cost)
+
+    # new faces (u, a, b) for every target u (axis 1) and star face (axis 2) must keep their orientation,
+    # at least one face must be left
+    u_xy = xy[np.where(valid, a, 0)][:, :, None, :]
+    a_xy = xy[np.where(valid, a, 0)][:, None, :, :]
+    b_xy = xy[np.where(valid, b, 0)][:, None, :, :]
+    area = _cross(a_xy - u_xy, b_xy - u_xy)
+    scale = ((a_xy - u_xy) ** 2).sum(axis=3) + ((b_xy - u_xy) ** 2).sum(axis=3)
+    removed = (a[:, None, :] == a[:, :, None]) | (b[:, None, :] == a[:, :, None])
+    flipped = valid[:, None, :] & ~removed & (area <= 1e-10 * scale)
+    left = (valid[:, None, :] & ~removed).any(axis=2)
+    cost = np.where(valid & left & ~flipped.any(axis=2), cost, np.inf)
+
+    # the input boundary vertices the new boundary edge (closing, opening) replaces must stay within the
+    # boundary deviation, both ends on the input boundary chains
+    if on_boundary.any():
+        sequence, position, chain_of, sizes, closed = chains
+        rows = np.flatnonzero(on_boundary)
+        first, last = position[closing[rows]], position[opening[rows]]
+        chained = (first >= 0) & (last >= 0) & (opening[rows] != closing[rows])
+        cycle = np.where(closed[chain_of[opening[rows]]], sizes[chain_of[opening[rows]]], 0)
+        chained &= (last > first) | (cycle > 0)
+        cost[rows[~chained]] = np.inf
+        rows, first, last, cycle = rows[chained], first[chained] + 1, last[chained], cycle[chained]
+
+        # runs over the end of a closed chain continue in its second copy
+        last = np.where(last < first, last + cycle, last)
+        run = last > first
+        cost[rows[~run]] = np.inf
+        rows, first, last = rows[run], first[run], last[run]
+
+        lengths = last - first
+        replaced = np.repeat(first - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        start, end = np.repeat(xy[closing[rows]], lengths, axis=0), np.repeat(xy[opening[rows]], lengths, axis=0)
+        point = xy[sequence[replaced]]
+        edge = end - start
+        t = np.clip(((point - start) * edge).sum(axis=1) / np.maximum((edge ** 2).sum(axis=1), 1e-300), 0.0, 1.0)
+        distance = np.hypot(*(point - start - t[:, None] * edge).T)
+        offsets = np.cumsum(lengths) - lengths
+        shift = np.maximum.reduceat(distance, offsets) if len(rows) else np.zeros(0)
+        length = np.hypot(*(xy[opening[rows]] - xy[closing[rows]]).T)
+        cost[rows[shift > boundary_deviation + 1e-9 * length]] = np.inf
+
+    target = np.argmin(cost, axis=1)
+    error = np.full(len(centers), np.inf)
+    possible = np.isfinite(cost[np.arange(len(centers)), target])
+    if not possible.any():
+        return a[:, 0], error
+
+    sel = np.flatnonzero(possible)
+    u = a[sel, target[sel]]
+    a_s, b_s, ok = a[sel], b[sel], valid[sel]
+    u_xy, u_z = xy[u][:, None, :], z[u][:, None]
+    p_xy, q_xy = v_xy[sel][:, None, :], v_z[sel][:, None]
+
+    # new surface at v, from the new face around it
+    new = ok & (a_s != u[:, None]) & (b_s != u[:, None])
+    ea, eb = xy[np.where(ok, a_s, 0)], xy[np.where(ok, b_s, 0)]
+    total = _cross(ea - u_xy, eb - u_xy)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        wu = _cross(ea - p_xy, eb - p_xy) / total
+        wa = _cross(eb - p_xy, u_xy - p_xy) / total
+        wb = 1.0 - wu - wa
+    inside = np.where(new, np.minimum(np.minimum(wu, wa), wb), -np.inf)
+    k = np.argmax(inside, axis=1)
+    r = np.arange(len(sel))
+    z_new = (wu[r, k] * u_z[:, 0] + wa[r, k] * z[np.where(ok, a_s, 0)][r, k] +
+             wb[r, k] * z[np.where(ok, b_s, 0)][r, k])
+    change = np.abs(q_xy[:, 0] - z_new)
+
+    # crossings of new spokes (u, w_k) with old spokes (v, w_l), w the neighbours of v
+    spokes = np.concatenate([a_s, closing[sel][:, None]], axis=1)
+    spoke_ok = np.concatenate([ok, (closing[sel] >= 0)[:, None]], axis=1)
+    spoke_xy, spoke_z = xy[np.where(spoke_ok, spokes, 0)], z[np.where(spoke_ok, spokes, 0)]
+    d1 = (spoke_xy - u_xy)[:, :, None, :]
+    d2 = (spoke_xy - p_xy)[:, None, :, :]
+    offset = (p_xy - u_xy)[:, None, :, :]
+    denom = _cross(d1, d2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = _cross(offset, d2) / denom
+        s = _cross(offset, d1) / denom
+        old = q_xy[:, :, None] + s * (spoke_z[:, None, :] - q_xy[:, :, None])
+        new_z = u_z[:, :, None] + t * (spoke_z[:, :, None] - u_z[:, :, None])
+        difference = np.abs(old - new_z)
+    eps = 1e-9
+    crossing = (spoke_ok[:, :, None] & spoke_ok[:, None, :] & (np.abs(denom) > 0) &
+                (t > eps) & (t < 1 - eps) & (s > eps) & (s < 1 - eps))
+    difference = np.where(crossing, difference, 0.0)
+    change = np.maximum(change, difference.reshape(len(sel), -1).max(axis=1))
+
+    previous = np.where(ok, face_error[np.where(ok, star[sel], 0)], 0.0).max(axis=1)
+    error[sel] = previous + change
+
+    return a[np.arange(len(centers)), target], error
+
+
+def decimate(vertices, faces, max_deviation=MAX_DEVIATION, max_valence=MAX_VALENCE, chunk_size=DECIMATE_CHUNK,
+             boundary_deviation=BOUNDARY_DEVIATION):
+    """
+    Decimates a triangle mesh, e.g. from triangulate, so it stays within
+    max_deviation vertically from the input mesh and its boundary, including the
+    boundary of holes, within boundary_deviation horizontally. A boundary_deviation
+    of None keeps every boundary vertex, e.g. where tiles join. Returns new vertex
+    and face arrays.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    faces = orient_faces(vertices, np.asarray(faces, dtype=np.int64))
+    face_error = np.zeros(len(faces))
+    quadrics = plane_quadrics(vertices, faces)
+    num_vertices = len(vertices)
+    chains = _boundary_chains(faces, num_vertices)
+    remaining = chains[3].copy()
+
+    while len(faces):
+        centers, star, a, b, opening, closing = _stars(vertices, faces, max_valence, max_deviation,
+                                                             boundary_deviation is not None)
+        if not len(centers):
+            break
+
+        # stars of the same valence are evaluated together, fewer at once the larger they are
+        target = np.empty(len(centers), dtype=np.int64)
+        error = np.empty(len(centers))
+        width = (star >= 0).sum(axis=1)
+        for w in np.unique(width):
+            rows = np.flatnonzero(width == w)
+            step = max(chunk_size * MAX_VALENCE ** 2 // int(w) ** 2, 1)
+            for start in range(0, len(rows), step):
+                chunk = rows[start:start + step]
+                target[chunk], error[chunk] = _collapse_errors(
+                    vertices, quadrics, face_error, chains, centers[chunk], star[chunk, :w], a[chunk, :w],
+                    b[chunk, :w], opening[chunk], closing[chunk], boundary_deviation)
+
+        # boundary chains keep 3 vertices when closed and 2 when open, so holes and islands never close
+        chain = chains[2][np.where(closing >= 0, centers, 0)]
+        exhausted = (closing >= 0) & (remaining[chain] <= np.where(chains[4][chain], 3, 2))
+
+        # greedy independent set in order of error, collapsed stars never share a face
+        possible = (error <= max_deviation) & ~exhausted
+        if not possible.any():
+            break
+
+        rank = np.empty(len(centers))
+        order = np.lexsort((centers, error))
+        rank[order] = np.arange(len(order))
+        neighbours = np.concatenate([a, closing[:, None]], axis=1)
+        valid = neighbours >= 0
+
+        collapse = np.zeros(len(centers), dtype=bool)
+        blocked = np.zeros(num_vertices, dtype=bool)
+        while possible.any():
+            priority = np.full(num_vertices, np.inf)
+            priority[centers[possible]] = rank[possible]
+            lowest = np.where(valid, priority[np.where(valid, neighbours, 0)], np.inf).min(axis=1)
+            chosen = possible & (rank < lowest)
+
+            collapse |= chosen
+            blocked[neighbours[chosen][valid[chosen]]] = True
+            blocked[centers[chosen]] = True
+            possible &= ~blocked[centers]
+
+        # as many boundary collapses per chain as it can lose
+        moved = np.flatnonzero(collapse & (closing >= 0))
+        chain = chains[2][centers[moved]]
+        moved, chain = moved[np.lexsort((rank[moved], chain))], np.sort(chain)
+        nth = np.arange(len(chain)) - np.searchsorted(chain, chain)
+        over = nth >= remaining[chain] - np.where(chains[4][chain], 3, 2)
+        collapse[moved[over]] = False
+        np.subtract.at(remaining, chain[~over], 1)
+
+        np.add.at(quadrics, target[collapse], quadrics[centers[collapse]])
+        star_faces = star[collapse]
+        face_error[star_faces[star_faces >= 0]] = np.repeat(error[collapse], (star_faces >= 0).sum(axis=1))
+
+        remap = np.arange(num_vertices)
+        remap[centers[collapse]] = target[collapse]
+        faces = remap[faces]
+        keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])
+        faces, face_error = faces[keep], face_error[keep]
+
+    used, faces = np.unique(faces, return_inverse=True)
+    return vertices[used], faces.reshape(-1, 3)
+
+
+# ----------------------------Mesh export---------------------------- #
+# Writers take the mesh tile by tile: write(vertices, faces, attributes) with faces
+# indexing the tile vertices and attributes an OrderedDict of per vertex arrays.
+# Coordinates are written relative to an origin, rounded to the precision, so the
+# files stay small and single precision readers keep full accuracy. Vertices on
+# tile borders are repeated in each tile.
+
+class ObjWriter(object):
+    """ Wavefront OBJ. OBJ has no vertex attributes: the first two go into vt. """
+
+    def __init__(self, output_file, origin, precision=PRECISION):
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.precision = precision
+        self.decimals = max(int(np.ceil(-np.log10(precision))), 0)
+        self.count = 0
+        self.file = open(output_file, "w")
+        self.file.write("# origin {0} {1} {2}\n".format(*self.origin))
+
+    def write(self, vertices, faces, attributes):
+        values = np.round((vertices - self.origin) / self.precision) * self.precision
+        np.savetxt(self.file, values, fmt="v" + (" %." + str(self.decimals) + "f") * 3)
+
+        if attributes:
+            texture = np.zeros((len(vertices), 2))
+            for i, array in enumerate(list(attributes.values())[:2]):
+                texture[:, i] = array
+            np.savetxt(self.file, texture, fmt="vt %.4f %.4f")
+            np.savetxt(self.file, np.repeat(faces + self.count + 1, 2, axis=1), fmt="f %d/%d %d/%d %d/%d")
+        else:
+            np.savetxt(self.file, faces + self.count + 1, fmt="f %d %d %d")
+
+        self.count += len(vertices)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class PlyWriter(object):
+    """
+    Binary little endian PLY with float attributes. Faces are spooled to a
+    temporary file while the vertices stream in and the element counts are
+    filled in on close.
+    """
+    COUNT_WIDTH = 12
+
+    def __init__(self, output_file, origin, precision=PRECISION):
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.precision = precision
+        self.vertex_count = 0
+        self.face_count = 0
+        self.attributes = None
+        self.file = open(output_file, "wb")
+        self.faces = tempfile.TemporaryFile()
+
+    def _header(self):
+        lines = ["ply", "format binary_little_endian 1.0",
+                 "comment origin {0} {1} {2}".format(*self.origin),
+                 "element vertex " + str(self.vertex_count).zfill(self.COUNT_WIDTH),
+                 "property float x", "property float y", "property float z"]
+        lines += ["property float " + name for name in self.attributes]
+        lines += ["element face " + str(self.face_count).zfill(self.COUNT_WIDTH),
+                  "property list uchar uint vertex_indices", "end_header"]
+        return ("\n".join(lines) + "\n").encode("ascii")
+
+    def write(self, vertices, faces, attributes):
+        if self.attributes is None:
+            self.attributes = list(attributes)
+            self.file.write(self._header())
+
+        values = np.round((vertices - self.origin) / self.precision) * self.precision
+        columns = [values[:, 0], values[:, 1], values[:, 2]] + [attributes[name] for name in self.attributes]
+        self.file.write(np.stack(columns, axis=1).astype("<f4").tobytes())
+
+        records = np.zeros(len(faces), dtype=[("n", "u1"), ("indices", "<u4", 3)])
+        records["n"] = 3
+        records["indices"] = faces + self.vertex_count
+        self.faces.write(records.tobytes())
+
+        self.vertex_count += len(vertices)
+        self.face_count += len(faces)
+
+    def close(self):
+        if self.attributes is None:
+            self.attributes = []
+            self.file.write(self._header())
+
+        self.faces.seek(0)
+        shutil.copyfileobj(self.faces, self.file)
+        self.faces.close()
+
+        # same header length, now with the counts
+        self.file.seek(0)
+        self.file.write(self._header())
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class GltfWriter(object):
+    """
+    glTF 2.0 with a .bin buffer next to the .gltf, one node per tile. Positions
+    are unsigned shorts per tile (KHR_mesh_quantization), the node translation
+    and scale put them back in place relative to the origin. Attributes are
+    float custom attributes (_DEPTH, _ELEVATION, ...).
+    """
+
+    def __init__(self, output_file, origin, precision=PRECISION):
+        self.output_file = output_file
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.precision = precision
+        self.buffer_file = os.path.splitext(output_file)[0] + ".bin"
+        self.buffer = open(self.buffer_file, "wb")
+        self.gltf = OrderedDict([("asset", {"version": "2.0", "generator": "3DFloodImpact"}),
+                                 ("extensionsUsed", ["KHR_mesh_quantization"]),
+                                 ("extensionsRequired", ["KHR_mesh_quantization"]),
+                                 ("scene", 0), ("scenes", [{"nodes": [0]}]),
+                                 ("nodes", [{"name": "flood", "children": [],
+                                             "translation": [float(self.origin[0]), float(self.origin[2]),
+                                                             -float(self.origin[1])],
+                                             "rotation": [-0.7071067811865476, 0.0, 0.0, 0.7071067811865476]}]),
+                                 ("meshes", []), ("accessors", []), ("bufferViews", []), ("buffers", [])])
+
+    def _add(self, array, component_type, accessor_type, target, **extra):
+        # append array to the buffer, 4 byte aligned, returns the accessor index
+        offset = self.buffer.tell()
+        data = array.tobytes()
+        self.buffer.write(data + b"\0" * (-len(data) % 4))
+
+        self.gltf["bufferViews"].append({"buffer": 0, "byteOffset": offset, "byteLength": len(data), "target": target})
+        accessor = {"bufferView": len(self.gltf["bufferViews"]) - 1, "componentType": component_type,
+                    "count": len(array), "type": accessor_type}
+        accessor.update(extra)
+        self.gltf["accessors"].append(accessor)
+        return len(self.gltf["accessors"]) - 1
+
+    def write(self, vertices, faces, attributes):
+        # z up map coordinates relative to the origin, the root node turns them y up
+        local = vertices - self.origin
+        low = np.round(local.min(axis=0) / self.precision) * self.precision
+        step = max(self.precision, float((local - low).max()) / 65535.0)
+        quantized = np.round((local - low) / step).astype("<u2")
+
+        primitive = {"attributes": {}, "mode": 4}
+        primitive["attributes"]["POSITION"] = self._add(quantized, 5123, "VEC3", 34962,
+                                                        min=quantized.min(axis=0).tolist(),
+                                                        max=quantized.max(axis=0).tolist())
+        for name, array in attributes.items():
+            primitive["attributes"]["_" + name.upper()] = self._add(np.asarray(array, dtype="<f4"), 5126, "SCALAR", 34962)
+        primitive["indices"] = self._add(faces.astype("<u4").ravel(), 5125, "SCALAR", 34963)
+
+        self.gltf["meshes"].append({"primitives": [primitive]})
+        self.gltf["nodes"].append({"mesh": len(self.gltf["meshes"]) - 1,
+                                   "translation": low.tolist(), "scale": [step, step, step]})
+        self.gltf["nodes"][0]["children"].append(len(self.gltf["nodes"]) - 1)
+
+    def close(self):
+        self.gltf["buffers"].append({"uri": os.path.basename(self.buffer_file), "byteLength": self.buffer.tell()})
+        self.buffer.close()
+
+        with open(self.output_file, "w") as f:
+            json.dump(self.gltf, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+MESH_WRITERS = {".obj": ObjWriter, ".ply": PlyWriter, ".gltf": GltfWriter}
+
+
+def export_mesh(source, output_file, baseline=0.0, z_tolerance=Z_TOLERANCE, max_deviation=MAX_DEVIATION,
+                tile_size=TILE_SIZE, mask=None, precision=PRECISION):
+    """
+    Streams the triangulated surface of a raster source tile by tile to an .obj,
+    .ply or .gltf file with per vertex depth (elevation minus baseline, a number
+    or a raster source) and elevation. Tiles are decimated on their own; their
+    boundary vertices are kept so they still join. Returns vertex and face counts.
+    """
+    extension = os.path.splitext(output_file)[1].lower()
+    if extension not in MESH_WRITERS:
+        raise ValueError("Unsupported mesh format: " + extension)
+
+    grid = source.grid
+    origin = (grid.x_min, grid.y_max - grid.nrows * grid.cell_size, 0.0)
+    vertex_count = face_count = 0
+
+    with MESH_WRITERS[extension](output_file, origin, precision) as writer:
+        for keys, vertices, faces in iter_mesh_tiles(source, z_tolerance, tile_size, mask):
+            if max_deviation:
+                vertices, faces = decimate(vertices, faces, max_deviation, boundary_deviation=None)
+
+            if isinstance(baseline, (int, float)):
+                base = np.full(len(vertices), float(baseline))
+            else:
+                rows = np.floor((grid.y_max - vertices[:, 1]) / grid.cell_size).astype(np.int64)
+                cols = np.floor((vertices[:, 0] - grid.x_min) / grid.cell_size).astype(np.int64)
+                row, col = rows.min(), cols.min()
+                window = raster_lib.read_window(baseline, grid, row, col, rows.max() - row + 1, cols.max() - col + 1)
+                base = window[rows - row, cols - col]
+
+            attributes = OrderedDict([("depth", vertices[:, 2] - base), ("elevation", vertices[:, 2])])
+            writer.write(vertices, faces, attributes)
+
+            vertex_count += len(vertices)
+            face_count += len(faces)
+
+    return vertex_count, face_count
+
+
+# ----------------------------arcpy bridge---------------------------- #
+
+def face_slopes(vertices, faces):
+    # slope in percent per face
+    a, b, c = vertices[faces[:, 0]], vertices[faces[:, 1]], vertices[faces[:, 2]]
+    normal = np.cross(b - a, c - a)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 100.0 * np.hypot(normal[:, 0], normal[:, 1]) / np.abs(normal[:, 2])
+
+
+def face_components(faces, num_vertices):
+    # connected component of every face, 1..count, faces that share a vertex are connected
+    faces = np.asarray(faces, dtype=np.int64)
+    roots = raster_lib.connect(num_vertices, faces[:, [0, 1]].ravel(), faces[:, [1, 2]].ravel())
+    return np.unique(roots[faces[:, 0]], return_inverse=True)[1].ravel() + 1
+
+
+def write_triangle_features(vertices, faces, output_features, spatial_reference):
+    # 3D polygon feature class with one triangle per feature, the Slope_Pct attribute TinTriangle wrote and the
+    # Component each triangle belongs to, to group them into one multipatch per connected surface
+    if arcpy.Exists(output_features):
+        arcpy.Delete_management(output_features)
+
+    arcpy.CreateFeatureclass_management(os.path.dirname(output_features), os.path.basename(output_features),
+                                        "POLYGON", None, "DISABLED", "ENABLED", spatial_reference)
+    arcpy.AddField_management(output_features, "Slope_Pct", "DOUBLE")
+    arcpy.AddField_management(output_features, "Component", "LONG")
+
+    slopes = face_slopes(vertices, faces)
+    components = face_components(faces, len(vertices))
+
+    with arcpy.da.InsertCursor(output_features, ["SHAPE@", "Slope_Pct", "Component"]) as cursor:
+        # Esri outer rings run clockwise
+        for face, slope, component in zip(faces[:, [0, 2, 1]].tolist(), slopes.tolist(), components.tolist()):
+            points = [arcpy.Point(*vertices[i]) for i in face]
+            points.append(points[0])
+            cursor.insertRow([arcpy.Polygon(arcpy.Array(points), spatial_reference, True), slope, component])
+
+    return output_features
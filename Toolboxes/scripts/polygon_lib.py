@@ -0,0 +1,879 @@
+# -------------------------------------------------------------------------------
+# Name:        polygon_lib
+# Purpose:     NumPy polygon engine: batches of polygon rings as flat coordinate
+#              arrays, corner cutting smoothing of flood boundaries, outlines
+#              of labeled raster components and scanline rasterization.
+#
+# Author:      Gert van Maren
+#
+# Created:     19/10/2026
+# Copyright:   (c) Esri 2026
+# updated:
+# updated:
+# updated:
+
+# Required:    numpy. arcpy only for reading and writing feature classes.
+
+# -------------------------------------------------------------------------------
+
+import os
+from collections import namedtuple
+
+import numpy as np
+
+import raster_lib
+
+try:
+    import arcpy
+except ImportError:  # the ring engines don't need arcpy, e.g. for testing
+    arcpy = None
+
+# Constants
+SMOOTH_ITERATIONS = 3
+DRAPE_CHUNK = 10000     # features densified and draped at a time
+CURVE_ANGLE = 0.02      # radians between the segments replacing a true curve, about one degree
+
+# all rings of a set of polygons: coordinates (n, 2) of every ring after each other,
+# without closing vertex, ring r is xy[offsets[r]:offsets[r + 1]] and part of
+# polygon features[r]. Rings keep the Esri orientation: clockwise outer rings,
+# counter clockwise holes.
+Rings = namedtuple("Rings", ["xy", "offsets", "features"])
+
+# runs of cells of a grid with their centers inside a polygon: cells starts..ends - 1
+# of row rows for feature features, x and z (n, 2) of the boundary crossings at both
+# ends, z None for 2D rings
+Spans = namedtuple("Spans", ["features", "rows", "starts", "ends", "x", "z"])
+
+SURFACE_METHODS = ["LINEAR", "PLANE"]
+
+BURN_ROWS = 512             # rows of the grid burned per band, the unit of work of the process pool
+
+LABEL_GRID = 6              # candidates along each side of the search box per round
+LABEL_ITERATIONS = 5        # rounds, each zooming in on the best candidate
+LABEL_PAIRS = 4000000       # candidate - edge pairs evaluated at a time
+
+
+# ----------------------------Ring functions---------------------------- #
+
+def ring_ids(rings):
+    # ring index of every vertex
+    return np.repeat(np.arange(len(rings.offsets) - 1), np.diff(rings.offsets))
+
+
+def _next_vertex(offsets):
+    # index of the next vertex in the same ring, wrapping around
+    following = np.arange(1, offsets[-1] + 1)
+    following[offsets[1:] - 1] = offsets[:-1]
+    return following
+
+
+def _previous_vertex(offsets):
+    previous = np.arange(-1, offsets[-1] - 1)
+    previous[offsets[:-1]] = offsets[1:] - 1
+    return previous
+
+
+def select_vertices(rings, keep):
+    # rings with only the kept vertices
+    counts = np.bincount(ring_ids(rings)[keep], minlength=len(rings.offsets) - 1)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    return Rings(rings.xy[keep], offsets, rings.features)
+
+
+def select_rings(rings, keep):
+    # rings with only the kept rings
+    counts = np.diff(rings.offsets)
+    offsets = np.concatenate([[0], np.cumsum(counts[keep])]).astype(np.int64)
+    return Rings(rings.xy[np.repeat(keep, counts)], offsets, rings.features[keep])
+
+
+def ring_ranges(rings, axis):
+    # minimum and maximum coordinate of every ring along axis (0 x, 1 y)
+    if not len(rings.features):
+        return np.zeros(0), np.zeros(0)
+    values = rings.xy[:, axis]
+    return np.minimum.reduceat(values, rings.offsets[:-1]), np.maximum.reduceat(values, rings.offsets[:-1])
+
+
+def ring_areas(rings):
+    # signed areas, negative for clockwise rings
+    xy = rings.xy
+    following = xy[_next_vertex(rings.offsets)]
+    cross = xy[:, 0] * following[:, 1] - following[:, 0] * xy[:, 1]
+    return np.bincount(ring_ids(rings), weights=cross, minlength=len(rings.offsets) - 1) / 2.0
+
+
+def remove_collinear(rings):
+    # drops vertices on a straight line between their neighbours, e.g. along raster cell edges
+    xy = rings.xy
+    previous = xy[_previous_vertex(rings.offsets)]
+    following = xy[_next_vertex(rings.offsets)]
+    cross = (xy[:, 0] - previous[:, 0]) * (following[:, 1] - xy[:, 1]) - \
+            (xy[:, 1] - previous[:, 1]) * (following[:, 0] - xy[:, 0])
+    duplicate = (xy == previous).all(axis=1)
+
+    return select_vertices(rings, (cross != 0) & ~duplicate)
+
+
+def shared_vertices(rings):
+    # vertices at the same coordinates as another vertex, of the same or another ring
+    _, inverse, counts = np.unique(rings.xy, axis=0, return_inverse=True, return_counts=True)
+    return counts[inverse.ravel()] > 1
+
+
+def chaikin(rings, iterations=SMOOTH_ITERATIONS):
+    """
+    Chaikin corner cutting on all rings at once: every edge is replaced by points
+    at 1/4 and 3/4 of its length. Each cut stays within a quarter of the edge
+    length from the corner it replaces, so rings that did not cross don't cross
+    afterwards. Cutting a corner where rings touch would, so shared vertices, e.g.
+    where raster outlines meet at a cell corner, are kept between the cuts on
+    either side: the rings still only meet there and holes stay holes.
+    """
+    xy, offsets = rings.xy, rings.offsets
+    for i in range(iterations):
+        current = Rings(xy, offsets, rings.features)
+        following = xy[_next_vertex(offsets)]
+        cuts = np.stack([xy, 0.75 * xy + 0.25 * following, 0.25 * xy + 0.75 * following], axis=1)
+
+        # a shared vertex before its two cuts, two cuts for the others
+        keep = np.ones(cuts.shape[:2], dtype=bool)
+        keep[:, 0] = shared_vertices(current)
+        counts = np.bincount(ring_ids(current), weights=keep.sum(axis=1), minlength=len(offsets) - 1).astype(np.int64)
+        xy = cuts[keep]
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    return Rings(xy, offsets, rings.features)
+
+
+def smooth_rings(rings, iterations=SMOOTH_ITERATIONS):
+    # smooth polygon outlines, e.g. from RasterDomain or RasterToPolygon
+    return chaikin(remove_collinear(rings), iterations)
+
+
+def densify_rings(rings, max_length):
+    # extra vertices at equal spacing on every edge longer than max_length, like Densify DISTANCE
+    xy, offsets = rings.xy, rings.offsets
+    following = xy[_next_vertex(offsets)]
+    lengths = np.hypot(following[:, 0] - xy[:, 0], following[:, 1] - xy[:, 1])
+    pieces = np.maximum(np.ceil(lengths / max_length - 1e-9), 1).astype(np.int64)
+
+    edge = np.repeat(np.arange(len(xy)), pieces)
+    fraction = (np.arange(pieces.sum()) - np.repeat(np.cumsum(pieces) - pieces, pieces)) / pieces[edge]
+    dense = xy[edge] + fraction[:, None] * (following[edge] - xy[edge])
+
+    counts = np.bincount(ring_ids(rings), weights=pieces, minlength=len(offsets) - 1).astype(np.int64)
+    return Rings(dense, np.concatenate([[0], np.cumsum(counts)]), rings.features)
+
+
+def fill_ring_gaps(rings, z):
+    """
+    Fills NaN z values along each ring, linear between the nearest valid vertices
+    on both sides. Rings without any valid z get the mean of the other rings of
+    their feature, NaN remains only for features without any valid z.
+    """
+    z = np.array(z, dtype=np.float64)
+    ids = ring_ids(rings)
+    missing = np.isnan(z)
+
+    for r in np.unique(ids[missing]).tolist():
+        start, end = rings.offsets[r], rings.offsets[r + 1]
+        ring_z = z[start:end]
+        valid = np.flatnonzero(~np.isnan(ring_z))
+        if len(valid):
+            ring_z[np.isnan(ring_z)] = np.interp(np.flatnonzero(np.isnan(ring_z)), valid, ring_z[valid],
+                                                 period=end - start)
+
+    missing = np.isnan(z)
+    if missing.any():
+        features = rings.features[ids]
+        total = np.bincount(features[~missing], weights=z[~missing], minlength=features.max() + 1)
+        count = np.bincount(features[~missing], minlength=features.max() + 1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            z[missing] = (total / count)[features[missing]]
+
+    return z
+
+
+def drape_rings(rings, surface, max_length=None):
+    # densified rings and z sampled bilinear from a raster_lib source for all vertices at once
+    if max_length:
+        rings = densify_rings(rings, max_length)
+
+    return rings, fill_ring_gaps(rings, raster_lib.sample_bilinear(surface, rings.xy[:, 0], rings.xy[:, 1]))
+
+
+# ----------------------------Raster outlines---------------------------- #
+
+# boundary edge directions, clockwise: east, south, west, north as (row, col) steps
+EDGE_STEPS = np.array([[0, 1], [1, 0], [0, -1], [-1, 0]])
+
+
+def _boundary_edges(labels):
+    # cell edges between a labeled cell and a cell with another label, with the cell on the right
+    nrows, ncols = labels.shape
+    padded = np.zeros((nrows + 2, ncols + 2), dtype=labels.dtype)
+    padded[1:-1, 1:-1] = labels
+    inside = padded[1:-1, 1:-1]
+
+    # start corner (row, col) of the edge of a cell in each direction
+    neighbours = [padded[:-2, 1:-1], padded[1:-1, 2:], padded[2:, 1:-1], padded[1:-1, :-2]]
+    corners = [(0, 0), (0, 1), (1, 1), (1, 0)]
+
+    starts, edge_labels, directions = [], [], []
+    for direction, (neighbour, corner) in enumerate(zip(neighbours, corners)):
+        rows, cols = np.nonzero((inside > 0) & (neighbour != inside))
+        starts.append(np.stack([rows + corner[0], cols + corner[1]], axis=1))
+        edge_labels.append(inside[rows, cols])
+        directions.append(np.full(len(rows), direction))
+
+    return np.concatenate(starts), np.concatenate(edge_labels).astype(np.int64), np.concatenate(directions)
+
+
+def _cycle_order(successor):
+    # cycle of every node of a permutation (its smallest node) and its distance from that node
+    n = len(successor)
+    cycle = np.arange(n)
+    jump = successor.copy()
+    for i in range(int(np.ceil(np.log2(max(n, 2)))) + 1):
+        cycle = np.minimum(cycle, cycle[jump])
+        jump = jump[jump]
+
+    # break the cycles before their first node and rank the nodes from the end
+    following = np.where(successor == cycle, -1, successor)
+    remaining = (following >= 0).astype(np.int64)
+    linked = np.flatnonzero(following >= 0)
+    while len(linked):
+        remaining[linked] += remaining[following[linked]]
+        following[linked] = following[following[linked]]
+        linked = linked[following[linked] >= 0]
+
+    return cycle, remaining
+
+
+def trace_rings(labels, grid):
+    """
+    Outlines of labeled raster components as Rings, features are the labels.
+    Every boundary cell edge is linked to the next one around its component;
+    where two cells of a component only share a corner the trace turns right, so
+    components are 4-connected like RasterToPolygon. Outer rings are clockwise,
+    holes counter clockwise, collinear vertices along the cell edges are removed.
+    """
+    nrows, ncols = labels.shape
+    starts, edge_labels, directions = _boundary_edges(labels)
+    if not len(starts):
+        return Rings(np.zeros((0, 2)), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+    corners = (nrows + 1) * (ncols + 1)
+    ends = starts + EDGE_STEPS[directions]
+    start_keys = edge_labels * corners + starts[:, 0] * (ncols + 1) + starts[:, 1]
+    end_keys = edge_labels * corners + ends[:, 0] * (ncols + 1) + ends[:, 1]
+
+    # the edge leaving the end corner, two at a corner shared diagonally: take the right turn
+    order = np.argsort(start_keys, kind="stable")
+    sorted_keys = start_keys[order]
+    first = np.searchsorted(sorted_keys, end_keys, side="left")
+    successor = order[first]
+    pinched = np.searchsorted(sorted_keys, end_keys, side="right") - first > 1
+    if pinched.any():
+        other = order[first[pinched] + 1]
+        right_turn = directions[other] == (directions[pinched] + 1) % 4
+        successor[pinched] = np.where(right_turn, other, successor[pinched])
+
+    cycle, remaining = _cycle_order(successor)
+    sequence = np.lexsort((-remaining, cycle, edge_labels[cycle]))
+    ring_starts = np.flatnonzero(np.r_[True, cycle[sequence][1:] != cycle[sequence][:-1]])
+    offsets = np.concatenate([ring_starts, [len(sequence)]]).astype(np.int64)
+
+    corner = starts[sequence]
+    xy = np.stack([grid.x_min + corner[:, 1] * grid.cell_size, grid.y_max - corner[:, 0] * grid.cell_size], axis=1)
+
+    return remove_collinear(Rings(xy, offsets, edge_labels[sequence][ring_starts]))
+
+
+# ----------------------------Rasterization---------------------------- #
+
+def scanline_spans(rings, grid, z=None):
+    """
+    Scanline rasterization of all rings at once (CELL_CENTER): the edges crossing
+    every row center are found with the half-open rule, sorted per feature and
+    row, and paired even-odd into spans, so holes and multipart polygons need
+    no special cases. With z per vertex the z of the crossings is kept as well.
+    """
+    xy, offsets = rings.xy, rings.offsets
+    following = _next_vertex(offsets)
+    x0, y0 = xy[:, 0], xy[:, 1]
+    x1, y1 = xy[following, 0], xy[following, 1]
+    features = rings.features[ring_ids(rings)]
+
+    # rows with their center in [min y, max y) of each edge
+    first = np.floor((grid.y_max - np.maximum(y0, y1)) / grid.cell_size - 0.5).astype(np.int64) + 1
+    last = np.floor((grid.y_max - np.minimum(y0, y1)) / grid.cell_size - 0.5).astype(np.int64)
+    first, last = np.maximum(first, 0), np.minimum(last, grid.nrows - 1)
+    counts = np.maximum(last - first + 1, 0)
+
+    edge = np.repeat(np.arange(len(xy)), counts)
+    rows = first[edge] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    t = (grid.y_max - (rows + 0.5) * grid.cell_size - y0[edge]) / (y1[edge] - y0[edge])
+    x = x0[edge] + t * (x1[edge] - x0[edge])
+
+    order = np.lexsort((x, rows, features[edge]))
+    x = x[order].reshape(-1, 2)
+    rows = rows[order][::2]
+    span_features = features[edge][order][::2]
+    span_z = None
+    if z is not None:
+        z = np.asarray(z, dtype=np.float64)
+        span_z = (z[edge] + t * (z[following][edge] - z[edge]))[order].reshape(-1, 2)
+
+    # cells with their center in [x start, x end)
+    starts = np.clip(np.ceil((x[:, 0] - grid.x_min) / grid.cell_size - 0.5), 0, grid.ncols).astype(np.int64)
+    ends = np.clip(np.ceil((x[:, 1] - grid.x_min) / grid.cell_size - 0.5), 0, grid.ncols).astype(np.int64)
+    keep = ends > starts
+
+    return Spans(span_features[keep], rows[keep], starts[keep], ends[keep], x[keep],
+                 span_z[keep] if span_z is not None else None)
+
+
+def span_cells(spans, grid):
+    # feature, row, col of every cell of the spans and z interpolated between the crossings (None for 2D)
+    counts = spans.ends - spans.starts
+    span = np.repeat(np.arange(len(counts)), counts)
+    cols = spans.starts[span] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    z = None
+    if spans.z is not None:
+        x = grid.x_min + (cols + 0.5) * grid.cell_size
+        width = spans.x[span, 1] - spans.x[span, 0]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = np.where(width > 0, (x - spans.x[span, 0]) / width, 0.5)
+        z = spans.z[span, 0] + t * (spans.z[span, 1] - spans.z[span, 0])
+
+    return spans.features[span], spans.rows[span], cols, z
+
+
+def fit_planes(rings, z):
+    """
+    Least squares plane z = a + b (x - cx) + c (y - cy) through the vertices of
+    each feature, around the vertex mean (cx, cy). Returns an (n, 5) array of
+    a, b, c, cx, cy by feature index, level planes at the mean z where the
+    vertices are (nearly) collinear.
+    """
+    features = rings.features[ring_ids(rings)]
+    n = int(features.max()) + 1 if len(features) else 0
+    count = np.bincount(features, minlength=n).astype(np.float64)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        center = np.stack([np.bincount(features, weights=rings.xy[:, i], minlength=n) / count for i in (0, 1)],
+                          axis=1)
+        mean_z = np.bincount(features, weights=z, minlength=n) / count
+    dx = rings.xy[:, 0] - center[features, 0]
+    dy = rings.xy[:, 1] - center[features, 1]
+    dz = z - mean_z[features]
+
+    def total(values):
+        return np.bincount(features, weights=values, minlength=n)
+
+    normal = np.stack([total(dx * dx), total(dx * dy), total(dx * dy), total(dy * dy)], axis=1).reshape(-1, 2, 2)
+    right = np.stack([total(dx * dz), total(dy * dz)], axis=1)
+    determinant = normal[:, 0, 0] * normal[:, 1, 1] - normal[:, 0, 1] * normal[:, 1, 0]
+    scale = (normal[:, 0, 0] + normal[:, 1, 1]) ** 2
+
+    slopes = np.zeros((n, 2))
+    solvable = determinant > 1e-9 * scale
+    if solvable.any():
+        slopes[solvable] = np.linalg.solve(normal[solvable], right[solvable][:, :, None])[:, :, 0]
+
+    return np.column_stack([mean_z, slopes, center])
+
+
+def rasterize_surface(rings, z, grid, method="LINEAR"):
+    """
+    Cells of grid with their center inside the polygons and the z of the polygon
+    surface there: LINEAR interpolates between the boundary crossings along each
+    row, exact for planar polygons and close to a TIN of the outline otherwise;
+    PLANE uses the least squares plane through the vertices of each feature.
+    Returns feature, row, col and z per cell.
+    """
+    spans = scanline_spans(rings, grid, z if method == "LINEAR" else None)
+    features, rows, cols, cell_z = span_cells(spans, grid)
+
+    if method == "PLANE":
+        plane = fit_planes(rings, np.asarray(z, dtype=np.float64))[features]
+        x = grid.x_min + (cols + 0.5) * grid.cell_size
+        y = grid.y_max - (rows + 0.5) * grid.cell_size
+        cell_z = plane[:, 0] + plane[:, 1] * (x - plane[:, 3]) + plane[:, 2] * (y - plane[:, 4])
+
+    return features, rows, cols, cell_z
+
+
+# ----------------------------Burning---------------------------- #
+# PolygonToRaster with CELL_CENTER assignment: a cell gets the value of the feature
+# covering its center. Where features overlap the one with the highest priority
+# wins, and among equal priorities (or without them) the last feature, in row bands
+# of BURN_ROWS rows that are burned independently, optionally in a process pool.
+
+def burn_cells(rings, grid, priority=None):
+    """
+    Cells of grid with their center inside the features, one feature per cell
+    after the priority rules. priority is a value per feature index. Returns
+    row, col and feature per cell.
+    """
+    features, rows, cols, z = span_cells(scanline_spans(rings, grid), grid)
+    cells = rows * grid.ncols + cols
+
+    if priority is None:
+        order = np.lexsort((features, cells))
+    else:
+        order = np.lexsort((features, np.asarray(priority)[features], cells))
+    cells, features = cells[order], features[order]
+    last = np.ones(len(cells), dtype=bool)
+    last[:-1] = cells[1:] != cells[:-1]
+
+    return cells[last] // grid.ncols, cells[last] % grid.ncols, features[last]
+
+
+def burn_band(rings, values, grid, priority=None, fill=np.nan):
+    # array of grid with the value of each feature burned in, fill elsewhere
+    values = np.asarray(values)
+    band = np.full((grid.nrows, grid.ncols), fill, dtype=values.dtype)
+    rows, cols, features = burn_cells(rings, grid, priority)
+    band[rows, cols] = values[features]
+    return band
+
+
+def _burn_job(job):
+    # pool worker: one row band
+    row, rings, values, grid, priority, fill = job
+    return row, burn_band(rings, values, grid, priority, fill)
+
+
+def _band_jobs(rings, values, grid, priority, fill, band_rows):
+    # the rings crossing each band, with the features renumbered within the band in the same order
+    y_min, y_max = ring_ranges(rings, 1)
+
+    for row in range(0, grid.nrows, band_rows):
+        nrows = min(band_rows, grid.nrows - row)
+        band_grid = raster_lib.block_grid(grid, row, 0, nrows, grid.ncols)
+        band_y_min, band_y_max = raster_lib.grid_extent(band_grid)[1::2]
+
+        keep = (y_max >= band_y_min) & (y_min <= band_y_max)
+        if not keep.any():
+            continue
+
+        band_rings = select_rings(rings, keep)
+        features, local = np.unique(band_rings.features, return_inverse=True)
+        band_rings = Rings(band_rings.xy, band_rings.offsets, local.reshape(-1))
+        band_priority = None if priority is None else priority[features]
+
+        yield row, band_rings, values[features], band_grid, band_priority, fill
+
+
+def burn_polygons(rings, values, grid, priority=None, fill=np.nan, out=None, band_rows=BURN_ROWS, processes=1):
+    """
+    Burns a value per feature index, e.g. a flood elevation or a zone ID, into
+    grid with the CELL_CENTER and priority rules, holes and multipart features
+    included. Bands of band_rows rows only see the rings crossing them and are
+    burned in processes processes (None for one per core but one). out is an
+    array of the grid to burn into, e.g. a memory mapped file, created with the
+    dtype of values and filled with fill by default. Returns out.
+    """
+    values = np.asarray(values)
+    if priority is not None:
+        priority = np.asarray(priority)
+    if out is None:
+        out = np.full((grid.nrows, grid.ncols), fill, dtype=values.dtype)
+
+    jobs = _band_jobs(rings, values, grid, priority, fill, band_rows)
+    processes = raster_lib.pool_size(processes, -(-grid.nrows // band_rows))
+    if processes > 1:
+        pool = raster_lib.process_pool(processes)
+        try:
+            for row, band in pool.imap_unordered(_burn_job, jobs):
+                out[row:row + len(band)] = band
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for job in jobs:
+            row, band = _burn_job(job)
+            out[row:row + len(band)] = band
+
+    return out
+
+
+# ----------------------------Label points---------------------------- #
+
+def _feature_edges(rings):
+    # edges grouped by feature: start and end points, and offsets of each feature's edges
+    features = rings.features[ring_ids(rings)]
+    order = np.argsort(features, kind="stable")
+    start = rings.xy[order]
+    end = rings.xy[_next_vertex(rings.offsets)][order]
+    n = int(features.max()) + 1 if len(features) else 0
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(features, minlength=n))])
+    return start, end, offsets
+
+
+def _signed_distances(points, point_features, edges, chunk_pairs=LABEL_PAIRS):
+    # distance of each point to the boundary of its feature, negative outside (even-odd rule)
+    start, end, offsets = edges
+    counts = offsets[point_features + 1] - offsets[point_features]
+    distances = np.full(len(points), np.inf)
+    inside = np.zeros(len(points), dtype=np.int64)
+
+    # points in chunks so the candidate - edge pairs fit in memory
+    pairs = np.concatenate([[0], np.cumsum(counts)])
+    first = 0
+    while first < len(points):
+        last = max(int(np.searchsorted(pairs, pairs[first] + chunk_pairs, side="right")) - 1, first + 1)
+        chunk_counts = counts[first:last]
+        point = np.repeat(np.arange(first, last), chunk_counts)
+        edge = np.repeat(offsets[point_features[first:last]], chunk_counts) + \
+            np.arange(chunk_counts.sum()) - np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+
+        px, py = points[point, 0], points[point, 1]
+        ax, ay = start[edge, 0], start[edge, 1]
+        bx, by = end[edge, 0], end[edge, 1]
+        dx, dy = bx - ax, by - ay
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = np.clip(((px - ax) * dx + (py - ay) * dy) / (dx * dx + dy * dy), 0, 1)
+            t[np.isnan(t)] = 0
+            crosses = ((ay > py) != (by > py)) & (px < ax + (py - ay) * dx / (by - ay))
+        # the pairs of a point are contiguous
+        has_edges = chunk_counts > 0
+        starts = (np.cumsum(chunk_counts) - chunk_counts)[has_edges]
+        squared = (ax + t * dx - px) ** 2 + (ay + t * dy - py) ** 2
+        distances[first:last][has_edges] = np.sqrt(np.minimum.reduceat(squared, starts))
+        inside[first:last] += np.bincount(point[crosses] - first, minlength=last - first)
+        first = last
+
+    return np.where(inside % 2 == 1, distances, -distances)
+
+
+def _widest_span_midpoints(rings, count):
+    # middle of the widest inside span on the horizontal line through the middle of each feature's extent
+    features = rings.features[ring_ids(rings)]
+    y_min = np.full(count, np.inf)
+    y_max = np.full(count, -np.inf)
+    np.minimum.at(y_min, features, rings.xy[:, 1])
+    np.maximum.at(y_max, features, rings.xy[:, 1])
+
+    following = rings.xy[_next_vertex(rings.offsets)]
+    with np.errstate(invalid="ignore"):
+        middle = (y_min + y_max) / 2
+    y = middle[features]
+    y0, y1 = rings.xy[:, 1], following[:, 1]
+    crossing = (y0 > y) != (y1 > y)
+    x = rings.xy[crossing, 0] + (y[crossing] - y0[crossing]) * (following[crossing, 0] - rings.xy[crossing, 0]) / \
+        (y1[crossing] - y0[crossing])
+    crossing_features = features[crossing]
+
+    order = np.lexsort((x, crossing_features))
+    x, crossing_features = x[order].reshape(-1, 2), crossing_features[order][::2]
+    width = x[:, 1] - x[:, 0]
+
+    points = np.full((count, 2), np.nan)
+    widest = np.full(count, -1.0)
+    np.maximum.at(widest, crossing_features, width)
+    best = width == widest[crossing_features]
+    points[crossing_features[best], 0] = x[best].mean(axis=1)
+    points[:, 1] = np.where(widest >= 0, middle, np.nan)
+    return points
+
+
+def label_points(rings, count, grid_size=LABEL_GRID, iterations=LABEL_ITERATIONS):
+    """
+    Label points inside the polygons of count features, close to their pole of
+    inaccessibility (the inside point farthest from the boundary), all features
+    at once: a grid of candidates over each feature's extent is scored by its
+    signed distance to the boundary, then every round a finer grid around the
+    best candidate. The middle of the widest span through the feature is always
+    a candidate, so the point is inside even for thin or ring shaped polygons.
+    NaN for features without rings.
+    """
+    features = rings.features[ring_ids(rings)]
+    edges = _feature_edges(rings)
+    present = np.flatnonzero(np.bincount(features, minlength=count) > 0)
+
+    low = np.full((count, 2), np.inf)
+    high = np.full((count, 2), -np.inf)
+    for axis in (0, 1):
+        np.minimum.at(low[:, axis], features, rings.xy[:, axis])
+        np.maximum.at(high[:, axis], features, rings.xy[:, axis])
+
+    best = _widest_span_midpoints(rings, count)
+    usable = present[~np.isnan(best[present, 0])]
+    score = np.full(count, -np.inf)
+    score[usable] = _signed_distances(best[usable], usable, edges)
+
+    with np.errstate(invalid="ignore"):
+        center = (low + high) / 2
+        half = (high - low) / 2
+    steps = (np.arange(grid_size) + 0.5) / grid_size * 2 - 1
+    offsets = np.stack(np.meshgrid(steps, steps), axis=-1).reshape(-1, 2)
+
+    for i in range(iterations):
+        candidate_features = np.repeat(present, len(offsets))
+        candidates = center[candidate_features] + np.tile(offsets, (len(present), 1)) * half[candidate_features]
+        scores = _signed_distances(candidates, candidate_features, edges)
+
+        # best candidate per feature, the zoom box is centered there
+        order = np.lexsort((-scores, candidate_features))
+        first = order[np.r_[True, candidate_features[order][1:] != candidate_features[order][:-1]]]
+        center[present] = candidates[first]
+        better = scores[first] > score[present]
+        best[present[better]] = candidates[first][better]
+        score[present[better]] = scores[first][better]
+        half = half / (grid_size / 2.0)
+
+    return best
+
+
+# ----------------------------arcpy bridge---------------------------- #
+
+def read_rings(input_features, with_z=False):
+    # rings of all polygons in a feature class, features are the feature indices; with_z also returns z per vertex.
+    # True curves (arcs, Bezier curves) are densified, the rings would only have their end points otherwise
+    xy, z, counts, features = [], [], [], []
+
+    with arcpy.da.SearchCursor(input_features, ["SHAPE@"]) as cursor:
+        for feature, row in enumerate(cursor):
+            shape = row[0]
+            if shape is None:
+                continue
+
+            if shape.hasCurves:
+                shape = shape.densify("ANGLE", shape.length, CURVE_ANGLE)
+
+            for part in shape:
+                ring = []
+                # interior rings are separated by a None point
+                for point in list(part) + [None]:
+                    if point is None:
+                        if len(ring) > 1 and ring[0][:2] == ring[-1][:2]:
+                            ring.pop()
+                        if len(ring) >= 3:
+                            xy.extend(vertex[:2] for vertex in ring)
+                            z.extend(vertex[2] for vertex in ring)
+                            counts.append(len(ring))
+                            features.append(feature)
+                        ring = []
+                    else:
+                        ring.append((point.X, point.Y, point.Z))
+
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    rings = Rings(np.array(xy, dtype=np.float64).reshape(-1, 2), offsets, np.array(features, dtype=np.int64))
+    if with_z:
+        return rings, np.array([np.nan if value is None else value for value in z], dtype=np.float64)
+    return rings
+
+
+def _polygon(rings, group, spatial_reference, z=None):
+    # polygon of the rings in group, 3D with z per vertex
+    parts = arcpy.Array()
+    for r in group.tolist():
+        start, end = rings.offsets[r], rings.offsets[r + 1]
+        if end - start < 3:
+            continue
+        if z is None:
+            points = [arcpy.Point(x, y) for x, y in rings.xy[start:end].tolist()]
+        else:
+            points = [arcpy.Point(x, y, vertex_z) for (x, y), vertex_z in zip(rings.xy[start:end].tolist(),
+                                                                                z[start:end].tolist())]
+        parts.add(arcpy.Array(points + [points[0]]))
+
+    if parts.count:
+        return arcpy.Polygon(parts, spatial_reference, z is not None)
+    return None
+
+
+def _feature_groups(features):
+    # ring indices per feature
+    order = np.argsort(features, kind="stable")
+    groups = np.split(order, np.flatnonzero(np.diff(features[order])) + 1)
+    return [(int(features[group[0]]), group) for group in groups if len(group)]
+
+
+def write_rings(rings, output_features, spatial_reference, z=None):
+    # one polygon per feature index, with z a 3D feature class
+    if arcpy.Exists(output_features):
+        arcpy.Delete_management(output_features)
+
+    arcpy.CreateFeatureclass_management(os.path.dirname(output_features), os.path.basename(output_features),
+                                        "POLYGON", None, "DISABLED", "ENABLED" if z is not None else "DISABLED",
+                                        spatial_reference)
+
+    with arcpy.da.InsertCursor(output_features, ["SHAPE@"]) as cursor:
+        for feature, group in _feature_groups(rings.features):
+            polygon = _polygon(rings, group, spatial_reference, z)
+            if polygon:
+                cursor.insertRow([polygon])
+
+    return output_features
+
+
+def write_label_points(input_features, output_features, z_field=None, columns=None):
+    """
+    3D label points of polygon features with their attributes, in one insert:
+    label_points instead of FeatureToPoint INSIDE, z from z_field (0 without)
+    instead of FeatureTo3DByAttribute. columns maps extra field names to (field
+    type, values per feature), e.g. a unit per feature.
+    """
+    rings = read_rings(input_features)
+    count = int(arcpy.GetCount_management(input_features).getOutput(0))
+    points = label_points(rings, count)
+
+    if arcpy.Exists(output_features):
+        arcpy.Delete_management(output_features)
+
+    spatial_reference = arcpy.Describe(input_features).spatialReference
+    arcpy.CreateFeatureclass_management(os.path.dirname(output_features), os.path.basename(output_features),
+                                        "POINT", input_features, "DISABLED", "ENABLED", spatial_reference)
+
+    columns = columns or {}
+    for name, (field_type, values) in columns.items():
+        if not arcpy.ListFields(output_features, name):
+            arcpy.AddField_management(output_features, name, field_type)
+
+    input_names = [field.name.upper() for field in arcpy.ListFields(input_features)]
+    fields = [field.name for field in arcpy.ListFields(output_features)
+              if field.editable and field.type not in ("OID", "Geometry") and field.name.upper() in input_names and
+              field.name not in columns]
+    z_index = [name.upper() for name in fields].index(z_field.upper()) if z_field else None
+    extra = list(columns.keys())
+
+    with arcpy.da.SearchCursor(input_features, fields) as search, \
+            arcpy.da.InsertCursor(output_features, ["SHAPE@XYZ"] + fields + extra) as insert:
+        for feature, row in enumerate(search):
+            x, y = points[feature]
+            if np.isnan(x):
+                continue
+            z = row[z_index] if z_index is not None and row[z_index] is not None else 0.0
+            insert.insertRow([(x, y, z)] + list(row) + [columns[name][1][feature] for name in extra])
+
+    return output_features
+
+
+def drape_polygons(input_features, output_features, surface, max_length=None, chunk_size=DRAPE_CHUNK):
+    """
+    Densify and InterpolateShape (BILINEAR, VERTICES_ONLY) in one: copies the
+    polygons with their attributes to a 3D output_features and replaces the
+    shapes by the densified rings draped on surface (raster path or raster_lib
+    source), chunk_size features at a time. NoData is filled along the rings,
+    features without any z on the surface are dropped.
+    """
+    if isinstance(surface, str):
+        surface = raster_lib.RasterSource(surface)
+
+    if arcpy.Exists(output_features):
+        arcpy.Delete_management(output_features)
+
+    z_flag = arcpy.env.outputZFlag
+    arcpy.env.outputZFlag = "Enabled"
+    try:
+        arcpy.CopyFeatures_management(input_features, output_features)
+    finally:
+        arcpy.env.outputZFlag = z_flag
+
+    spatial_reference = arcpy.Describe(output_features).spatialReference
+    rings = read_rings(output_features)
+
+    shapes = {}
+    with arcpy.da.UpdateCursor(output_features, ["SHAPE@"]) as cursor:
+        for feature, row in enumerate(cursor):
+            if feature % chunk_size == 0:
+                # drape the next chunk of features
+                chunk = select_rings(rings, (rings.features >= feature) & (rings.features < feature + chunk_size))
+                shapes = {}
+                if len(chunk.features):
+                    chunk, z = drape_rings(chunk, surface, max_length)
+                    for chunk_feature, group in _feature_groups(chunk.features):
+                        if not np.isnan(z[chunk.offsets[group[0]]]):
+                            shapes[chunk_feature] = _polygon(chunk, group, spatial_reference, z)
+
+            if shapes.get(feature):
+                cursor.updateRow([shapes[feature]])
+            else:
+                cursor.deleteRow()
+
+    return output_features
+
+
+def feature_grid(input_features, cell_size, snap_raster=None):
+    # grid over the extent of the features, snapped to snap_raster (default the snapRaster environment)
+    extent = arcpy.Describe(input_features).extent
+    if snap_raster is None:
+        snap_raster = arcpy.env.snapRaster
+    snap_grid = raster_lib.get_raster_grid(snap_raster) if snap_raster else None
+
+    return raster_lib.grid_for_extent(extent.XMin, extent.YMin, extent.XMax, extent.YMax, cell_size, snap_grid)
+
+
+def polygon_mask(input_features, grid):
+    # source on grid with 1 in the cells whose center is inside the polygons and NoData elsewhere, e.g. a mask
+    rings = read_rings(input_features)
+    count = int(rings.features.max()) + 1 if len(rings.features) else 0
+    return raster_lib.ArraySource(burn_polygons(rings, np.ones(count, dtype=np.float32), grid), grid)
+
+
+def polygons_to_raster(input_features, value_field, output_raster, cell_size, priority_field=None,
+                       processes=1, spatial_reference=None):
+    """
+    PolygonToRaster (CELL_CENTER) on burn_polygons. A numeric value_field gives
+    a float raster, NULL as NoData. An integer or text value_field gives an
+    integer zone raster whose attribute table carries value_field, like the
+    PolygonToRaster output used as zones in ZonalStatisticsAsTable; text values
+    are numbered 1..n in sorted order.
+    """
+    field = arcpy.ListFields(input_features, value_field)[0]
+    fields = [value_field] + ([priority_field] if priority_field else [])
+    with arcpy.da.SearchCursor(input_features, fields) as cursor:
+        rows = [row for row in cursor]
+
+    priority = None
+    if priority_field:
+        priority = np.array([row[1] if row[1] is not None else 0 for row in rows], dtype=np.float64)
+
+    if spatial_reference is None:
+        spatial_reference = arcpy.Describe(input_features).spatialReference
+    grid = feature_grid(input_features, cell_size)
+    rings = read_rings(input_features)
+
+    if arcpy.Exists(output_raster):
+        arcpy.Delete_management(output_raster)
+
+    if field.type in ("Double", "Single"):
+        values = np.array([np.nan if row[0] is None else row[0] for row in rows], dtype=np.float64)
+        burned = burn_polygons(rings, values, grid, priority, np.nan, processes=processes)
+        return raster_lib.array_to_raster(burned, grid, output_raster, spatial_reference)
+
+    if field.type == "String":
+        names = sorted(set(row[0] for row in rows if row[0] is not None))
+        codes = dict((name, i + 1) for i, name in enumerate(names))
+        values = np.array([codes.get(row[0], raster_lib.NODATA_INT) for row in rows], dtype=np.int32)
+        zones = dict((i + 1, name) for i, name in enumerate(names))
+    else:
+        values = np.array([raster_lib.NODATA_INT if row[0] is None else row[0] for row in rows], dtype=np.int32)
+        zones = None
+
+    burned = burn_polygons(rings, values, grid, priority, raster_lib.NODATA_INT, processes=processes)
+    raster_lib.int_array_to_raster(burned, grid, output_raster, spatial_reference)
+
+    # zone field in the attribute table
+    arcpy.BuildRasterAttributeTable_management(output_raster, "Overwrite")
+    if not arcpy.ListFields(output_raster, value_field):
+        arcpy.AddField_management(output_raster, value_field, "TEXT" if zones else "LONG", field_length=field.length)
+    with arcpy.da.UpdateCursor(output_raster, ["Value", value_field]) as cursor:
+        for row in cursor:
+            cursor.updateRow([row[0], zones[row[0]] if zones else row[0]])
+
+    return output_raster
+
+
+def smooth_polygons(input_features, output_features, iterations=SMOOTH_ITERATIONS, spatial_reference=None):
+    # NumPy replacement for SmoothPolygon on flood outlines
+    if spatial_reference is None:
+        spatial_reference = arcpy.Describe(input_features).spatialReference
+
+    return write_rings(smooth_rings(read_rings(input_features), iterations), output_features, spatial_reference)
@@ -0,0 +1,1219 @@
+# -------------------------------------------------------------------------------
+# Name:        raster_lib
+# Purpose:     NumPy raster engine: grid geometry, blocked reads and writes and
+#              an aligned virtual mosaic used instead of MosaicToNewRaster for
+#              intermediate merges.
+#
+# Author:      Gert van Maren
+#
+# Created:     19/10/2026
+# Copyright:   (c) Esri 2026
+# updated:
+# updated:
+# updated:
+
+# Required:    numpy. arcpy only for the Raster* functions that read or write
+#              rasters on disk; the engines run on plain arrays without it.
+
+# -------------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import math
+import multiprocessing
+from collections import namedtuple
+
+import numpy as np
+
+try:
+    import arcpy
+except ImportError:  # the array engines don't need arcpy, e.g. for testing
+    arcpy = None
+
+# Constants
+BLOCK_SIZE = 2048
+MAX_IN_MEMORY_CELLS = 64 * 1024 * 1024
+NODATA_FLOAT = float(np.finfo(np.float32).min)
+NODATA_INT = -1
+
+BIN_STATISTICS = ["COUNT", "SUM", "MEAN", "MAXIMUM", "MINIMUM"]
+
+MOSAIC_METHODS = ["FIRST", "LAST", "SUM", "MEAN", "MINIMUM", "MAXIMUM"]
+
+# raster geometry: upper left corner, square cell size and dimensions
+RasterGrid = namedtuple("RasterGrid", ["x_min", "y_max", "cell_size", "ncols", "nrows"])
+
+
+# ----------------------------Grid geometry---------------------------- #
+
+def grid_extent(grid):
+    # returns x_min, y_min, x_max, y_max
+    return (grid.x_min, grid.y_max - grid.nrows * grid.cell_size,
+            grid.x_min + grid.ncols * grid.cell_size, grid.y_max)
+
+
+def grid_for_extent(x_min, y_min, x_max, y_max, cell_size, snap_grid=None):
+    # grid covering the extent with cell_size, snapped to the origin of snap_grid if given
+    if snap_grid is not None:
+        x_min = snap_grid.x_min + math.floor((x_min - snap_grid.x_min) / cell_size + 1e-9) * cell_size
+        y_max = snap_grid.y_max - math.floor((snap_grid.y_max - y_max) / cell_size + 1e-9) * cell_size
+
+    ncols = max(int(math.ceil((x_max - x_min) / cell_size - 1e-9)), 0)
+    nrows = max(int(math.ceil((y_max - y_min) / cell_size - 1e-9)), 0)
+
+    return RasterGrid(x_min, y_max, cell_size, ncols, nrows)
+
+
+def union_grid(grids, cell_size=None):
+    # grid covering all grids, snapped to the first one
+    extents = [grid_extent(g) for g in grids]
+    if cell_size is None:
+        cell_size = grids[0].cell_size
+
+    return grid_for_extent(min(e[0] for e in extents), min(e[1] for e in extents),
+                           max(e[2] for e in extents), max(e[3] for e in extents),
+                           cell_size, grids[0])
+
+
+def is_aligned(grid, other):
+    # same cell size and origins on the same lattice
+    if abs(grid.cell_size - other.cell_size) > 1e-9 * grid.cell_size:
+        return False
+
+    dx = (other.x_min - grid.x_min) / grid.cell_size
+    dy = (grid.y_max - other.y_max) / grid.cell_size
+
+    return abs(dx - round(dx)) < 1e-6 and abs(dy - round(dy)) < 1e-6
+
+
+def iter_blocks(grid, block_size=BLOCK_SIZE):
+    # yields row, col, nrows, ncols of the blocks covering the grid
+    for row in range(0, grid.nrows, block_size):
+        for col in range(0, grid.ncols, block_size):
+            yield row, col, min(block_size, grid.nrows - row), min(block_size, grid.ncols - col)
+
+
+def expand_grid(grid, cells):
+    # grid grown by a number of cells on every side
+    return RasterGrid(grid.x_min - cells * grid.cell_size, grid.y_max + cells * grid.cell_size,
+                      grid.cell_size, grid.ncols + 2 * cells, grid.nrows + 2 * cells)
+
+
+def block_grid(grid, row, col, nrows, ncols):
+    # grid of a window of grid; windows may extend past the grid edges
+    return RasterGrid(grid.x_min + col * grid.cell_size, grid.y_max - row * grid.cell_size,
+                      grid.cell_size, ncols, nrows)
+
+
+# ----------------------------Sources---------------------------- #
+# A source has a grid and read_native(row, col, nrows, ncols) which returns a
+# float64 block in its own grid with NaN for NoData and for cells outside it.
+
+def _clamped_read(source_grid, read_inside, row, col, nrows, ncols):
+    block = np.full((nrows, ncols), np.nan)
+
+    r0, c0 = max(row, 0), max(col, 0)
+    r1, c1 = min(row + nrows, source_grid.nrows), min(col + ncols, source_grid.ncols)
+
+    if r1 > r0 and c1 > c0:
+        block[r0 - row:r1 - row, c0 - col:c1 - col] = read_inside(r0, c0, r1 - r0, c1 - c0)
+
+    return block
+
+
+class ArraySource(object):
+    """ In-memory array on a grid. nodata cells become NaN on read. """
+
+    def __init__(self, array, grid, nodata=None):
+        self.array = array
+        self.grid = grid
+        self.nodata = nodata
+
+    def read_native(self, row, col, nrows, ncols):
+        def read_inside(r, c, nr, nc):
+            values = np.asarray(self.array[r:r + nr, c:c + nc], dtype=np.float64)
+            if self.nodata is not None:
+                values = np.where(values == self.nodata, np.nan, values)
+            return values
+
+        return _clamped_read(self.grid, read_inside, row, col, nrows, ncols)
+
+
+class RasterSource(object):
+    """ Raster dataset read window by window through RasterToNumPyArray. """
+
+    def __init__(self, raster):
+        self.raster = raster
+        self.grid = get_raster_grid(raster)
+
+        raster_object = arcpy.Raster(raster)
+        if raster_object.isInteger:
+            self.nodata = raster_object.noDataValue if raster_object.noDataValue is not None else 0
+        else:
+            self.nodata = NODATA_FLOAT
+
+        self.has_nodata = raster_object.noDataValue is not None or not raster_object.isInteger
+
+    def read_native(self, row, col, nrows, ncols):
+        def read_inside(r, c, nr, nc):
+            lower_left = arcpy.Point(self.grid.x_min + c * self.grid.cell_size,
+                                     self.grid.y_max - (r + nr) * self.grid.cell_size)
+            values = arcpy.RasterToNumPyArray(self.raster, lower_left, nc, nr, self.nodata).astype(np.float64)
+            if self.has_nodata:
+                values[values == self.nodata] = np.nan
+            return values
+
+        return _clamped_read(self.grid, read_inside, row, col, nrows, ncols)
+
+
+def read_window(source, grid, row, col, nrows, ncols):
+    # read a window of grid from source, resampling (nearest) if source isn't aligned with grid
+    target = block_grid(grid, row, col, nrows, ncols)
+    src = source.grid
+
+    if is_aligned(src, target):
+        src_row = int(round((src.y_max - target.y_max) / src.cell_size))
+        src_col = int(round((target.x_min - src.x_min) / src.cell_size))
+        return source.read_native(src_row, src_col, nrows, ncols)
+
+    # cell centers of the target window expressed in source rows / cols
+    xs = target.x_min + (np.arange(ncols) + 0.5) * target.cell_size
+    ys = target.y_max - (np.arange(nrows) + 0.5) * target.cell_size
+    src_cols = np.floor((xs - src.x_min) / src.cell_size).astype(np.int64)
+    src_rows = np.floor((src.y_max - ys) / src.cell_size).astype(np.int64)
+
+    # read the covering native window once, then gather
+    r0, c0 = int(src_rows.min()), int(src_cols.min())
+    native = source.read_native(r0, c0, int(src_rows.max()) - r0 + 1, int(src_cols.max()) - c0 + 1)
+
+    return native[np.ix_(src_rows - r0, src_cols - c0)]
+
+
+# ----------------------------Virtual mosaic---------------------------- #
+
+class VirtualMosaic(object):
+    """
+    Aligned virtual mosaic over a list of sources, resolved block by block on read.
+    Methods follow MosaicToNewRaster: FIRST, LAST, SUM, MEAN, MINIMUM, MAXIMUM.
+    Cells where the optional mask source is NoData are NoData in the mosaic.
+    A VirtualMosaic is itself a source, so mosaics can be nested.
+    """
+
+    def __init__(self, sources, method="LAST", grid=None, cell_size=None, mask=None):
+        method = method.upper()
+        if method not in MOSAIC_METHODS:
+            raise ValueError("Unsupported mosaic method: " + method)
+
+        self.sources = list(sources)
+        if not self.sources:
+            raise ValueError("A virtual mosaic needs at least one source")
+
+        self.method = method
+        self.mask = mask
+        self.grid = grid if grid is not None else union_grid([s.grid for s in self.sources], cell_size)
+
+    def read_native(self, row, col, nrows, ncols):
+        nodata = None
+        if self.mask is not None:
+            nodata = np.isnan(read_window(self.mask, self.grid, row, col, nrows, ncols))
+            if nodata.all():
+                return np.full((nrows, ncols), np.nan)
+
+        # FIRST stops reading as soon as every cell is resolved, LAST does the same in reverse
+        if self.method in ("FIRST", "LAST"):
+            ordered = self.sources if self.method == "FIRST" else self.sources[::-1]
+            block = np.full((nrows, ncols), np.nan)
+            todo = np.ones((nrows, ncols), dtype=bool) if nodata is None else ~nodata
+
+            for source in ordered:
+                values = read_window(source, self.grid, row, col, nrows, ncols)
+                fill = todo & ~np.isnan(values)
+                block[fill] = values[fill]
+                todo &= ~fill
+                if not todo.any():
+                    break
+        else:
+            total = None
+            for source in self.sources:
+                values = read_window(source, self.grid, row, col, nrows, ncols)
+                valid = ~np.isnan(values)
+
+                if total is None:
+                    total = np.where(valid, values, 0.0)
+                    count = valid.astype(np.int32)
+                    if self.method in ("MINIMUM", "MAXIMUM"):
+                        total = values.copy()
+                    continue
+
+                if self.method in ("SUM", "MEAN"):
+                    total += np.where(valid, values, 0.0)
+                elif self.method == "MINIMUM":
+                    total = np.fmin(total, values)
+                else:
+                    total = np.fmax(total, values)
+                count += valid
+
+            block = total / np.maximum(count, 1) if self.method == "MEAN" else total
+            block = np.where(count > 0, block, np.nan)
+
+        if nodata is not None:
+            block[nodata] = np.nan
+
+        return block
+
+    def read(self, row=0, col=0, nrows=None, ncols=None):
+        if nrows is None:
+            nrows = self.grid.nrows - row
+        if ncols is None:
+            ncols = self.grid.ncols - col
+        return self.read_native(row, col, nrows, ncols)
+
+
+def to_array(source, grid=None):
+    # resolve a complete source into one array
+    if grid is None:
+        grid = source.grid
+    return read_window(source, grid, 0, 0, grid.nrows, grid.ncols)
+
+
+def to_memmap(source, filename, grid=None, block_size=BLOCK_SIZE):
+    """
+    Writes a source block by block to a float32 .npy file, NaN for NoData, and returns
+    it as an ArraySource on the memory mapped file. Other processes share the file
+    through open_memmap(filename, grid) without reading the raster again.
+    """
+    if grid is None:
+        grid = source.grid
+
+    array = np.lib.format.open_memmap(filename, mode="w+", dtype=np.float32, shape=(grid.nrows, grid.ncols))
+    for row, col, nrows, ncols in iter_blocks(grid, block_size):
+        array[row:row + nrows, col:col + ncols] = read_window(source, grid, row, col, nrows, ncols)
+    array.flush()
+    del array
+
+    return open_memmap(filename, grid)
+
+
+def open_memmap(filename, grid):
+    # read only ArraySource on a .npy file written by to_memmap
+    return ArraySource(np.load(filename, mmap_mode="r"), grid)
+
+
+def process_pool(processes):
+    # inside ArcGIS Pro sys.executable is the application, workers need python.exe
+    if os.path.basename(sys.executable).lower() == "arcgispro.exe":
+        multiprocessing.set_executable(os.path.join(sys.exec_prefix, "python.exe"))
+    return multiprocessing.Pool(processes)
+
+
+def pool_size(processes, jobs):
+    # processes None is one per core but one, never more than there are jobs
+    if processes is None:
+        processes = multiprocessing.cpu_count() - 1
+    return max(min(processes, jobs), 1)
+
+
+def _read_block(job):
+    # pool worker: one block of a (picklable) source
+    source, grid, row, col, nrows, ncols = job
+    return row, col, read_window(source, grid, row, col, nrows, ncols)
+
+
+def read_blocks(source, grid=None, block_size=BLOCK_SIZE, processes=1):
+    """
+    Yields row, col and the block of every block of grid, resolved in a pool
+    of processes when processes isn't 1 (in completion order). The source is
+    pickled for the workers: raster paths and small arrays, not large arrays.
+    """
+    if grid is None:
+        grid = source.grid
+
+    jobs = [(source, grid) + block for block in iter_blocks(grid, block_size)]
+    processes = pool_size(processes, len(jobs))
+    if processes > 1:
+        pool = process_pool(processes)
+        try:
+            for result in pool.imap_unordered(_read_block, jobs):
+                yield result
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for job in jobs:
+            yield _read_block(job)
+
+
+# ----------------------------Wet masks---------------------------- #
+# Flooded (wet) cells of a raster as a .npy file of bits, row by row ceil(ncols / 8)
+# bytes, with its grid in a .json file next to it: 1/32 of a float32 raster, read
+# as a source by other processes and tools, e.g. as the mask of a virtual raster.
+
+def _mask_grid_file(filename):
+    return os.path.splitext(filename)[0] + ".json"
+
+
+def write_wet_mask(source, filename, no_flood_value=None, grid=None, block_size=BLOCK_SIZE):
+    """
+    Packs the cells of source with a value, other than no_flood_value if given,
+    into a wet mask file, reading the source once block by block. Returns the
+    WetMask on the file and the number of wet cells.
+    """
+    if grid is None:
+        grid = source.grid
+    if block_size % 8:
+        raise ValueError("Block size must be a multiple of 8: " + str(block_size))
+
+    bits = np.lib.format.open_memmap(filename, mode="w+", dtype=np.uint8, shape=(grid.nrows, (grid.ncols + 7) // 8))
+    wet_cells = 0
+    for row, col, nrows, ncols in iter_blocks(grid, block_size):
+        block = read_window(source, grid, row, col, nrows, ncols)
+        wet = ~np.isnan(block)
+        if no_flood_value is not None:
+            wet &= block != no_flood_value
+        bits[row:row + nrows, col // 8:(col + ncols + 7) // 8] = np.packbits(wet, axis=1)
+        wet_cells += int(np.count_nonzero(wet))
+    bits.flush()
+    del bits
+
+    with open(_mask_grid_file(filename), "w") as grid_file:
+        json.dump(grid._asdict(), grid_file)
+
+    return WetMask(filename, grid), wet_cells
+
+
+class WetMask(object):
+    """ Wet mask file as a source: value on wet cells, NoData on dry cells. """
+
+    def __init__(self, filename, grid=None, value=1.0):
+        self.bits = np.load(filename, mmap_mode="r")
+        if grid is None:
+            with open(_mask_grid_file(filename)) as grid_file:
+                grid = RasterGrid(**json.load(grid_file))
+        self.grid = grid
+        self.value = value
+
+    def wet(self, row, col, nrows, ncols):
+        # boolean block of the mask, inside the grid only
+        bits = self.bits[row:row + nrows, col // 8:(col + ncols + 7) // 8]
+        return np.unpackbits(bits, axis=1)[:, col % 8:col % 8 + ncols].astype(bool)
+
+    def read_native(self, row, col, nrows, ncols):
+        def read_inside(r, c, nr, nc):
+            return np.where(self.wet(r, c, nr, nc), self.value, np.nan)
+
+        return _clamped_read(self.grid, read_inside, row, col, nrows, ncols)
+
+
+# ----------------------------Focal mean---------------------------- #
+
+def focal_mean(array, width, height=None, ignore_nodata=True):
+    """
+    Rectangle focal mean (NbrRectangle CELL) using summed-area tables of values and
+    valid counts, so the cost per cell doesn't depend on the window size. NaN is NoData.
+    For even sizes the window extends one cell further up / left of the processing cell.
+    """
+    if height is None:
+        height = width
+
+    nrows, ncols = array.shape
+    valid = ~np.isnan(array)
+
+    # subtract the mean so the running sums keep their precision on large blocks
+    offset = array[valid].mean() if valid.any() else 0.0
+    values = np.where(valid, array - offset, 0.0)
+
+    value_table = np.zeros((nrows + 1, ncols + 1))
+    count_table = np.zeros((nrows + 1, ncols + 1), dtype=np.int64)
+    np.cumsum(np.cumsum(values, axis=0), axis=1, out=value_table[1:, 1:])
+    np.cumsum(np.cumsum(valid, axis=0), axis=1, out=count_table[1:, 1:])
+
+    # window bounds per row / col, clipped to the array
+    rows = np.arange(nrows)
+    cols = np.arange(ncols)
+    top = np.clip(rows - height // 2, 0, nrows)
+    bottom = np.clip(rows + (height - 1) // 2 + 1, 0, nrows)
+    left = np.clip(cols - width // 2, 0, ncols)
+    right = np.clip(cols + (width - 1) // 2 + 1, 0, ncols)
+
+    def window_sum(table):
+        return (table[bottom][:, right] - table[top][:, right]
+                - table[bottom][:, left] + table[top][:, left])
+
+    sums = window_sum(value_table)
+    counts = window_sum(count_table)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = sums / counts + offset
+
+    if ignore_nodata:
+        result[counts == 0] = np.nan
+    else:
+        # the whole window, including the part outside the array, must be valid
+        full = (bottom - top)[:, None] * (right - left)[None, :]
+        result[(counts < full) | (full < width * height)] = np.nan
+
+    return result
+
+
+class FocalMean(object):
+    """
+    Focal mean of a source computed tile by tile: each block is read with a halo
+    of half the window so tiles match the result on the whole raster.
+    Cells where the optional mask source is NoData are NoData.
+    """
+
+    def __init__(self, source, width, height=None, ignore_nodata=True, mask=None, block_size=BLOCK_SIZE):
+        self.source = source
+        self.width = int(width)
+        self.height = int(height) if height else int(width)
+        self.ignore_nodata = ignore_nodata
+        self.mask = mask
+        self.block_size = block_size
+        self.grid = source.grid
+
+    def read_native(self, row, col, nrows, ncols):
+        block = np.full((nrows, ncols), np.nan)
+        halo_r, halo_c = self.height // 2, self.width // 2
+
+        for r, c, nr, nc in iter_blocks(RasterGrid(0, 0, 1, ncols, nrows), self.block_size):
+            window = self.source.read_native(row + r - halo_r, col + c - halo_c,
+                                             nr + self.height - 1, nc + self.width - 1)
+            focal = focal_mean(window, self.width, self.height, self.ignore_nodata)
+            block[r:r + nr, c:c + nc] = focal[halo_r:halo_r + nr, halo_c:halo_c + nc]
+
+        if self.mask is not None:
+            block[np.isnan(read_window(self.mask, self.grid, row, col, nrows, ncols))] = np.nan
+
+        return block
+
+
+class FocalPlus(object):
+    """
+    Plus, focal mean and Con(IsNull) fused: the focal mean of first + second,
+    NoData where first is NoData, e.g. a smoothed water surface from depth and
+    a DTM. Each tile reads both once with a halo of half the window, second
+    resampled onto the grid of first when they aren't aligned, and tiles
+    without any first values are skipped.
+    """
+
+    def __init__(self, first, second, width, height=None, ignore_nodata=True, block_size=BLOCK_SIZE):
+        self.first = first
+        self.second = second
+        self.width = int(width)
+        self.height = int(height) if height else int(width)
+        self.ignore_nodata = ignore_nodata
+        self.block_size = block_size
+        self.grid = first.grid
+
+    def read_native(self, row, col, nrows, ncols):
+        block = np.full((nrows, ncols), np.nan)
+        halo_r, halo_c = self.height // 2, self.width // 2
+
+        for r, c, nr, nc in iter_blocks(RasterGrid(0, 0, 1, ncols, nrows), self.block_size):
+            window = (row + r - halo_r, col + c - halo_c, nr + self.height - 1, nc + self.width - 1)
+            first = self.first.read_native(*window)
+            center = np.isnan(first[halo_r:halo_r + nr, halo_c:halo_c + nc])
+            if center.all():
+                continue
+
+            focal = focal_mean(first + read_window(self.second, self.grid, *window), self.width, self.height,
+                               self.ignore_nodata)
+            focal = focal[halo_r:halo_r + nr, halo_c:halo_c + nc]
+            focal[center] = np.nan
+            block[r:r + nr, c:c + nc] = focal
+
+        return block
+
+
+def box_count(mask, radius):
+    # number of True cells in the (2 * radius + 1) square around each cell
+    nrows, ncols = mask.shape
+    table = np.zeros((nrows + 1, ncols + 1), dtype=np.int64)
+    np.cumsum(np.cumsum(mask, axis=0), axis=1, out=table[1:, 1:])
+
+    top = np.clip(np.arange(nrows) - radius, 0, nrows)
+    bottom = np.clip(np.arange(nrows) + radius + 1, 0, nrows)
+    left = np.clip(np.arange(ncols) - radius, 0, ncols)
+    right = np.clip(np.arange(ncols) + radius + 1, 0, ncols)
+
+    return (table[bottom][:, right] - table[top][:, right]
+            - table[bottom][:, left] + table[top][:, left])
+
+
+# ----------------------------IDW interpolation---------------------------- #
+
+class PointGridIndex(object):
+    """
+    Uniform grid (bucket) index over 2D sample points for k nearest neighbour
+    queries. Queries are answered in vectorized batches by searching square rings
+    of buckets around each query until the k-th distance is guaranteed.
+    """
+
+    def __init__(self, xs, ys, bucket_size=None, points_per_bucket=4):
+        self.xs = np.asarray(xs, dtype=np.float64)
+        self.ys = np.asarray(ys, dtype=np.float64)
+
+        count = max(len(self.xs), 1)
+        self.x_min, self.y_min = self.xs.min(), self.ys.min()
+        width = max(self.xs.max() - self.x_min, 1e-9)
+        height = max(self.ys.max() - self.y_min, 1e-9)
+
+        if bucket_size is None:
+            bucket_size = math.sqrt(width * height * points_per_bucket / count)
+            bucket_size = max(bucket_size, max(width, height) / 4096.0, 1e-9)
+
+        self.bucket_size = bucket_size
+        self.ncols = int(width / bucket_size) + 1
+        self.nrows = int(height / bucket_size) + 1
+
+        cols = ((self.xs - self.x_min) / bucket_size).astype(np.int64)
+        rows = ((self.ys - self.y_min) / bucket_size).astype(np.int64)
+        buckets = rows * self.ncols + cols
+
+        # samples sorted by bucket with start offsets per bucket (CSR layout)
+        self.order = np.argsort(buckets, kind="stable")
+        self.counts = np.bincount(buckets, minlength=self.nrows * self.ncols)
+        self.starts = np.concatenate(([0], np.cumsum(self.counts)[:-1]))
+
+    def knn(self, qx, qy, k, max_distance=np.inf):
+        # returns distances and sample indices (n, k); missing neighbours are inf / -1
+        qx = np.asarray(qx, dtype=np.float64)
+        qy = np.asarray(qy, dtype=np.float64)
+        n = len(qx)
+
+        best_d = np.full((n, k), np.inf)
+        best_i = np.full((n, k), -1, dtype=np.int64)
+
+        qc = np.floor((qx - self.x_min) / self.bucket_size).astype(np.int64)
+        qr = np.floor((qy - self.y_min) / self.bucket_size).astype(np.int64)
+        ring_limit = np.max(np.abs(np.stack([qr, self.nrows - 1 - qr, qc, self.ncols - 1 - qc])), axis=0)
+
+        active = np.arange(n)
+        ring = 0
+
+        while active.size:
+            # bucket offsets on the square ring at Chebyshev distance 'ring'
+            span = np.arange(-ring, ring + 1)
+            if ring == 0:
+                dr = dc = np.zeros(1, dtype=np.int64)
+            else:
+                dr = np.concatenate((np.full(span.size, -ring), np.full(span.size, ring), span[1:-1], span[1:-1]))
+                dc = np.concatenate((span, span, np.full(span.size - 2, -ring), np.full(span.size - 2, ring)))
+
+            br = qr[active][:, None] + dr[None, :]
+            bc = qc[active][:, None] + dc[None, :]
+            inside = (br >= 0) & (br < self.nrows) & (bc >= 0) & (bc < self.ncols)
+
+            query_pos = np.nonzero(inside)[0]
+            buckets = (br * self.ncols + bc)[inside]
+            counts = self.counts[buckets]
+
+            if counts.sum() > 0:
+                # expand (query, bucket) pairs into (query, sample) candidates
+                cand_q = np.repeat(query_pos, counts)
+                first = np.repeat(self.starts[buckets], counts)
+                within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+                cand_i = self.order[first + within]
+
+                cand_d = np.hypot(self.xs[cand_i] - qx[active][cand_q], self.ys[cand_i] - qy[active][cand_q])
+
+                # merge with the current best k per query in a padded (query, candidate) matrix
+                slot = np.arange(cand_q.size) - np.searchsorted(cand_q, cand_q, side="left")
+                width = k + int(slot.max()) + 1
+                merged_d = np.full((active.size, width), np.inf)
+                merged_i = np.full((active.size, width), -1, dtype=np.int64)
+                merged_d[:, :k] = best_d[active]
+                merged_i[:, :k] = best_i[active]
+                merged_d[cand_q, k + slot] = cand_d
+                merged_i[cand_q, k + slot] = cand_i
+
+                if width > k:
+                    nearest = np.argpartition(merged_d, k - 1, axis=1)[:, :k]
+                    merged_d = np.take_along_axis(merged_d, nearest, axis=1)
+                    merged_i = np.take_along_axis(merged_i, nearest, axis=1)
+
+                order = np.argsort(merged_d, axis=1)
+                best_d[active] = np.take_along_axis(merged_d, order, axis=1)
+                best_i[active] = np.take_along_axis(merged_i, order, axis=1)
+
+            # unseen samples are at least ring * bucket_size away
+            reach = ring * self.bucket_size
+            done = (best_d[active, k - 1] <= reach) | (reach >= max_distance) | (ring >= ring_limit[active])
+            active = active[~done]
+            ring += 1
+
+        too_far = best_d > max_distance
+        best_d[too_far] = np.inf
+        best_i[too_far] = -1
+
+        return best_d, best_i
+
+
+def idw(sample_x, sample_y, sample_z, query_x, query_y, k=12, power=2, max_distance=np.inf,
+        index=None, chunk_size=32768):
+    # inverse distance weighted interpolation from the k nearest samples, in chunks of queries
+    sample_z = np.asarray(sample_z, dtype=np.float64)
+    if index is None:
+        index = PointGridIndex(sample_x, sample_y)
+
+    k = min(k, len(sample_z))
+    result = np.full(len(query_x), np.nan)
+
+    for start in range(0, len(query_x), chunk_size):
+        end = start + chunk_size
+        dist, nearest = index.knn(query_x[start:end], query_y[start:end], k, max_distance)
+
+        found = nearest >= 0
+        with np.errstate(divide="ignore"):
+            weights = np.where(found, 1.0 / np.power(dist, power), 0.0)
+        values = np.where(found, sample_z[np.maximum(nearest, 0)], 0.0)
+
+        # a query on top of a sample takes its value
+        exact = found & (dist == 0)
+        weights[exact.any(axis=1)] = 0.0
+        weights[exact] = 1.0
+
+        total = weights.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result[start:end] = np.where(total > 0, (weights * values).sum(axis=1) / total, np.nan)
+
+    return result
+
+
+class IdwFill(object):
+    """
+    Fills NoData cells within fill_width cells of data by IDW from the ring of
+    data cells within ring_width cells of NoData. Only the cells that need filling
+    are interpolated; other data cells pass through unchanged.
+    grid defaults to the source grid; use expand_grid to extrapolate past its edges.
+    """
+
+    def __init__(self, source, ring_width, fill_width, k=12, power=2, max_distance=np.inf,
+                 grid=None, block_size=BLOCK_SIZE):
+        self.source = source
+        self.ring_width = int(ring_width)
+        self.fill_width = int(fill_width)
+        self.k = k
+        self.power = power
+        self.max_distance = max_distance
+        self.grid = grid if grid is not None else source.grid
+        self.block_size = block_size
+        self._samples = None
+
+    def ring_samples(self):
+        # x, y, z of the ring cells, collected block by block with a halo
+        if self._samples is None:
+            grid = self.source.grid
+            halo = self.ring_width
+            xs, ys, zs = [], [], []
+
+            for row, col, nrows, ncols in iter_blocks(grid, self.block_size):
+                window = self.source.read_native(row - halo, col - halo, nrows + 2 * halo, ncols + 2 * halo)
+                valid = ~np.isnan(window)
+                near_nodata = box_count(~valid, halo) > 0
+                rows, cols = np.nonzero((valid & near_nodata)[halo:halo + nrows, halo:halo + ncols])
+
+                xs.append(grid.x_min + (col + cols + 0.5) * grid.cell_size)
+                ys.append(grid.y_max - (row + rows + 0.5) * grid.cell_size)
+                zs.append(window[rows + halo, cols + halo])
+
+            self._samples = (np.concatenate(xs), np.concatenate(ys), np.concatenate(zs))
+            self._index = PointGridIndex(self._samples[0], self._samples[1]) if self._samples[0].size else None
+
+        return self._samples
+
+    def read_native(self, row, col, nrows, ncols):
+        halo = self.fill_width
+        window = read_window(self.source, self.grid, row - halo, col - halo, nrows + 2 * halo, ncols + 2 * halo)
+        valid = ~np.isnan(window)
+        target = (~valid & (box_count(valid, halo) > 0))[halo:halo + nrows, halo:halo + ncols]
+        block = window[halo:halo + nrows, halo:halo + ncols].copy()
+
+        sample_x, sample_y, sample_z = self.ring_samples()
+        if target.any() and sample_z.size:
+            rows, cols = np.nonzero(target)
+            query_x = self.grid.x_min + (col + cols + 0.5) * self.grid.cell_size
+            query_y = self.grid.y_max - (row + rows + 0.5) * self.grid.cell_size
+            block[rows, cols] = idw(sample_x, sample_y, sample_z, query_x, query_y, self.k, self.power,
+                                    self.max_distance, self._index)
+
+        return block
+
+
+# ----------------------------Point binning---------------------------- #
+
+class PointBinner(object):
+    """
+    Accumulates points into the cells of a grid: count and, as asked for, sum,
+    maximum and minimum, so MEAN = SUM / COUNT. Points outside the grid are ignored.
+    Binners of windows of the grid are merged with merge(other, row, col). With a
+    prefix the arrays are memory mapped .npy files <prefix>_<name>.npy, filled by
+    merging window binners and read back window by window through source().
+    """
+
+    def __init__(self, grid, statistics=("COUNT",), prefix=None):
+        self.grid = grid
+        self.prefix = prefix
+        self.statistics = set(statistics)
+        unknown = self.statistics - set(BIN_STATISTICS)
+        if unknown:
+            raise ValueError("Unknown statistics: " + ", ".join(sorted(unknown)))
+
+        self.count = self._storage("count", np.int64, 0)
+        self.sum = self._storage("sum", np.float64, 0.0) if self.statistics & {"SUM", "MEAN"} else None
+        self.maximum = self._storage("maximum", np.float64, -np.inf) if "MAXIMUM" in self.statistics else None
+        self.minimum = self._storage("minimum", np.float64, np.inf) if "MINIMUM" in self.statistics else None
+
+    def _storage(self, name, dtype, fill):
+        cells = self.grid.nrows * self.grid.ncols
+        if self.prefix is None:
+            return np.full(cells, fill, dtype=dtype)
+
+        array = np.lib.format.open_memmap(self.prefix + "_" + name + ".npy", mode="w+", dtype=dtype, shape=(cells,))
+        if fill:
+            for start in range(0, cells, BLOCK_SIZE * BLOCK_SIZE):
+                array[start:start + BLOCK_SIZE * BLOCK_SIZE] = fill
+        return array
+
+    def cell_index(self, x, y):
+        # flat cell index of points and the mask of points inside the grid
+        cols = np.floor((np.asarray(x) - self.grid.x_min) / self.grid.cell_size).astype(np.int64)
+        rows = np.floor((self.grid.y_max - np.asarray(y)) / self.grid.cell_size).astype(np.int64)
+        inside = (cols >= 0) & (cols < self.grid.ncols) & (rows >= 0) & (rows < self.grid.nrows)
+        return rows[inside] * self.grid.ncols + cols[inside], inside
+
+    def add(self, x, y, z=None):
+        index, inside = self.cell_index(x, y)
+        cells = len(self.count)
+
+        self.count += np.bincount(index, minlength=cells)
+        if z is None:
+            return
+
+        z = np.asarray(z, dtype=np.float64)[inside]
+        if self.sum is not None:
+            self.sum += np.bincount(index, weights=z, minlength=cells)
+        if self.maximum is not None:
+            np.maximum.at(self.maximum, index, z)
+        if self.minimum is not None:
+            np.minimum.at(self.minimum, index, z)
+
+    def _window(self, array, row, col, nrows, ncols):
+        return array.reshape(self.grid.nrows, self.grid.ncols)[row:row + nrows, col:col + ncols]
+
+    def merge(self, other, row, col):
+        # add a binner of the window of this grid starting at row, col
+        shape = (other.grid.nrows, other.grid.ncols)
+        self._window(self.count, row, col, *shape)[...] += other.count.reshape(shape)
+        if self.sum is not None:
+            self._window(self.sum, row, col, *shape)[...] += other.sum.reshape(shape)
+        if self.maximum is not None:
+            window = self._window(self.maximum, row, col, *shape)
+            window[...] = np.maximum(window, other.maximum.reshape(shape))
+        if self.minimum is not None:
+            window = self._window(self.minimum, row, col, *shape)
+            window[...] = np.minimum(window, other.minimum.reshape(shape))
+
+    def window(self, statistic, row, col, nrows, ncols):
+        # 2D array of a statistic in a window inside the grid, NaN in empty cells (COUNT has 0)
+        count = np.asarray(self._window(self.count, row, col, nrows, ncols))
+        if statistic == "COUNT":
+            return count
+
+        empty = count == 0
+        if statistic == "SUM":
+            values = np.array(self._window(self.sum, row, col, nrows, ncols))
+        elif statistic == "MEAN":
+            with np.errstate(invalid="ignore", divide="ignore"):
+                values = self._window(self.sum, row, col, nrows, ncols) / count
+        elif statistic == "MAXIMUM":
+            values = np.array(self._window(self.maximum, row, col, nrows, ncols))
+        else:
+            values = np.array(self._window(self.minimum, row, col, nrows, ncols))
+
+        values[empty] = np.nan
+        return values
+
+    def result(self, statistic):
+        # 2D array of a statistic, NaN in empty cells (COUNT has 0)
+        return self.window(statistic, 0, 0, self.grid.nrows, self.grid.ncols)
+
+    def source(self, statistic):
+        return BinnerSource(self, statistic)
+
+    def delete(self):
+        # drops the arrays, and their files with a prefix
+        names = [name for name in ("count", "sum", "maximum", "minimum") if getattr(self, name) is not None]
+        self.count = self.sum = self.maximum = self.minimum = None
+        if self.prefix is not None:
+            for name in names:
+                os.remove(self.prefix + "_" + name + ".npy")
+
+
+class BinnerSource(object):
+    """ A statistic of a PointBinner as a source, e.g. to materialize a binner on disk block by block. """
+
+    def __init__(self, binner, statistic):
+        self.binner = binner
+        self.statistic = statistic
+        self.grid = binner.grid
+
+    def read_native(self, row, col, nrows, ncols):
+        def read_inside(r, c, nr, nc):
+            return self.binner.window(self.statistic, r, c, nr, nc).astype(np.float64)
+
+        return _clamped_read(self.grid, read_inside, row, col, nrows, ncols)
+
+
+def window_for_extent(grid, x_min, y_min, x_max, y_max):
+    # row, col, nrows, ncols of the cells of grid an extent touches, None if it misses the grid
+    col0 = max(int(math.floor((x_min - grid.x_min) / grid.cell_size)), 0)
+    col1 = min(int(math.floor((x_max - grid.x_min) / grid.cell_size)) + 1, grid.ncols)
+    row0 = max(int(math.floor((grid.y_max - y_max) / grid.cell_size)), 0)
+    row1 = min(int(math.floor((grid.y_max - y_min) / grid.cell_size)) + 1, grid.nrows)
+
+    if col1 <= col0 or row1 <= row0:
+        return None
+    return row0, col0, row1 - row0, col1 - col0
+
+
+# ----------------------------Point sampling---------------------------- #
+
+def sample_bilinear(source, x, y, block_size=BLOCK_SIZE):
+    """
+    Bilinear interpolation of a source at points x, y between the four nearest
+    cell centers. NoData neighbours are left out and the weights of the others
+    rescaled, NaN where all four are NoData or outside the source. The points are
+    grouped by block and every block is read once, with a cell of halo.
+    """
+    grid = source.grid
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    values = np.full(len(x), np.nan)
+
+    # position in cell center coordinates: cell (r, c) has its center at (r, c)
+    fx = (x - grid.x_min) / grid.cell_size - 0.5
+    fy = (grid.y_max - y) / grid.cell_size - 0.5
+    col = np.floor(fx).astype(np.int64)
+    row = np.floor(fy).astype(np.int64)
+    inside = (col >= -1) & (col < grid.ncols) & (row >= -1) & (row < grid.nrows)
+
+    blocks = ((row + 1) // block_size) * (grid.ncols // block_size + 2) + (col + 1) // block_size
+    for block in np.unique(blocks[inside]):
+        points = np.flatnonzero(inside & (blocks == block))
+        r0, c0 = int(row[points].min()), int(col[points].min())
+        window = source.read_native(r0, c0, int(row[points].max()) - r0 + 2, int(col[points].max()) - c0 + 2)
+
+        r, c = row[points] - r0, col[points] - c0
+        wx, wy = fx[points] - col[points], fy[points] - row[points]
+        corners = np.stack([window[r, c], window[r, c + 1], window[r + 1, c], window[r + 1, c + 1]])
+        weights = np.stack([(1 - wx) * (1 - wy), wx * (1 - wy), (1 - wx) * wy, wx * wy])
+
+        valid = ~np.isnan(corners)
+        total = np.where(valid, weights, 0).sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            values[points] = np.where(valid, corners * weights, 0).sum(axis=0) / total
+        values[points[total == 0]] = np.nan
+
+    return values
+
+
+def read_cells(source, rows, cols, block_size=BLOCK_SIZE):
+    # values of a source at cells (rows, cols) of its own grid, reading every block with cells once
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    values = np.full(len(rows), np.nan)
+    if not len(rows):
+        return values
+
+    block_rows, block_cols = rows // block_size, cols // block_size
+    blocks = block_rows * (source.grid.ncols // block_size + 1) + block_cols
+    order = np.argsort(blocks, kind="stable")
+    bounds = np.flatnonzero(np.r_[True, np.diff(blocks[order]) != 0, True])
+
+    for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        cells = order[start:end]
+        row, col = int(rows[cells].min()), int(cols[cells].min())
+        window = source.read_native(row, col, int(rows[cells].max()) - row + 1, int(cols[cells].max()) - col + 1)
+        values[cells] = window[rows[cells] - row, cols[cells] - col]
+
+    return values
+
+
+# ----------------------------Connected components---------------------------- #
+
+def _run_pairs(rows, starts, ends, ncols, connectivity):
+    # index pairs of runs in consecutive rows that touch: share an edge, or with 8 connectivity a corner
+    width = ncols + 2
+    k = 1 if connectivity == 8 else 0
+    start_keys = rows * width + starts
+    end_keys = rows * width + ends
+
+    lo = np.searchsorted(end_keys, (rows + 1) * width + starts - k, side="right")
+    hi = np.searchsorted(start_keys, (rows + 1) * width + ends + k, side="left")
+    counts = np.maximum(hi - lo, 0)
+
+    a = np.repeat(np.arange(len(rows)), counts)
+    b = np.repeat(lo, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return a, b
+
+
+def connect(n, a, b):
+    """
+    Root of every node 0..n-1 of the graph with edges a-b, the smallest node of
+    its component: hooking on the smaller root and pointer jumping.
+    """
+    roots = np.arange(n)
+    while True:
+        ra, rb = roots[a], roots[b]
+        linked = ra != rb
+        if not linked.any():
+            return roots
+        low = np.minimum(ra[linked], rb[linked])
+        np.minimum.at(roots, ra[linked], low)
+        np.minimum.at(roots, rb[linked], low)
+        while True:
+            jumped = roots[roots]
+            if (jumped == roots).all():
+                break
+            roots = jumped
+
+
+def label_components(mask, connectivity=4):
+    """
+    Labels the connected components of a boolean array 1..count, 0 outside the
+    mask. Works on the runs of cells in each row: runs in consecutive rows that
+    touch are linked and the run graph is resolved with vectorized union find, so
+    the cost grows with the number of runs, not the number of cells.
+    Returns labels (int32) and count.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    nrows, ncols = mask.shape
+    padded = np.zeros((nrows, ncols + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    steps = np.diff(padded, axis=1)
+
+    rows, starts = np.nonzero(steps == 1)
+    ends = np.nonzero(steps == -1)[1]
+    labels = np.zeros((nrows, ncols), dtype=np.int32)
+    if not len(rows):
+        return labels, 0
+
+    a, b = _run_pairs(rows, starts, ends, ncols, connectivity)
+    roots, run_labels = np.unique(connect(len(rows), a, b), return_inverse=True)
+
+    lengths = ends - starts
+    first = np.repeat(rows * ncols + starts - (np.cumsum(lengths) - lengths), lengths)
+    labels.ravel()[first + np.arange(lengths.sum())] = np.repeat(run_labels.ravel() + 1, lengths)
+
+    return labels, len(roots)
+
+
+def filter_components(mask, cell_area, min_area=0.0, max_hole_area=0.0, connectivity=4):
+    """
+    Components of mask with at least min_area, after filling the holes smaller
+    than max_hole_area, relabeled 1..count; the raster domain equivalent of
+    RasterToPolygon, EliminatePolygonPart and an area selection on the polygons.
+    Returns labels (int32) and count.
+    """
+    mask = np.asarray(mask, dtype=bool)
+
+    if max_hole_area > 0:
+        # background components not touching the edge are holes; the background uses the dual connectivity
+        holes, count = label_components(~mask, 8 if connectivity == 4 else 4)
+        small = np.bincount(holes.ravel(), minlength=count + 1) * cell_area < max_hole_area
+        small[0] = False
+        small[np.concatenate([holes[0], holes[-1], holes[:, 0], holes[:, -1]])] = False
+        mask = mask | small[holes]
+
+    labels, count = label_components(mask, connectivity)
+    keep = np.bincount(labels.ravel(), minlength=count + 1) * cell_area >= min_area
+    keep[0] = False
+    relabel = (np.cumsum(keep) * keep).astype(np.int32)
+
+    return relabel[labels], int(keep.sum())
+
+
+# ----------------------------Clamping---------------------------- #
+
+class ClampSource(object):
+    """
+    A source with the values below minimum, e.g. negative depths, replaced by
+    replace_value (NaN for NoData). changed counts the cells replaced in all
+    blocks read so far.
+    """
+
+    def __init__(self, source, replace_value=0.0, minimum=0.0):
+        self.source = source
+        self.grid = source.grid
+        self.replace_value = np.nan if replace_value is None else float(replace_value)
+        self.minimum = minimum
+        self.changed = 0
+
+    def read_native(self, row, col, nrows, ncols):
+        block = self.source.read_native(row, col, nrows, ncols)
+        with np.errstate(invalid="ignore"):
+            below = block < self.minimum
+        count = int(np.count_nonzero(below))
+        if count:
+            block[below] = self.replace_value
+            self.changed += count
+        return block
+
+
+def clamp_blocks(source, replace_value=0.0, minimum=0.0, block_size=BLOCK_SIZE):
+    # yields row, col and the clamped block of only the blocks with values below minimum, with the cells changed
+    clamp = ClampSource(source, replace_value, minimum)
+    for row, col, nrows, ncols in iter_blocks(source.grid, block_size):
+        changed = clamp.changed
+        block = clamp.read_native(row, col, nrows, ncols)
+        if clamp.changed > changed:
+            yield row, col, block, clamp.changed - changed
+
+
+# ----------------------------arcpy bridge---------------------------- #
+
+def get_raster_grid(raster):
+    raster_object = arcpy.Raster(raster)
+    return RasterGrid(raster_object.extent.XMin, raster_object.extent.YMax,
+                      raster_object.meanCellWidth, raster_object.width, raster_object.height)
+
+
+def array_to_raster(array, grid, output_raster, spatial_reference):
+    # NaN becomes NoData
+    values = np.where(np.isnan(array), NODATA_FLOAT, array).astype(np.float32)
+    lower_left = arcpy.Point(grid.x_min, grid.y_max - grid.nrows * grid.cell_size)
+
+    out_raster = arcpy.NumPyArrayToRaster(values, lower_left, grid.cell_size, grid.cell_size, NODATA_FLOAT)
+    out_raster.save(output_raster)
+
+    if spatial_reference:
+        arcpy.DefineProjection_management(output_raster, spatial_reference)
+
+    return output_raster
+
+
+def int_array_to_raster(array, grid, output_raster, spatial_reference, nodata=NODATA_INT):
+    # integer raster, e.g. class codes or zones for RasterToPolygon
+    lower_left = arcpy.Point(grid.x_min, grid.y_max - grid.nrows * grid.cell_size)
+
+    out_raster = arcpy.NumPyArrayToRaster(np.asarray(array, dtype=np.int32), lower_left, grid.cell_size,
+                                          grid.cell_size, nodata)
+    out_raster.save(output_raster)
+
+    if spatial_reference:
+        arcpy.DefineProjection_management(output_raster, spatial_reference)
+
+    return output_raster
+
+
+def materialize(source, output_raster, spatial_reference, grid=None, block_size=BLOCK_SIZE, processes=1):
+    # write a (virtual) source to a raster dataset. Small grids are written in one go,
+    # large ones block by block into an empty output created first. Blocks are resolved in
+    # processes processes (see read_blocks), the output is written by this one.
+    if grid is None:
+        grid = source.grid
+
+    if arcpy.Exists(output_raster):
+        arcpy.Delete_management(output_raster)
+
+    if grid.nrows * grid.ncols <= MAX_IN_MEMORY_CELLS:
+        if processes == 1:
+            return array_to_raster(to_array(source, grid), grid, output_raster, spatial_reference)
+
+        array = np.empty((grid.nrows, grid.ncols))
+        for row, col, block in read_blocks(source, grid, block_size, processes):
+            array[row:row + block.shape[0], col:col + block.shape[1]] = block
+        return array_to_raster(array, grid, output_raster, spatial_reference)
+
+    # the empty output takes the extent of what is mosaicked into it, all blocks together cover the grid
+    create_raster(output_raster, grid, spatial_reference)
+    mosaic_blocks(read_blocks(source, grid, block_size, processes), grid, output_raster, "materialize_block")
+
+    return output_raster
+
+
+def create_raster(output_raster, grid, spatial_reference):
+    # empty single band float raster dataset with the cell size of grid, a target for mosaic_blocks
+    arcpy.CreateRasterDataset_management(os.path.dirname(output_raster), os.path.basename(output_raster),
+                                         grid.cell_size, "32_BIT_FLOAT", spatial_reference if spatial_reference else "#", 1)
+    return output_raster
+
+
+def mosaic_blocks(blocks, grid, target_raster, name="block"):
+    # writes row, col, block blocks of grid to scratch rasters and mosaics them all over target_raster in one
+    # Mosaic (LAST), returns the number of blocks
+    block_rasters = []
+    try:
+        for row, col, block in blocks:
+            block_raster = os.path.join(arcpy.env.scratchFolder, name + "_" + str(len(block_rasters)) + ".tif")
+            array_to_raster(block, block_grid(grid, row, col, block.shape[0], block.shape[1]), block_raster, None)
+            block_rasters.append(block_raster)
+
+        if block_rasters:
+            arcpy.Mosaic_management(";".join(block_rasters), target_raster, "LAST")
+    finally:
+        for block_raster in block_rasters:
+            arcpy.Delete_management(block_raster)
+
+    return len(block_rasters)
+
+
+def raster_minimum(raster):
+    # minimum from the cached statistics, None without statistics
+    try:
+        return arcpy.Raster(raster).minimum
+    except Exception:
+        return None
+
+
+def clamp_raster(input_raster, output_raster=None, replace_value=0.0, minimum=0.0, block_size=BLOCK_SIZE):
+    """
+    Con(raster, raster, replace_value, "VALUE >= minimum") streamed block by
+    block, replace_value None for NoData. Without output_raster the input is
+    patched in place: only the blocks with values below minimum are written and
+    mosaicked over the input in one Mosaic, so nothing else is copied.
+    Otherwise the clamped raster is written to output_raster, a plain copy when
+    the cached minimum shows there is nothing to clamp. arcpy only has
+    statistics of the whole raster, so blocks are read to find the values below
+    minimum. Returns the number of cells changed.
+    """
+    in_place = not output_raster or output_raster == input_raster
+    cached_minimum = raster_minimum(input_raster)
+    nothing_to_clamp = cached_minimum is not None and cached_minimum >= minimum
+
+    if not in_place:
+        if arcpy.Exists(output_raster):
+            arcpy.Delete_management(output_raster)
+
+        if nothing_to_clamp:
+            arcpy.CopyRaster_management(input_raster, output_raster)
+            return 0
+
+        clamp = ClampSource(RasterSource(input_raster), replace_value, minimum)
+        materialize(clamp, output_raster, arcpy.Describe(input_raster).spatialReference, block_size=block_size)
+        return clamp.changed
+
+    if replace_value is None:
+        # NoData in a mosaicked block keeps the value underneath
+        raise ValueError("Replacing values with NoData needs an output raster")
+
+    if nothing_to_clamp:
+        return 0
+
+    source = RasterSource(input_raster)
+    counts = []
+
+    def dirty_blocks():
+        for row, col, block, count in clamp_blocks(source, replace_value, minimum, block_size):
+            counts.append(count)
+            yield row, col, block
+
+    mosaic_blocks(dirty_blocks(), source.grid, input_raster, "clamp_block")
+    changed = sum(counts)
+
+    if changed:
+        arcpy.CalculateStatistics_management(input_raster)
+
+    return changed
@@ -4,6 +4,7 @@ import os
 
 import re
 import common_lib
+import raster_lib
 from common_lib import create_msg_body, msg, trace
 from settings import *
 
@@ -112,13 +113,23 @@ try:
                 txt_replace_value = "NoData"
                 replace_value = ""
 
+            # without an output raster, or with the input as output, the input is patched in place
+            in_place = not output_raster or output_raster == input_raster
+            if in_place:
+                output_raster = input_raster
+                if replace_value == "":
+                    raise NotSupported
+
             msg_body = create_msg_body(
                     "Setting replacement value for negative raster values to: " + txt_replace_value + " in " + output_raster + "...", 0, 0)
             msg(msg_body)
 
-            # con on mosaic
-            myConRaster = arcpy.sa.Con(input_raster, input_raster, replace_value, "VALUE >= 0")
-            myConRaster.save(output_raster)
+            # streamed Con(VALUE >= 0), only blocks with negative values are changed
+            changed = raster_lib.clamp_raster(input_raster, None if in_place else output_raster,
+                                              float(re.sub("[,.]", ".", replace_value)) if replace_value != "" else None)
+
+            msg_body = create_msg_body(str(changed) + " negative cells replaced.", 0, 0)
+            msg(msg_body)
 
             if arcpy.Exists(output_raster):
 #                output_layer = common_lib.get_name_from_feature_class(output_raster) + "no_negative"
@@ -164,6 +175,10 @@ except NoNoDataError:
     print("Input raster does not have NODATA values")
     arcpy.AddError("Input raster does not have NODATA values")
 
+except NotSupported:
+    print("Replacing negative values with NoData needs an output raster. Exiting...")
+    arcpy.AddError("Replacing negative values with NoData needs an output raster. Exiting...")
+
 except NoUnits:
     print("No units detected on input data")
     arcpy.AddError("No units detected on input data")
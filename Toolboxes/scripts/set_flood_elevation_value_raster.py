@@ -4,6 +4,7 @@ import os
 
 import re
 import common_lib
+import raster_lib
 from common_lib import create_msg_body, msg, trace
 from settings import *
 
@@ -51,7 +52,7 @@ class FunctionError(Exception):
 
 # used functions
 
-def set_value(input_source, no_flood_value, flood_elevation_value, output_raster, debug):
+def set_value(input_source, no_flood_value, flood_elevation_value, output_raster, debug, wet_mask=None):
     try:
         # Get Attributes from User
         if debug == 0:
@@ -110,34 +111,24 @@ def set_value(input_source, no_flood_value, flood_elevation_value, output_raster
                             "Setting no flood value: " + no_flood_value + " to NoData in copy of " + common_lib.get_name_from_feature_class(
                                 input_source) + "...", 0, 0)
                         msg(msg_body)
-                        null_for_no_flooded_areas_raster = os.path.join(scratch_ws, "null_for_flooded")
-                        if arcpy.Exists(null_for_no_flooded_areas_raster):
-                            arcpy.Delete_management(null_for_no_flooded_areas_raster)
-
-                        whereClause = "VALUE = " + no_flood_value
-
-                        # Execute SetNull
-                        outSetNull_temp = arcpy.sa.SetNull(input_source, input_source, whereClause)
-                        outSetNull_temp.save(null_for_no_flooded_areas_raster)
-
-                        input_source = null_for_no_flooded_areas_raster
-
+                        no_flood = float(re.sub("[,.]", ".", no_flood_value))
                     else:
                         raise ValueError
+                else:
+                    no_flood = None
 
-                # check where there is IsNull and set the con values
-                is_Null = os.path.join(scratch_ws, "is_Null")
-                if arcpy.Exists(is_Null):
-                    arcpy.Delete_management(is_Null)
+                # SetNull and IsNull / Con in one pass: the input is read once into a packed wet cell mask and
+                # the output is the flood elevation value on the wet cells. The mask is kept in wet_mask, the
+                # Output Wet Mask parameter, for the Wet Mask parameter of Create Depth Elevation Raster and Flooding Exposure.
+                if not wet_mask:
+                    wet_mask = os.path.join(arcpy.env.scratchFolder, "wet_mask.npy")
 
-                is_Null_raster = arcpy.sa.IsNull(input_source)
-                is_Null_raster.save(is_Null)
+                mask, wet_cells = raster_lib.write_wet_mask(raster_lib.RasterSource(input_source), wet_mask, no_flood)
+                msg_body = create_msg_body(str(wet_cells) + " flooded cells found.", 0, 0)
+                msg(msg_body)
 
-                # Con
-                if arcpy.Exists(output_raster):
-                    arcpy.Delete_management(output_raster)
-                temp_con_raster = arcpy.sa.Con(is_Null, input_source, flood_elevation_value)
-                temp_con_raster.save(output_raster)
+                raster_lib.materialize(raster_lib.WetMask(wet_mask, mask.grid, flood_elevation_value), output_raster,
+                                       arcpy.Describe(input_source).spatialReference)
 
                 msg_body = create_msg_body(
                             "Setting flood elevation value to: " + str(flood_elevation_value) + " in " + common_lib.get_name_from_feature_class(output_raster) + "...", 0, 0)
@@ -137,6 +137,7 @@ def main():
             no_flood_value = arcpy.GetParameterAsText(1)
             flood_elevation_value = arcpy.GetParameterAsText(2)
             output_features = arcpy.GetParameterAsText(3)
+            wet_mask = arcpy.GetParameterAsText(5) if arcpy.GetArgumentCount() > 5 else ""
 
             # script variables
             aprx = arcpy.mp.ArcGISProject("CURRENT")
@@ -152,6 +153,7 @@ def main():
             flood_elevation_value = "5"
             no_flood_value = "NoData"
             output_features = r'D:\\Gert\\Work\\Esri\\Solutions\\3DFloodImpact\\work2.1\\3DFloodImpact\\Testing.gdb\\FloodElevationRaster'
+            wet_mask = ""
 
             home_directory = r'D:\\Gert\Work\\Esri\\Solutions\\3DFloodImpact\\work2.1\\3DFloodImpact'
             layer_directory = home_directory + "\\layer_files"
@@ -176,7 +178,8 @@ def main():
         flood_raster = set_flood_elevation_value_raster.set_value(input_source=full_path_source,
                                     no_flood_value=no_flood_value,
                                     flood_elevation_value=flood_elevation_value,
-                                    output_raster=output_features, debug=0)
+                                    output_raster=output_features, debug=0,
+                                    wet_mask=wet_mask)
 
         if arcpy.Exists(flood_raster):
                 output_layer = common_lib.get_name_from_feature_class(flood_raster)
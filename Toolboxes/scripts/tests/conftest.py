@@ -0,0 +1,5 @@
+# the scripts import each other as top level modules, as they do inside ArcGIS Pro
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+import hand_lib
+import raster_lib
+
+
+def _dem(nrows, ncols, seed=0):
+    # rolling terrain in whole metres, so with flats, pits, NoData holes and a flat area
+    y, x = np.mgrid[0:nrows, 0:ncols]
+    random = np.random.RandomState(seed)
+    dem = np.round(10.0 * np.sin(x / 7.0) + 8.0 * np.cos(y / 9.0) + 0.05 * x + 3.0 * random.rand(nrows, ncols))
+    dem[random.rand(nrows, ncols) < 0.02] = np.nan
+    dem[5:9, 10:20] = np.nan
+    dem[20:30, 20:30] = dem[20, 20]
+    return raster_lib.ArraySource(dem, raster_lib.RasterGrid(0.0, float(nrows), 1.0, ncols, nrows))
+
+
+def _filled(source, tile_size):
+    tiles = hand_lib.Tiles(source.grid.nrows, source.grid.ncols, tile_size)
+    return np.asarray(hand_lib.fill(source, tiles))[1:-1, 1:-1]
+
+
+def test_fill_drains_every_cell():
+    source = _dem(45, 61)
+    filled = _filled(source, 1024)
+    dem = source.array
+
+    assert (np.isnan(filled) == np.isnan(dem)).all()
+    assert (filled[~np.isnan(dem)] >= dem[~np.isnan(dem)]).all()
+
+    # every cell has a path that never rises to a cell next to NoData, found by flooding down from those cells
+    padded = np.pad(filled, 1, constant_values=np.nan)
+    reached = np.zeros(padded.shape, dtype=bool)
+    for dr, dc in hand_lib.D8_STEPS:
+        reached[1:-1, 1:-1] |= np.isnan(padded[1 + dr:padded.shape[0] - 1 + dr, 1 + dc:padded.shape[1] - 1 + dc])
+    reached &= ~np.isnan(padded)
+    while True:
+        grown = reached.copy()
+        for dr, dc in hand_lib.D8_STEPS:
+            neighbour = np.roll(np.roll(reached, dr, axis=0), dc, axis=1)
+            higher = np.roll(np.roll(padded, dr, axis=0), dc, axis=1) <= padded
+            grown |= neighbour & higher
+        if (grown == reached).all():
+            break
+        reached = grown
+    assert reached[1:-1, 1:-1][~np.isnan(dem)].all()
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_tiles_match_one_tile(seed):
+    source = _dem(40 + 7 * seed, 61 - 3 * seed, seed)
+    heights, streams = hand_lib.hand(source, 20, tile_size=1024)
+
+    assert streams.any() and (heights[streams] == 0.0).all()
+    assert (heights[~np.isnan(heights)] >= 0.0).all()
+    for tile_size in (3, 7, 16):
+        np.testing.assert_array_equal(_filled(source, tile_size), _filled(source, 1024))
+        tiled_heights, tiled_streams = hand_lib.hand(source, 20, tile_size=tile_size)
+        np.testing.assert_array_equal(tiled_streams, streams)
+        np.testing.assert_array_equal(tiled_heights, heights)
+
+
+def test_hand_of_a_valley(tmp_path):
+    # a v-shaped valley draining south: the stream is the valley floor, HAND the height above it
+    y, x = np.mgrid[0:30, 0:21]
+    dem = np.abs(x - 10) * 2.0 + (30 - y) * 0.1
+    source = raster_lib.ArraySource(dem, raster_lib.RasterGrid(0.0, 30.0, 1.0, 21, 30))
+
+    heights, streams = hand_lib.hand(source, 25, tile_size=8, prefix=str(tmp_path / "hand"), processes=2)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["hand_hand.npy", "hand_streams.npy"]
+
+    assert streams[:, 10].sum() >= 20 and streams[:, :10].sum() == 0 and streams[:, 11:].sum() == 0
+    rows = np.flatnonzero(streams[:, 10])
+    np.testing.assert_allclose(heights[rows][:, [4, 16]], 12.0)
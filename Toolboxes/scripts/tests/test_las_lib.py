@@ -0,0 +1,108 @@
+import struct
+
+import numpy as np
+import pytest
+
+import las_lib
+import raster_lib
+
+
+def _write_las(path, x, y, z, classes, returns, counts, point_format=0, withheld=None, compressed=False):
+    # LAS 1.2 file with point format 0 or 1, scale 0.01 and offset (1000, 2000, 0)
+    dtype = las_lib.point_dtype(point_format)
+    records = np.zeros(len(x), dtype=dtype)
+    records["X"] = np.round((np.asarray(x) - 1000.0) / 0.01)
+    records["Y"] = np.round((np.asarray(y) - 2000.0) / 0.01)
+    records["Z"] = np.round(np.asarray(z) / 0.01)
+    records["return_byte"] = np.asarray(returns) | (np.asarray(counts) << 3)
+    records["classification"] = np.asarray(classes) | np.where(withheld if withheld is not None else False, 0x80, 0)
+
+    header = bytearray(227)
+    header[0:4] = las_lib.LAS_SIGNATURE
+    header[24:26] = bytes([1, 2])
+    struct.pack_into("<HII", header, 94, 227, 227, 0)
+    struct.pack_into("<BHI", header, 104, point_format | (0x80 if compressed else 0), dtype.itemsize, len(x))
+    struct.pack_into("<3d3d", header, 131, 0.01, 0.01, 0.01, 1000.0, 2000.0, 0.0)
+    struct.pack_into("<6d", header, 179, max(x), min(x), max(y), min(y), max(z), min(z))
+
+    with open(str(path), "wb") as f:
+        f.write(bytes(header))
+        f.write(records.tobytes())
+    return str(path)
+
+
+def _points():
+    x = [1000.5, 1001.5, 1002.5, 1003.5, 1004.5, 1005.5]
+    y = [2000.5, 2001.5, 2002.5, 2003.5, 2004.5, 2005.5]
+    z = [10.0, 11.0, 12.0, 13.0, 14.0, 15.0]
+    classes = [2, 2, 6, 6, 7, 1]
+    returns = [1, 1, 2, 1, 1, 3]
+    counts = [1, 2, 2, 3, 1, 3]
+    return x, y, z, classes, returns, counts
+
+
+def test_las_file(tmp_path):
+    x, y, z, classes, returns, counts = _points()
+    las = las_lib.LasFile(_write_las(tmp_path / "a.las", x, y, z, classes, returns, counts, point_format=1))
+
+    assert las.point_count == 6 and las.point_format == 1 and las.legacy
+    assert las.bounds == (1000.5, 2000.5, 10.0, 1005.5, 2005.5, 15.0)
+
+    points = las_lib.las_points(las, las.points)
+    np.testing.assert_allclose(points.x, x)
+    np.testing.assert_allclose(points.y, y)
+    np.testing.assert_allclose(points.z, z)
+    assert points.classification.tolist() == classes
+    assert points.return_number.tolist() == returns and points.number_of_returns.tolist() == counts
+
+
+def test_point_mask(tmp_path):
+    x, y, z, classes, returns, counts = _points()
+    withheld = np.array([False, False, False, False, False, True])
+    las = las_lib.LasFile(_write_las(tmp_path / "a.las", x, y, z, classes, returns, counts, withheld=withheld))
+    records = las.points
+
+    def selected(**filters):
+        return np.flatnonzero(las_lib.point_mask(las, records, **filters)).tolist()
+
+    assert selected() == [0, 1, 2, 3, 4]
+    assert selected(withheld=True, class_codes=[2, 1]) == [0, 1, 5]
+    assert selected(returns="FIRST") == [0, 1, 3, 4]
+    assert selected(returns="LAST") == [0, 2, 4]
+    assert selected(returns="SINGLE") == [0, 4]
+    assert selected(returns="FIRST_OF_MANY") == [1, 3]
+    assert selected(returns="LAST_OF_MANY", withheld=True) == [2, 5]
+    assert selected(returns=[2]) == [2]
+    # extent edges are inside
+    assert selected(extent=(1001.5, 2000.0, 1003.5, 2010.0)) == [1, 2, 3]
+    assert las_lib.point_mask(las, records, withheld=True) is None
+
+
+def test_readable(tmp_path):
+    x, y, z, classes, returns, counts = _points()
+    plain = _write_las(tmp_path / "a.las", x, y, z, classes, returns, counts)
+    compressed = _write_las(tmp_path / "b.las", x, y, z, classes, returns, counts, compressed=True)
+    laz = _write_las(tmp_path / "c.laz", x, y, z, classes, returns, counts)
+
+    assert las_lib.readable([plain])
+    assert not las_lib.readable([plain, compressed])
+    assert not las_lib.readable([plain, laz])
+    assert not las_lib.readable([plain, str(tmp_path / "missing.las")])
+    with pytest.raises(las_lib.LasError):
+        las_lib.LasFile(compressed)
+
+
+def test_bin_las_files(tmp_path):
+    x, y, z, classes, returns, counts = _points()
+    files = [_write_las(tmp_path / "a.las", x[:3], y[:3], z[:3], classes[:3], returns[:3], counts[:3]),
+             _write_las(tmp_path / "b.las", x[3:], y[3:], z[3:], classes[3:], returns[3:], counts[3:])]
+
+    grid = las_lib.las_grid(files, 1.0)
+    binner, = las_lib.bin_las_files(files, [grid], [["MAXIMUM"]], class_codes=[2, 6], processes=1)
+    maximum = binner.result("MAXIMUM")
+
+    assert grid.x_min <= 1000.5 and grid.y_max >= 2005.5
+    np.testing.assert_array_equal(np.sort(maximum[~np.isnan(maximum)]), [10.0, 11.0, 12.0, 13.0])
+    assert binner.result("COUNT").sum() == 4
+    row, col = raster_lib.window_for_extent(grid, 1003.5, 2003.5, 1003.5, 2003.5)[:2]
+    assert maximum[row, col] == 13.0
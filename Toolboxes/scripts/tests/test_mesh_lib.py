@@ -0,0 +1,80 @@
+import numpy as np
+
+import mesh_lib
+import raster_lib
+
+
+def _source(nrows, ncols, nodata=None):
+    y, x = np.mgrid[0:nrows, 0:ncols]
+    heights = 10.0 + 0.5 * x - 0.25 * y + np.where((x > 20) & (y > 10), 3.0 * np.sin(x / 3.0) * np.cos(y / 4.0), 0.0)
+    if nodata is not None:
+        heights[nodata] = np.nan
+    return raster_lib.ArraySource(heights, raster_lib.RasterGrid(100.0, 200.0, 2.0, ncols, nrows)), heights
+
+
+def _surface_error(vertices, faces, grid, heights):
+    # largest vertical distance of the cell centers inside the faces to the mesh
+    a, b, c = vertices[faces[:, 0]], vertices[faces[:, 1]], vertices[faces[:, 2]]
+    rows, cols = np.nonzero(~np.isnan(heights))
+    x = grid.x_min + (cols + 0.5) * grid.cell_size
+    y = grid.y_max - (rows + 0.5) * grid.cell_size
+
+    error = 0.0
+    for face in range(len(faces)):
+        area = (b[face, 0] - a[face, 0]) * (c[face, 1] - a[face, 1]) - (b[face, 1] - a[face, 1]) * (c[face, 0] - a[face, 0])
+        wa = ((b[face, 0] - x) * (c[face, 1] - y) - (b[face, 1] - y) * (c[face, 0] - x)) / area
+        wb = ((c[face, 0] - x) * (a[face, 1] - y) - (c[face, 1] - y) * (a[face, 0] - x)) / area
+        wc = 1.0 - wa - wb
+        inside = (wa >= -1e-9) & (wb >= -1e-9) & (wc >= -1e-9)
+        z = wa * a[face, 2] + wb * b[face, 2] + wc * c[face, 2]
+        if inside.any():
+            error = max(error, np.abs(z[inside] - heights[rows[inside], cols[inside]]).max())
+    return error
+
+
+def _check_mesh(vertices, faces):
+    # counter clockwise faces, every edge shared by at most two faces
+    a, b, c = vertices[faces[:, 0]], vertices[faces[:, 1]], vertices[faces[:, 2]]
+    area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+    assert (area > 0).all()
+
+    edges = np.sort(np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]]), axis=1)
+    _, counts = np.unique(edges, axis=0, return_counts=True)
+    assert counts.max() <= 2
+
+
+def test_triangulate_within_tolerance():
+    source, heights = _source(33, 49)
+    vertices, faces = mesh_lib.triangulate(source, z_tolerance=0.1, tile_size=16)
+
+    _check_mesh(vertices, faces)
+    assert len(vertices) < heights.size
+    assert _surface_error(vertices, faces, source.grid, heights) <= 0.1 + 1e-9
+
+    # a plane is two triangles per tile
+    plane = raster_lib.ArraySource(np.add.outer(np.arange(17.0), np.arange(17.0)), raster_lib.RasterGrid(0.0, 17.0, 1.0, 17, 17))
+    vertices, faces = mesh_lib.triangulate(plane, z_tolerance=0.01, tile_size=16)
+    assert len(faces) == 2 and len(vertices) == 4
+
+
+def test_triangulate_leaves_out_nodata():
+    nodata = np.zeros((33, 33), dtype=bool)
+    nodata[5:12, 8:20] = True
+    source, heights = _source(33, 33, nodata)
+    vertices, faces = mesh_lib.triangulate(source, z_tolerance=0.1, tile_size=16)
+
+    _check_mesh(vertices, faces)
+    assert not np.isnan(vertices).any()
+    cols = np.round((vertices[:, 0] - source.grid.x_min) / source.grid.cell_size - 0.5).astype(np.int64)
+    rows = np.round((source.grid.y_max - vertices[:, 1]) / source.grid.cell_size - 0.5).astype(np.int64)
+    assert not nodata[rows, cols].any()
+
+
+def test_decimate_within_deviation():
+    source, heights = _source(33, 33)
+    vertices, faces = mesh_lib.triangulate(source, z_tolerance=0.0, tile_size=16)
+    decimated, decimated_faces = mesh_lib.decimate(vertices, faces, max_deviation=0.2)
+
+    _check_mesh(decimated, decimated_faces)
+    assert len(decimated_faces) < len(faces)
+    assert _surface_error(decimated, decimated_faces, source.grid, heights) <= 0.2 + 1e-9
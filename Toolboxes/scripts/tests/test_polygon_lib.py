@@ -0,0 +1,80 @@
+import numpy as np
+
+import polygon_lib
+import raster_lib
+
+
+def _rings(*rings):
+    # (feature, ring vertices) pairs, outer rings clockwise and holes counter clockwise
+    xy = np.array([vertex for feature, ring in rings for vertex in ring], dtype=np.float64)
+    offsets = np.concatenate([[0], np.cumsum([len(ring) for feature, ring in rings])]).astype(np.int64)
+    features = np.array([feature for feature, ring in rings], dtype=np.int64)
+    return polygon_lib.Rings(xy, offsets, features)
+
+
+def _square(x_min, y_min, x_max, y_max, hole=False):
+    ring = [(x_min, y_min), (x_min, y_max), (x_max, y_max), (x_max, y_min)]
+    return ring[::-1] if hole else ring
+
+
+GRID = raster_lib.RasterGrid(0.0, 10.0, 1.0, 10, 10)
+
+
+def test_burn_cell_center():
+    # a cell is in when its center is, centers on the left and bottom edge are in, on the right and top edge out
+    band = polygon_lib.burn_band(_rings((0, _square(1.5, 2.5, 4.5, 6.5))), [1.0], GRID)
+    expected = np.full((10, 10), np.nan)
+    expected[4:8, 1:4] = 1.0
+    np.testing.assert_array_equal(band, expected)
+
+    # no cell center inside, no cells
+    band = polygon_lib.burn_band(_rings((0, _square(2.1, 2.1, 2.4, 2.4))), [1.0], GRID)
+    assert np.isnan(band).all()
+
+
+def test_burn_holes_and_multipart():
+    rings = _rings((0, _square(0, 0, 6, 6)), (0, _square(2, 2, 4, 4, hole=True)), (0, _square(7, 7, 9, 9)))
+    band = polygon_lib.burn_band(rings, np.array([5], dtype=np.int32), GRID, fill=0)
+
+    expected = np.zeros((10, 10), dtype=np.int32)
+    expected[4:10, 0:6] = 5
+    expected[6:8, 2:4] = 0
+    expected[1:3, 7:9] = 5
+    np.testing.assert_array_equal(band, expected)
+
+
+def test_burn_priority():
+    rings = _rings((0, _square(0, 0, 6, 6)), (1, _square(3, 3, 9, 9)))
+    overlap = (slice(4, 7), slice(3, 6))
+
+    # the last feature wins without priority, the highest priority with
+    band = polygon_lib.burn_band(rings, [1.0, 2.0], GRID)
+    assert (band[overlap] == 2.0).all()
+    band = polygon_lib.burn_band(rings, [1.0, 2.0], GRID, priority=np.array([2, 1]))
+    assert (band[overlap] == 1.0).all()
+    assert np.count_nonzero(band == 1.0) == 36 and np.count_nonzero(band == 2.0) == 27
+
+
+def test_burn_polygons_bands():
+    rings = _rings((0, _square(0.3, 0.2, 6.1, 9.7)), (1, _square(2, 1, 9.5, 4)),
+                   (1, _square(3, 2, 5, 3, hole=True)), (2, _square(5, 5, 8, 8)))
+    values = np.array([1.0, 2.0, 3.0])
+    priority = np.array([3, 1, 2])
+
+    expected = polygon_lib.burn_band(rings, values, GRID, priority)
+    for processes in (1, 2):
+        burned = polygon_lib.burn_polygons(rings, values, GRID, priority, band_rows=3, processes=processes)
+        np.testing.assert_array_equal(burned, expected)
+
+
+def test_chaikin_keeps_shared_vertices():
+    # two cells of a raster outline touching at a corner
+    rings = _rings((0, _square(0, 0, 1, 1)), (1, _square(1, 1, 2, 2)))
+    smoothed = polygon_lib.chaikin(rings, 3)
+
+    corner = np.flatnonzero((smoothed.xy == [1.0, 1.0]).all(axis=1))
+    assert len(corner) == 2
+    assert (np.searchsorted(smoothed.offsets, corner, side="right") - 1).tolist() == [0, 1]
+    # only the corner is shared, the first ring stays in its cell
+    first = smoothed.xy[smoothed.offsets[0]:smoothed.offsets[1]]
+    assert (first >= 0.0).all() and (first <= 1.0).all()
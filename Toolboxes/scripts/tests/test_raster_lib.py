@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+import raster_lib
+import zonal_lib
+
+
+def _source():
+    array = np.arange(20.0).reshape(4, 5)
+    array[1, 1] = np.nan
+    return raster_lib.ArraySource(array, raster_lib.RasterGrid(0.0, 4.0, 1.0, 5, 4))
+
+
+def test_read_cells():
+    values = raster_lib.read_cells(_source(), [0, 3, 1], [0, 4, 1], block_size=2)
+    np.testing.assert_array_equal(values, [0.0, 19.0, np.nan])
+
+
+def test_read_cells_without_cells():
+    values = raster_lib.read_cells(_source(), [], [])
+    assert values.shape == (0,)
+
+
+def test_zonal_reduce_without_cells():
+    # features without a cell centre on the surface, e.g. sub-cell bridges, get no statistics
+    values = raster_lib.read_cells(_source(), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    result = zonal_lib.zonal_reduce(np.zeros(0, dtype=np.int64), values, 3, "MINIMUM")
+    assert np.isnan(result).all() and result.shape == (3,)
+
+
+def test_virtual_mosaic_without_sources():
+    with pytest.raises(ValueError):
+        raster_lib.VirtualMosaic([], grid=raster_lib.RasterGrid(0.0, 4.0, 1.0, 5, 4))
@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pytest
+
+import raster_lib
+import tile_lib
+
+
+def _elevations(nrows, ncols, seed=0):
+    y, x = np.mgrid[0:nrows, 0:ncols]
+    noise = np.random.RandomState(seed).normal(0.0, 0.3, (nrows, ncols))
+    return (100.0 + 20.0 * np.sin(x / 30.0) + 5.0 * np.cos(y / 17.0) + noise).astype(np.float32)
+
+
+@pytest.mark.parametrize("max_error", [0.0, 0.01, 0.1])
+def test_encode_tile_error_bound(max_error):
+    z = _elevations(256, 256)
+    z[40:90, 30:200] = np.nan
+    z[np.random.RandomState(1).rand(256, 256) < 0.05] = np.nan
+
+    decoded = tile_lib.decode_tile(tile_lib.encode_tile(z, max_error))
+    valid = ~np.isnan(z)
+    np.testing.assert_array_equal(np.isnan(decoded), ~valid)
+    # decoded values are float32, allow for their rounding
+    assert (np.abs(decoded[valid] - z[valid]) <= max_error + np.spacing(z[valid])).all()
+
+
+def test_encode_tile_edge_blocks_and_constants():
+    for z in (_elevations(37, 53), np.full((16, 16), 2.5, np.float32), np.full((8, 8), np.nan, np.float32)):
+        decoded = tile_lib.decode_tile(tile_lib.encode_tile(z, 0.05))
+        np.testing.assert_allclose(decoded, z, atol=0.05 + 1e-4)
+
+
+def _bundles(cache_folder):
+    tiles = {}
+    for root, _, names in os.walk(os.path.join(cache_folder, tile_lib.TILES_FOLDER)):
+        for name in names:
+            for tile, blob in tile_lib.read_bundle(os.path.join(root, name)).items():
+                tiles[(os.path.basename(root), tile)] = blob
+    return tiles
+
+
+def test_refresh_matches_full_build(tmp_path):
+    grid = raster_lib.RasterGrid(-8530000.0, 4770000.0, 0.9 * tile_lib.resolution(15), 300, 200)
+    source_file = str(tmp_path / "source.npy")
+    elevations = _elevations(200, 300)
+    raster_lib.to_memmap(raster_lib.ArraySource(elevations, grid), source_file)
+
+    refreshed = str(tmp_path / "refreshed")
+    tile_lib.build_tile_cache(source_file, grid, refreshed, 12, 16, 0.05, str(tmp_path / "work"), processes=1,
+                              incremental=True)
+
+    # raise a corner of the source, drop some cells to NoData
+    elevations[150:, 220:] += 3.0
+    elevations[10:20, 10:20] = np.nan
+    raster_lib.to_memmap(raster_lib.ArraySource(elevations, grid), source_file)
+    counts = tile_lib.refresh_tile_cache(source_file, grid, refreshed, 12, 16, 0.05, str(tmp_path / "work"),
+                                         processes=1)
+
+    rebuilt = str(tmp_path / "rebuilt")
+    full = tile_lib.build_tile_cache(source_file, grid, rebuilt, 12, 16, 0.05, str(tmp_path / "work"),
+                                     processes=1)
+
+    assert 0 < counts[16] < full[16]
+    assert _bundles(refreshed) == _bundles(rebuilt)
+    for name in (tile_lib.CONF_XML, tile_lib.CONF_CDI):
+        with open(os.path.join(refreshed, name)) as a, open(os.path.join(rebuilt, name)) as b:
+            assert a.read() == b.read()
@@ -0,0 +1,891 @@
+# -------------------------------------------------------------------------------
+# Name:        tile_lib
+# Purpose:     NumPy elevation tile cache: Web Mercator (ArcGIS Online) tiling
+#              scheme, an error bounded LERC2 tile encoder and a parallel
+#              pyramid builder writing compact cache V2 bundles, conf.xml and
+#              conf.cdi to a local cache folder that ExportTileCache packages,
+#              refreshed incrementally from a manifest of source and tile hashes.
+#
+# Author:      Gert van Maren
+#
+# Created:     19/10/2026
+# Copyright:   (c) Esri 2026
+# updated:
+# updated:
+# updated:
+
+# Required:    numpy. arcpy only to project and read the input raster.
+
+# -------------------------------------------------------------------------------
+
+import os
+import json
+import struct
+import hashlib
+
+import numpy as np
+
+import raster_lib
+
+try:
+    import arcpy
+except ImportError:  # the engines don't need arcpy, e.g. for testing
+    arcpy = None
+
+# Constants
+TILE_SIZE = 256
+MICRO_BLOCK = 8             # cells along each side of the blocks quantized with their own offset and bit depth
+CHUNK_TILES = 16            # tiles along each side of the chunks encoded per job, divides BUNDLE_TILES
+BUNDLE_TILES = 128          # tiles along each side of a bundle file
+
+# ArcGIS Online / Bing Maps / Google Maps tiling scheme, scales of levels 0 - 19 at 96 dpi
+ORIGIN_X = -20037508.342787
+ORIGIN_Y = 20037508.342787
+DPI = 96
+SCALES = [591657527.591555, 295828763.795777, 147914381.897889, 73957190.948944, 36978595.474472,
+          18489297.737236, 9244648.868618, 4622324.434309, 2311162.217155, 1155581.108577,
+          577790.554289, 288895.277144, 144447.638572, 72223.819286, 36111.909643,
+          18055.954822, 9027.977411, 4513.988705, 2256.994353, 1128.497176]
+LEVELS = len(SCALES)
+WEB_MERCATOR = [3857, 102100, 102113]
+
+CONF_XML = "conf.xml"           # tiling scheme and tile format, as ManageTileCache writes it
+CONF_CDI = "conf.cdi"           # extent of the cached data
+TILES_FOLDER = "_alllayers"
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+LEVELS_FOLDER = "levels"        # level files kept by incremental caches, parents are averaged again from them
+HASH_BLOCK = 512                # cells along each side of the source blocks hashed in the manifest
+
+# tile: LERC2 version 2 blob of float32 values, header, RLE compressed validity bits unless all or no cells are
+# valid, then the micro blocks
+LERC_SIGNATURE = b"Lerc2 "
+LERC_VERSION = 2
+LERC_HEADER = "<6s7i3d"         # signature, version, rows, cols, valid cells, micro block size, blob size, data
+                                # type, max error, z min, z max
+LERC_FLOAT = 6                  # data type code of float32
+LERC_OFFSET_TYPES = {0: "<f4", 1: "<i2", 2: "u1"}   # types of float block offsets, by the 2 high flag bits
+RLE_END = -32768                # count that ends an RLE stream
+RLE_MIN_RUN = 5                 # equal bytes stored as a run, shorter runs are copied
+RLE_MAX_COUNT = 32767
+
+# bundle: compact cache V2, header, index of offset (5 bytes) and size (3 bytes) per tile, the tiles each after
+# their size
+BUNDLE_VERSION = 3
+BUNDLE_RECORDS = BUNDLE_TILES * BUNDLE_TILES
+BUNDLE_HEADER = "<4i3q6i"       # version, records, largest tile, offset bytes, slack, file size, user header
+                                # offset, user header size, 4 legacy values, index size
+OFFSET_BYTES = 5
+OFFSET_MASK = (1 << 8 * OFFSET_BYTES) - 1
+
+WEB_MERCATOR_WKT = ('PROJCS["WGS_1984_Web_Mercator_Auxiliary_Sphere",GEOGCS["GCS_WGS_1984",DATUM["D_WGS_1984",'
+                    'SPHEROID["WGS_1984",6378137.0,298.257223563]],PRIMEM["Greenwich",0.0],'
+                    'UNIT["Degree",0.0174532925199433]],PROJECTION["Mercator_Auxiliary_Sphere"],'
+                    'PARAMETER["False_Easting",0.0],PARAMETER["False_Northing",0.0],'
+                    'PARAMETER["Central_Meridian",0.0],PARAMETER["Standard_Parallel_1",0.0],'
+                    'PARAMETER["Auxiliary_Sphere_Type",0.0],UNIT["Meter",1.0],AUTHORITY["EPSG",3857]]')
+XML_NAMESPACES = ("xmlns:xsi='http://www.w3.org/2001/XMLSchema-instance' "
+                  "xmlns:xs='http://www.w3.org/2001/XMLSchema' "
+                  "xmlns:typens='http://www.esri.com/schemas/ArcGIS/10.3'")
+
+
+# ----------------------------Tiling scheme---------------------------- #
+
+def resolution(level):
+    # map units (meters) per pixel
+    return SCALES[level] * 0.0254 / DPI
+
+
+def level_for_resolution(cell_size, max_level=LEVELS - 1):
+    # finest level with pixels at least cell_size, the level a raster is cached at without oversampling
+    level = 0
+    while level < max_level and resolution(level + 1) >= cell_size:
+        level += 1
+    return level
+
+
+def tile_range(extent, level):
+    # first and last + 1 tile row and col covering x_min, y_min, x_max, y_max
+    x_min, y_min, x_max, y_max = extent
+    size = TILE_SIZE * resolution(level)
+    row0 = int(np.floor((ORIGIN_Y - y_max) / size))
+    row1 = int(np.ceil((ORIGIN_Y - y_min) / size))
+    col0 = int(np.floor((x_min - ORIGIN_X) / size))
+    col1 = int(np.ceil((x_max - ORIGIN_X) / size))
+    return max(row0, 0), max(row1, row0 + 1), max(col0, 0), max(col1, col0 + 1)
+
+
+def tiles_grid(level, row, col, nrows=1, ncols=1):
+    # raster grid of a block of nrows by ncols tiles starting at tile row, col
+    res = resolution(level)
+    return raster_lib.RasterGrid(ORIGIN_X + col * TILE_SIZE * res, ORIGIN_Y - row * TILE_SIZE * res, res,
+                                 ncols * TILE_SIZE, nrows * TILE_SIZE)
+
+
+# ----------------------------Tile encoding---------------------------- #
+# LERC2: every MICRO_BLOCK block stores a flag byte, its low 2 bits the kind of
+# block and bits 2 - 5 a check on the block col: 2 all values 0 or none valid, 3
+# all values the offset, 1 the offset and the valid values quantized to multiples
+# of twice the maximum error above it, bit stuffed, 0 the float32 values. Every
+# decoded value is within max_error; max_error 0 keeps the float32 values.
+
+def _rle(data):
+    # RLE of a byte string as in LERC2 masks: int16 counts, > 0 followed by as many bytes, < 0 by one byte repeated
+    data = np.frombuffer(data, np.uint8)
+    starts = np.flatnonzero(np.r_[True, data[1:] != data[:-1]])
+    lengths = np.diff(np.r_[starts, len(data)])
+
+    parts = []
+
+    def copy(start, end):
+        for first in range(start, end, RLE_MAX_COUNT):
+            last = min(first + RLE_MAX_COUNT, end)
+            parts.append(struct.pack("<h", last - first) + data[first:last].tobytes())
+
+    copied = 0
+    for start, length in zip(starts.tolist(), lengths.tolist()):
+        if length < RLE_MIN_RUN:
+            continue
+        copy(copied, start)
+        for first in range(start, start + length, RLE_MAX_COUNT):
+            parts.append(struct.pack("<hB", -min(RLE_MAX_COUNT, start + length - first), data[start]))
+        copied = start + length
+    copy(copied, len(data))
+    parts.append(struct.pack("<h", RLE_END))
+
+    return b"".join(parts)
+
+
+def _unrle(blob, offset):
+    # bytes of an RLE stream at offset
+    data = []
+    while True:
+        count = struct.unpack_from("<h", blob, offset)[0]
+        offset += 2
+        if count == RLE_END:
+            return b"".join(data)
+        if count > 0:
+            data.append(blob[offset:offset + count])
+            offset += count
+        else:
+            data.append(blob[offset:offset + 1] * -count)
+            offset += 1
+
+
+def _word_order(size):
+    # LERC2 version 2 bit streams are little endian uint32 words, the last one cut to the bytes it uses: the byte
+    # order that turns a big endian stream into that, and back
+    index = np.arange(size)
+    first = index - index % 4
+    return first + np.minimum(size - first, 4) - 1 - index % 4
+
+
+def _stuff(values, nbits):
+    # each row of unsigned integers as a stream of nbits per value, (rows, bytes) uint8
+    shifts = np.arange(nbits - 1, -1, -1, dtype=np.uint64)
+    bits = (np.asarray(values, dtype=np.uint64)[:, :, None] >> shifts) & np.uint64(1)
+    packed = np.packbits(bits.astype(np.uint8).reshape(len(bits), -1), axis=1)
+    return packed[:, _word_order(packed.shape[1])]
+
+
+def _unstuff(blob, offset, count, nbits):
+    # count values of nbits from blob at offset, returns the values and the offset after them
+    size = (count * nbits + 7) // 8
+    data = np.frombuffer(blob, np.uint8, size, offset)[_word_order(size)]
+    bits = np.unpackbits(data)[:count * nbits].reshape(count, nbits)
+    weights = np.left_shift(1, np.arange(nbits - 1, -1, -1, dtype=np.int64))
+    return bits.astype(np.int64).dot(weights), offset + size
+
+
+def _count_bytes(count):
+    # bytes of a value count in a bit stream header and their code in its 2 high bits
+    if count < 256:
+        return 1, 2
+    return (2, 1) if count < 65536 else (4, 0)
+
+
+def _bit_lengths(values):
+    # bits needed for each non negative integer
+    return (np.asarray(values)[:, None] >= np.left_shift(1, np.arange(62, dtype=np.int64))).sum(axis=1)
+
+
+def _micro_blocks(array):
+    # (nrows, ncols) -> (blocks, MICRO_BLOCK * MICRO_BLOCK), blocks row by row
+    nrows, ncols = array.shape
+    blocks = array.reshape(nrows // MICRO_BLOCK, MICRO_BLOCK, ncols // MICRO_BLOCK, MICRO_BLOCK)
+    return blocks.transpose(0, 2, 1, 3).reshape(-1, MICRO_BLOCK * MICRO_BLOCK)
+
+
+def _from_micro_blocks(blocks, nrows, ncols):
+    blocks = blocks.reshape(nrows // MICRO_BLOCK, ncols // MICRO_BLOCK, MICRO_BLOCK, MICRO_BLOCK)
+    return blocks.transpose(0, 2, 1, 3).reshape(nrows, ncols)
+
+
+def _padded_blocks(array, fill):
+    # micro blocks of an array padded with fill to whole blocks, padding stands for the smaller edge blocks
+    nrows, ncols = array.shape
+    padded = np.full((-(-nrows // MICRO_BLOCK) * MICRO_BLOCK, -(-ncols // MICRO_BLOCK) * MICRO_BLOCK), fill,
+                     dtype=array.dtype)
+    padded[:nrows, :ncols] = array
+    checks = (np.arange(padded.shape[1] // MICRO_BLOCK) * MICRO_BLOCK >> 3 & 15) << 2
+    return _micro_blocks(padded), np.tile(checks, padded.shape[0] // MICRO_BLOCK), padded.shape
+
+
+def _encode_blocks(z, max_error):
+    # the micro blocks of a float32 tile with its NoData as NaN, as byte strings
+    blocks, checks, _ = _padded_blocks(z, np.nan)
+    valid = ~np.isnan(blocks)
+    counts = valid.sum(axis=1)
+    low = np.where(valid, blocks, np.inf).min(axis=1)
+    high = np.where(valid, blocks, -np.inf).max(axis=1)
+
+    if max_error > 0:
+        with np.errstate(invalid="ignore"):
+            quantized = np.where(valid, np.floor((blocks - low[:, None]) / (2.0 * max_error) + 0.5), 0)
+        depths = _bit_lengths(np.minimum(quantized.max(axis=1), 2 ** 40).astype(np.int64))
+    else:
+        quantized = None
+        depths = np.where(low == high, 0, 32)
+
+    # stuffed: flag, offset, bit depth, count and the bits, raw: flag and the values
+    stuffed = 6 + _count_bytes(MICRO_BLOCK * MICRO_BLOCK)[0] + (counts * depths + 7) // 8
+    kinds = np.where(depths == 0, 3, np.where((depths < 32) & (stuffed < 1 + 4 * counts), 1, 0))
+    kinds[(counts == 0) | ((low == 0) & (high == 0))] = 2
+
+    data = [None] * len(blocks)
+    for block in np.flatnonzero(kinds == 0).tolist():
+        data[block] = blocks[block][valid[block]].astype("<f4").tobytes()
+    selected = np.flatnonzero(kinds == 1)
+    for depth, count in set(zip(depths[selected].tolist(), counts[selected].tolist())):
+        group = selected[(depths[selected] == depth) & (counts[selected] == count)]
+        values = quantized[group][valid[group]].reshape(len(group), count)
+        count_bytes, code = _count_bytes(count)
+        head = struct.pack("<B", depth | code << 6) + count.to_bytes(count_bytes, "little")
+        for block, bits in zip(group.tolist(), _stuff(values, depth)):
+            data[block] = head + bits.tobytes()
+
+    parts = []
+    offsets = low.astype("<f4")
+    for block, kind in enumerate(kinds.tolist()):
+        parts.append(struct.pack("<B", checks[block] | kind))
+        if kind in (1, 3):
+            parts.append(offsets[block].tobytes())
+        if kind in (0, 1):
+            parts.append(data[block])
+    return parts
+
+
+def encode_tile(z, max_error):
+    """
+    Encodes a tile of elevations (NaN is NoData) as a LERC2 blob of float32
+    values, every value within max_error of its float32 value.
+    """
+    z = np.asarray(z, dtype=np.float32)
+    nrows, ncols = z.shape
+    valid = ~np.isnan(z)
+    count = int(valid.sum())
+    z_min = float(z[valid].min()) if count else 0.0
+    z_max = float(z[valid].max()) if count else 0.0
+
+    if 0 < count < z.size:
+        mask = _rle(np.packbits(valid.ravel()).tobytes())
+        parts = [struct.pack("<i", len(mask)), mask]
+    else:
+        parts = [struct.pack("<i", 0)]
+    if count and z_min != z_max:
+        # 0: micro blocks, not all values in one sweep
+        parts += [b"\x00"] + _encode_blocks(z, max_error)
+
+    body = b"".join(parts)
+    header = struct.pack(LERC_HEADER, LERC_SIGNATURE, LERC_VERSION, nrows, ncols, count, MICRO_BLOCK,
+                         struct.calcsize(LERC_HEADER) + len(body), LERC_FLOAT, max_error, z_min, z_max)
+    return header + body
+
+
+def decode_tile(blob):
+    # float32 elevations of a LERC2 float32 tile without lookup table coding, NaN for NoData
+    (signature, version, nrows, ncols, count, micro_block, _, data_type, max_error, z_min,
+     z_max) = struct.unpack_from(LERC_HEADER, blob)
+    if signature != LERC_SIGNATURE or version != LERC_VERSION or data_type != LERC_FLOAT:
+        raise ValueError("Not a LERC2 version 2 float tile")
+    if micro_block != MICRO_BLOCK:
+        raise ValueError("Unsupported LERC2 micro block size: " + str(micro_block))
+    offset = struct.calcsize(LERC_HEADER)
+
+    mask_size = struct.unpack_from("<i", blob, offset)[0]
+    offset += 4
+    size = nrows * ncols
+    valid = np.full((nrows, ncols), count == size)
+    if mask_size:
+        valid = np.unpackbits(np.frombuffer(_unrle(blob, offset), np.uint8))[:size].astype(bool).reshape(nrows, ncols)
+        offset += mask_size
+
+    z = np.full((nrows, ncols), np.nan, dtype=np.float32)
+    if count == 0 or z_min == z_max:
+        z[valid] = z_min
+        return z
+    if blob[offset]:
+        z[valid] = np.frombuffer(blob, "<f4", count, offset + 1)
+        return z
+    offset += 1
+
+    block_valid, checks, shape = _padded_blocks(valid, False)
+    counts = block_valid.sum(axis=1).tolist()
+    values = np.zeros(block_valid.shape)
+    for block, count in enumerate(counts):
+        flag = blob[offset]
+        offset += 1
+        if flag >> 2 & 15 != checks[block] >> 2:
+            raise ValueError("Corrupt LERC2 tile")
+        kind = flag & 3
+        if kind == 0:
+            values[block, block_valid[block]] = np.frombuffer(blob, "<f4", count, offset)
+            offset += 4 * count
+        elif kind != 2:
+            offset_type = np.dtype(LERC_OFFSET_TYPES[flag >> 6])
+            low = float(np.frombuffer(blob, offset_type, 1, offset)[0])
+            offset += offset_type.itemsize
+            if kind == 3:
+                values[block] = low
+                continue
+            depth = blob[offset]
+            if depth & 32:
+                raise ValueError("LERC2 lookup table coding is not supported")
+            count_bytes = {0: 4, 1: 2, 2: 1}[depth >> 6]
+            stored = int.from_bytes(blob[offset + 1:offset + 1 + count_bytes], "little")
+            if stored != count:
+                raise ValueError("Corrupt LERC2 tile")
+            quantized, offset = _unstuff(blob, offset + 1 + count_bytes, count, depth & 31)
+            values[block, block_valid[block]] = np.minimum(low + quantized * (2.0 * max_error), z_max)
+
+    values = _from_micro_blocks(values, *shape)[:nrows, :ncols]
+    z[valid] = values[valid]
+    return z
+
+
+# ----------------------------Bundles---------------------------- #
+
+def bundle_file(cache_folder, level, row, col):
+    # bundle holding a tile, named after its first tile row and col
+    return os.path.join(cache_folder, TILES_FOLDER, "L%02d" % level,
+                        "R%04xC%04x.bundle" % (row - row % BUNDLE_TILES, col - col % BUNDLE_TILES))
+
+
+def write_bundle(filename, tiles):
+    # tiles maps (row, col) to encoded tiles, rows and cols of any tile in the bundle
+    index = np.zeros(BUNDLE_RECORDS, dtype="<u8")
+    offset = struct.calcsize(BUNDLE_HEADER) + index.nbytes
+    data = []
+    for (row, col), blob in sorted(tiles.items()):
+        offset += 4
+        index[(row % BUNDLE_TILES) * BUNDLE_TILES + col % BUNDLE_TILES] = len(blob) << 8 * OFFSET_BYTES | offset
+        data += [struct.pack("<I", len(blob)), blob]
+        offset += len(blob)
+
+    folder = os.path.dirname(filename)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    largest = max(len(blob) for blob in tiles.values()) if tiles else 0
+    with open(filename, "wb") as bundle:
+        bundle.write(struct.pack(BUNDLE_HEADER, BUNDLE_VERSION, BUNDLE_RECORDS, largest, OFFSET_BYTES, 0, offset, 0,
+                                 20 + index.nbytes, 3, 16, BUNDLE_RECORDS, OFFSET_BYTES, index.nbytes))
+        bundle.write(index.tobytes())
+        for part in data:
+            bundle.write(part)
+
+    return filename
+
+
+def _check_bundle(header, filename):
+    version, records = struct.unpack_from("<2i", header)
+    if version != BUNDLE_VERSION or records != BUNDLE_RECORDS:
+        raise ValueError("Not a compact cache V2 bundle: " + filename)
+
+
+def read_tile(cache_folder, level, row, col):
+    # encoded tile from the cache, None where there is no tile
+    filename = bundle_file(cache_folder, level, row, col)
+    if not os.path.exists(filename):
+        return None
+
+    with open(filename, "rb") as bundle:
+        _check_bundle(bundle.read(struct.calcsize(BUNDLE_HEADER)), filename)
+        bundle.seek((row % BUNDLE_TILES * BUNDLE_TILES + col % BUNDLE_TILES) * 8, 1)
+        entry = struct.unpack("<Q", bundle.read(8))[0]
+        if entry >> 8 * OFFSET_BYTES == 0:
+            return None
+        bundle.seek(entry & OFFSET_MASK)
+        return bundle.read(entry >> 8 * OFFSET_BYTES)
+
+
+def read_bundle(filename):
+    # all tiles of a bundle as a dict of (row, col) to encoded tiles, empty if there is no bundle
+    if not os.path.exists(filename):
+        return {}
+
+    with open(filename, "rb") as bundle:
+        data = bundle.read()
+    _check_bundle(data, filename)
+    index = np.frombuffer(data, "<u8", BUNDLE_RECORDS, struct.calcsize(BUNDLE_HEADER))
+
+    row0, col0 = [int(part, 16) for part in os.path.basename(filename)[1:-len(".bundle")].split("C")]
+    tiles = {}
+    for entry in np.flatnonzero(index >> np.uint64(8 * OFFSET_BYTES)).tolist():
+        offset, size = int(index[entry]) & OFFSET_MASK, int(index[entry]) >> 8 * OFFSET_BYTES
+        tiles[(row0 + entry // BUNDLE_TILES, col0 + entry % BUNDLE_TILES)] = data[offset:offset + size]
+    return tiles
+
+
+# ----------------------------Pyramid---------------------------- #
+# Levels from the source resolution down to max_level are sampled bilinearly from
+# the source tile by tile. The level at the source resolution is also kept in a
+# memory mapped file from which each coarser level is averaged 2 x 2, again into
+# a file for the next one, so no level reads more than twice its own cells.
+
+def _sample_tile(source, level, row, col):
+    grid = tiles_grid(level, row, col)
+    centers = (np.arange(TILE_SIZE) + 0.5) * grid.cell_size
+    x, y = np.meshgrid(grid.x_min + centers, grid.y_max - centers)
+    return raster_lib.sample_bilinear(source, x.ravel(), y.ravel()).reshape(TILE_SIZE, TILE_SIZE)
+
+
+def _average_tile(child, child_origin, row, col):
+    # 2 x 2 mean of the child level cells under a tile, NoData ignored
+    window = child.read_native(2 * TILE_SIZE * row - child_origin[0], 2 * TILE_SIZE * col - child_origin[1],
+                               2 * TILE_SIZE, 2 * TILE_SIZE).reshape(TILE_SIZE, 2, TILE_SIZE, 2)
+    valid = ~np.isnan(window)
+    counts = valid.sum(axis=(1, 3))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, np.where(valid, window, 0.0).sum(axis=(1, 3)) / counts, np.nan)
+
+
+def tile_hash(z):
+    # content hash of the float32 values of a tile, None for a tile without data
+    z = np.asarray(z, dtype=np.float32)
+    if np.isnan(z).all():
+        return None
+    return hashlib.blake2b(z.tobytes(), digest_size=16).hexdigest()
+
+
+def _encode_tiles(job):
+    """
+    Pool worker: tiles of a level, sampled from the source or averaged from the
+    finer level, written to the level file if there is one. known maps tiles to
+    their hashes in the cache, tiles with the same hash are left out. Returns the
+    job tiles and row, col, hash and encoded bytes of the other tiles, hash and
+    bytes None for tiles without data.
+    """
+    level, tiles, max_error, source, child, level_file, known = job
+    if source is not None:
+        source = raster_lib.open_memmap(*source)
+    if child is not None:
+        child_file, child_grid, child_origin = child
+        child = raster_lib.open_memmap(child_file, child_grid)
+    if level_file is not None:
+        level_file, level_origin = level_file
+        level_array = np.load(level_file, mmap_mode="r+")
+
+    encoded = []
+    for row, col in tiles:
+        if source is not None:
+            z = _sample_tile(source, level, row, col)
+        else:
+            z = _average_tile(child, child_origin, row, col)
+
+        if level_file is not None:
+            r, c = TILE_SIZE * row - level_origin[0], TILE_SIZE * col - level_origin[1]
+            level_array[r:r + TILE_SIZE, c:c + TILE_SIZE] = z
+
+        digest = tile_hash(z)
+        if known.get((row, col)) != digest:
+            encoded.append((row, col, digest, None if digest is None else encode_tile(z, max_error)))
+
+    if level_file is not None:
+        level_array.flush()
+
+    return tiles, encoded
+
+
+def _chunks(tiles):
+    # the tiles grouped by the chunks they are in, sorted, so a chunk never crosses a bundle
+    chunks = {}
+    for row, col in tiles:
+        chunks.setdefault((row // CHUNK_TILES, col // CHUNK_TILES), []).append((row, col))
+    return [sorted(chunks[key]) for key in sorted(chunks)]
+
+
+def _range_chunks(tile_rows, tile_cols):
+    # the chunks of all tiles in the row and col ranges
+    row0, row1 = tile_rows
+    col0, col1 = tile_cols
+    for r in range(row0 - row0 % CHUNK_TILES, row1, CHUNK_TILES):
+        for c in range(col0 - col0 % CHUNK_TILES, col1, CHUNK_TILES):
+            yield [(row, col) for row in range(max(r, row0), min(r + CHUNK_TILES, row1))
+                   for col in range(max(c, col0), min(c + CHUNK_TILES, col1))]
+
+
+def _finish_bundle(filename, tiles):
+    # write a bundle with tiles, a bundle without any is removed
+    if tiles:
+        write_bundle(filename, tiles)
+    elif os.path.exists(filename):
+        os.remove(filename)
+
+
+def _encode_level(pool, jobs, cache_folder, level, merge=False):
+    """
+    Runs the jobs of a level and writes each bundle once all its jobs are done,
+    if merge into the tiles already in the bundle, where tiles without data are
+    removed. Returns the hash of every tile encoded or removed, None if removed.
+    """
+    pending = {}
+    for job in jobs:
+        name = bundle_file(cache_folder, level, *job[1][0])
+        pending[name] = pending.get(name, 0) + 1
+    bundles = dict((name, {}) for name in pending)
+    hashes = {}
+
+    results = pool.imap_unordered(_encode_tiles, jobs) if pool else map(_encode_tiles, jobs)
+    for tiles, encoded in results:
+        name = bundle_file(cache_folder, level, *tiles[0])
+        for row, col, digest, blob in encoded:
+            bundles[name][(row, col)] = blob
+            hashes[(row, col)] = digest
+
+        pending[name] -= 1
+        if pending[name]:
+            continue
+        updates = bundles.pop(name)
+        if not merge:
+            _finish_bundle(name, updates)
+        elif updates:
+            tiles = read_bundle(name)
+            tiles.update(updates)
+            _finish_bundle(name, dict((tile, blob) for tile, blob in tiles.items() if blob is not None))
+
+    return hashes
+
+
+def _level_file(folder, level, tile_rows, tile_cols, create=True):
+    # float32 file of the tiles of a level, NaN filled if created, returns its name, grid and origin in level cells
+    filename = os.path.join(folder, "level_%02d.npy" % level)
+    grid = tiles_grid(level, tile_rows[0], tile_cols[0], tile_rows[1] - tile_rows[0], tile_cols[1] - tile_cols[0])
+    if create:
+        array = np.lib.format.open_memmap(filename, mode="w+", dtype=np.float32, shape=(grid.nrows, grid.ncols))
+        for row in range(0, grid.nrows, TILE_SIZE):
+            array[row:row + TILE_SIZE] = np.nan
+        array.flush()
+        del array
+    return filename, grid, (TILE_SIZE * tile_rows[0], TILE_SIZE * tile_cols[0])
+
+
+def _level_range(extent, level):
+    # tile rows and cols of a level as two ranges
+    row0, row1, col0, col1 = tile_range(extent, level)
+    return (row0, row1), (col0, col1)
+
+
+def _spatial_reference_xml():
+    return ("<SpatialReference xsi:type='typens:ProjectedCoordinateSystem'><WKT>" + WEB_MERCATOR_WKT + "</WKT>"
+            "<XOrigin>-20037700</XOrigin><YOrigin>-30241100</YOrigin><XYScale>10000</XYScale>"
+            "<ZOrigin>-100000</ZOrigin><ZScale>10000</ZScale><MOrigin>-100000</MOrigin><MScale>10000</MScale>"
+            "<XYTolerance>0.001</XYTolerance><ZTolerance>0.001</ZTolerance><MTolerance>0.001</MTolerance>"
+            "<HighPrecision>true</HighPrecision><WKID>102100</WKID><LatestWKID>3857</LatestWKID>"
+            "</SpatialReference>")
+
+
+def _write_conf(cache_folder, max_error, extent):
+    # conf.xml with the tiling scheme and the LERC compact V2 storage, and conf.cdi with the extent of the data
+    lods = "".join("<LODInfo xsi:type='typens:LODInfo'><LevelID>%d</LevelID><Scale>%r</Scale>"
+                   "<Resolution>%r</Resolution></LODInfo>" % (level, SCALES[level], resolution(level))
+                   for level in range(LEVELS))
+    conf = ("<?xml version=\"1.0\" encoding=\"utf-8\"?>\n"
+            "<CacheInfo xsi:type='typens:CacheInfo' " + XML_NAMESPACES + ">"
+            "<TileCacheInfo xsi:type='typens:TileCacheInfo'>" + _spatial_reference_xml() +
+            "<TileOrigin xsi:type='typens:PointN'><X>%r</X><Y>%r</Y></TileOrigin>"
+            "<TileCols>%d</TileCols><TileRows>%d</TileRows><DPI>%d</DPI><PreciseDPI>%d</PreciseDPI>"
+            "<LODInfos xsi:type='typens:ArrayOfLODInfo'>%s</LODInfos></TileCacheInfo>"
+            "<TileImageInfo xsi:type='typens:TileImageInfo'><CacheTileFormat>LERC</CacheTileFormat>"
+            "<CompressionQuality>0</CompressionQuality><Antialiasing>false</Antialiasing><BandCount>1</BandCount>"
+            "<LERCError>%r</LERCError></TileImageInfo>"
+            "<CacheStorageInfo xsi:type='typens:CacheStorageInfo'>"
+            "<StorageFormat>esriMapCacheStorageModeCompactV2</StorageFormat><PacketSize>%d</PacketSize>"
+            "</CacheStorageInfo></CacheInfo>") % (ORIGIN_X, ORIGIN_Y, TILE_SIZE, TILE_SIZE, DPI, DPI, lods,
+                                                   float(max_error), BUNDLE_TILES)
+    cdi = ("<?xml version=\"1.0\" encoding=\"utf-8\"?>\n"
+           "<EnvelopeN xsi:type='typens:EnvelopeN' " + XML_NAMESPACES + ">"
+           "<XMin>%r</XMin><YMin>%r</YMin><XMax>%r</XMax><YMax>%r</YMax>" % tuple(float(value) for value in extent) +
+           _spatial_reference_xml() + "</EnvelopeN>")
+
+    for name, text in ((CONF_XML, conf), (CONF_CDI, cdi)):
+        with open(os.path.join(cache_folder, name), "w") as conf_file:
+            conf_file.write(text)
+
+
+def build_tile_cache(source_file, source_grid, cache_folder, min_level, max_level, max_error, work_folder=None,
+                     processes=None, log=None, incremental=False):
+    """
+    Builds the tiles of levels min_level..max_level of a Web Mercator source,
+    a float32 .npy file written by raster_lib.to_memmap, into bundles in
+    cache_folder. Chunks of tiles are encoded in processes processes, level by
+    level from fine to coarse. If incremental the level files are kept and a
+    manifest is written for refresh_tile_cache. Returns the number of tiles per
+    level.
+    """
+    if work_folder is None:
+        work_folder = cache_folder
+    levels_folder = os.path.join(cache_folder, LEVELS_FOLDER) if incremental else work_folder
+    for folder in (cache_folder, work_folder, levels_folder):
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+    extent = raster_lib.grid_extent(source_grid)
+    base_level = max(level_for_resolution(source_grid.cell_size, max_level), min_level)
+    tile_counts = {}
+    tile_hashes = {}
+    child = None
+
+    processes = raster_lib.pool_size(processes, len(list(_range_chunks(*_level_range(extent, max_level)))))
+    pool = raster_lib.process_pool(processes) if processes > 1 else None
+    try:
+        for level in range(max_level, min_level - 1, -1):
+            tile_rows, tile_cols = _level_range(extent, level)
+            level_file = None
+            if min_level < level <= base_level:
+                level_file = _level_file(levels_folder, level, tile_rows, tile_cols)
+
+            jobs = [(level, tiles, max_error, (source_file, source_grid) if level >= base_level else None,
+                     child, (level_file[0], level_file[2]) if level_file else None, {})
+                    for tiles in _range_chunks(tile_rows, tile_cols)]
+            tile_hashes[level] = _encode_level(pool, jobs, cache_folder, level)
+            tile_counts[level] = len(tile_hashes[level])
+
+            if child is not None and not incremental:
+                os.remove(child[0])
+            child = level_file
+
+            if log:
+                log("Level " + str(level) + ": " + str(tile_counts[level]) + " tiles.")
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    if child is not None and not incremental:
+        os.remove(child[0])
+
+    _write_conf(cache_folder, max_error, extent)
+    if incremental:
+        write_manifest(cache_folder, source_grid, min_level, max_level, max_error,
+                       source_hashes(source_file), tile_hashes)
+
+    return tile_counts
+
+
+# ----------------------------Incremental refresh---------------------------- #
+# The manifest of an incremental cache holds the source grid, a hash of every
+# HASH_BLOCK block of the source and the content hash of every tile. Blocks whose
+# hash changed, grown by a cell for the bilinear sampling, give the dirty tiles of
+# the levels sampled from the source. Below those, the dirty tiles are the parents
+# of the tiles whose content changed, averaged again from the kept level files,
+# so a refresh gives the same tiles as a full build.
+
+def source_hashes(source_file, block_size=HASH_BLOCK):
+    # hash of every block of a .npy source, keyed by "row,col" of its first cell
+    array = np.load(source_file, mmap_mode="r")
+    grid = raster_lib.RasterGrid(0.0, 0.0, 1.0, array.shape[1], array.shape[0])
+    return dict(("%d,%d" % (row, col), hashlib.blake2b(np.ascontiguousarray(
+                 array[row:row + nrows, col:col + ncols]).tobytes(), digest_size=16).hexdigest())
+                for row, col, nrows, ncols in raster_lib.iter_blocks(grid, block_size))
+
+
+def _tile_key(tile):
+    return "%d,%d" % tile
+
+
+def _key_tile(key):
+    row, col = key.split(",")
+    return int(row), int(col)
+
+
+def write_manifest(cache_folder, source_grid, min_level, max_level, max_error, blocks, tile_hashes):
+    # tile_hashes maps levels to dicts of (row, col) to the content hash of the tiles with data
+    manifest = {"version": MANIFEST_VERSION, "grid": source_grid._asdict(), "min_level": min_level,
+                "max_level": max_level, "max_error": max_error, "hash_block": HASH_BLOCK, "blocks": blocks,
+                "tiles": dict((str(level), dict((_tile_key(tile), digest) for tile, digest in hashes.items()))
+                              for level, hashes in tile_hashes.items())}
+    with open(os.path.join(cache_folder, MANIFEST_FILE), "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+
+
+def read_manifest(cache_folder):
+    # the manifest of a cache with its tile hashes as in write_manifest, None if there is none
+    filename = os.path.join(cache_folder, MANIFEST_FILE)
+    if not os.path.exists(filename):
+        return None
+    with open(filename) as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    manifest["grid"] = raster_lib.RasterGrid(**manifest["grid"])
+    manifest["tiles"] = dict((int(level), dict((_key_tile(key), digest) for key, digest in hashes.items()))
+                             for level, hashes in manifest["tiles"].items())
+    return manifest
+
+
+def changed_extents(source_grid, old_blocks, new_blocks, block_size=HASH_BLOCK):
+    # x_min, y_min, x_max, y_max of the source blocks whose hash changed, grown by one cell
+    extents = []
+    for key, digest in sorted(new_blocks.items()):
+        if old_blocks.get(key) == digest:
+            continue
+        row, col = _key_tile(key)
+        block = raster_lib.block_grid(source_grid, row, col, min(block_size, source_grid.nrows - row),
+                                      min(block_size, source_grid.ncols - col))
+        extents.append(raster_lib.grid_extent(raster_lib.expand_grid(block, 1)))
+    return extents
+
+
+def _dirty_tiles(extents, level, tile_rows, tile_cols):
+    # tiles of a level intersecting any of the extents
+    tiles = set()
+    for extent in extents:
+        row0, row1, col0, col1 = tile_range(extent, level)
+        for row in range(max(row0, tile_rows[0]), min(row1, tile_rows[1])):
+            for col in range(max(col0, tile_cols[0]), min(col1, tile_cols[1])):
+                tiles.add((row, col))
+    return tiles
+
+
+def refresh_tile_cache(source_file, source_grid, cache_folder, min_level, max_level, max_error, work_folder=None,
+                       processes=None, log=None):
+    """
+    Brings an incremental cache up to date with a new version of its source,
+    encoding only the tiles whose content changed and averaging their parents
+    again, level by level up the pyramid. The cache is built again, as
+    incremental, if it has no manifest or its grid, levels or max_error differ.
+    Returns the number of tiles encoded or removed per level.
+    """
+    manifest = read_manifest(cache_folder)
+    levels_folder = os.path.join(cache_folder, LEVELS_FOLDER)
+    extent = raster_lib.grid_extent(source_grid)
+    base_level = max(level_for_resolution(source_grid.cell_size, max_level), min_level)
+    level_files = [_level_file(levels_folder, level, *_level_range(extent, level), create=False)[0]
+                   for level in range(min_level + 1, base_level + 1)]
+
+    stale = (manifest is None or tuple(manifest["grid"]) != tuple(source_grid) or
+             (manifest["min_level"], manifest["max_level"], manifest["max_error"], manifest["hash_block"]) !=
+             (min_level, max_level, max_error, HASH_BLOCK))
+    if stale or not all(os.path.exists(filename) for filename in level_files):
+        if log:
+            log("No matching manifest, building the whole cache.")
+        return build_tile_cache(source_file, source_grid, cache_folder, min_level, max_level, max_error,
+                                work_folder, processes, log, incremental=True)
+
+    blocks = source_hashes(source_file)
+    extents = changed_extents(source_grid, manifest["blocks"], blocks)
+    tile_hashes = manifest["tiles"]
+    tile_counts = dict((level, 0) for level in range(min_level, max_level + 1))
+    if not extents:
+        if log:
+            log("Source unchanged, the cache is up to date.")
+        return tile_counts
+
+    changed = set()
+    pool = None
+    try:
+        for level in range(max_level, min_level - 1, -1):
+            tile_rows, tile_cols = _level_range(extent, level)
+            if level >= base_level:
+                dirty = _dirty_tiles(extents, level, tile_rows, tile_cols)
+            else:
+                dirty = set((row // 2, col // 2) for row, col in changed)
+
+            child = None
+            if level < base_level:
+                child = _level_file(levels_folder, level + 1, *_level_range(extent, level + 1), create=False)
+            level_file = None
+            if min_level < level <= base_level:
+                level_file = _level_file(levels_folder, level, tile_rows, tile_cols, create=False)
+
+            known = tile_hashes.setdefault(level, {})
+            jobs = [(level, tiles, max_error, (source_file, source_grid) if level >= base_level else None, child,
+                     (level_file[0], level_file[2]) if level_file else None,
+                     dict((tile, known.get(tile)) for tile in tiles))
+                    for tiles in _chunks(dirty)]
+            if pool is None and len(jobs) > 1:
+                size = raster_lib.pool_size(processes, len(jobs))
+                pool = raster_lib.process_pool(size) if size > 1 else None
+
+            hashes = _encode_level(pool, jobs, cache_folder, level, merge=True)
+            for tile, digest in hashes.items():
+                if digest is None:
+                    known.pop(tile, None)
+                else:
+                    known[tile] = digest
+            changed = set(hashes)
+            tile_counts[level] = len(hashes)
+
+            if log:
+                log("Level " + str(level) + ": " + str(len(dirty)) + " dirty tiles, " + str(len(hashes)) +
+                    " changed.")
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    _write_conf(cache_folder, max_error, extent)
+    write_manifest(cache_folder, source_grid, min_level, max_level, max_error, blocks, tile_hashes)
+
+    return tile_counts
+
+
+# ----------------------------arcpy bridge---------------------------- #
+
+def web_mercator_raster(input_raster, work_folder):
+    # the raster itself if it is in Web Mercator, otherwise a bilinear projection of it in work_folder
+    spatial_reference = arcpy.Describe(input_raster).spatialReference
+    if spatial_reference.factoryCode in WEB_MERCATOR:
+        return input_raster
+
+    projected = os.path.join(work_folder, "web_mercator.tif")
+    if arcpy.Exists(projected):
+        arcpy.Delete_management(projected)
+    arcpy.ProjectRaster_management(input_raster, projected, arcpy.SpatialReference(3857), "BILINEAR")
+    return projected
+
+
+def build_elevation_cache(input_raster, cache_directory, scale_level, max_error, processes=None,
+                          max_level=LEVELS - 1, log=None, refresh=False):
+    """
+    Local replacement for GenerateTileCacheTilingScheme and ManageTileCache
+    (LERC): caches levels scale_level..max_level of an elevation raster in
+    <cache_directory>/<raster name>_cache. The raster is read once into a
+    memory mapped file the workers share. If refresh the cache is incremental
+    and only the tiles changed since the last run are rebuilt. Returns the
+    cache folder.
+    """
+    description = arcpy.Describe(input_raster)
+    input_raster = description.catalogPath
+    cache_folder = os.path.join(cache_directory, description.name + "_cache")
+    work_folder = os.path.join(cache_folder, "work")
+    if not os.path.exists(work_folder):
+        os.makedirs(work_folder)
+
+    source = raster_lib.RasterSource(web_mercator_raster(input_raster, work_folder))
+    source_file = os.path.join(work_folder, "source.npy")
+    raster_lib.to_memmap(source, source_file)
+
+    if refresh:
+        refresh_tile_cache(source_file, source.grid, cache_folder, scale_level, max_level, max_error, work_folder,
+                           processes, log)
+    else:
+        build_tile_cache(source_file, source.grid, cache_folder, scale_level, max_level, max_error, work_folder,
+                         processes, log)
+
+    for name in os.listdir(work_folder):
+        os.remove(os.path.join(work_folder, name))
+    os.rmdir(work_folder)
+
+    return cache_folder
@@ -0,0 +1,139 @@
+# -------------------------------------------------------------------------------
+# Name:        zonal_lib
+# Purpose:     NumPy zonal statistics of polygon features on several surfaces in
+#              one pass: features are rasterized once per surface grid and each
+#              surface is read once, block by block, for all statistics.
+#
+# Author:      Gert van Maren
+#
+# Created:     19/10/2026
+# Copyright:   (c) Esri 2026
+# updated:
+# updated:
+# updated:
+
+# Required:    numpy. arcpy only for reading the features and rasters and
+#              writing the attributes.
+
+# -------------------------------------------------------------------------------
+
+import numpy as np
+
+import raster_lib
+import polygon_lib
+
+try:
+    import arcpy
+except ImportError:  # the engines don't need arcpy, e.g. for testing
+    arcpy = None
+
+# Constants
+# CLEARANCE is the minimum of the feature surface (polygon_lib.rasterize_surface) minus the surface
+ZONAL_STATISTICS = ["MINIMUM", "MAXIMUM", "MEAN", "COUNT", "CLEARANCE"]
+FEATURE_Z = ["Z_MIN", "Z_MAX"]
+HEIGHT_DECIMALS = 2
+
+
+# ----------------------------Zonal statistics---------------------------- #
+
+def zonal_reduce(zones, values, count, statistic):
+    # statistic of the values per zone 0..count - 1, NoData (NaN) ignored, NaN for zones without data
+    valid = ~np.isnan(values)
+    zones, values = zones[valid], values[valid]
+
+    if statistic == "COUNT":
+        return np.bincount(zones, minlength=count).astype(np.float64)
+    if statistic == "MEAN":
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.bincount(zones, weights=values, minlength=count) / np.bincount(zones, minlength=count)
+
+    result = np.full(count, np.nan)
+    if statistic == "MAXIMUM":
+        np.fmax.at(result, zones, values)
+    else:
+        np.fmin.at(result, zones, values)
+    return result
+
+
+def feature_z(rings, z, count):
+    # Z_MIN and Z_MAX of the vertices per feature, like AddZInformation
+    features = rings.features[polygon_lib.ring_ids(rings)]
+    result = {"Z_MIN": np.full(count, np.nan), "Z_MAX": np.full(count, np.nan)}
+    np.fmin.at(result["Z_MIN"], features, z)
+    np.fmax.at(result["Z_MAX"], features, z)
+    return result
+
+
+def feature_statistics(rings, z, count, surfaces, statistics, surface_method="LINEAR"):
+    """
+    Zonal statistics of count features on several surfaces. surfaces maps names
+    to raster_lib sources, statistics is a list of (name, surface, statistic).
+    The features are rasterized once per distinct surface grid (CELL_CENTER) and
+    every surface is read once for all its statistics. Returns {name: values}.
+    """
+    results = {}
+    cells = {}
+
+    for surface_name in sorted(set(surface for name, surface, statistic in statistics)):
+        source = surfaces[surface_name]
+        grid = tuple(source.grid)
+        if grid not in cells:
+            cells[grid] = polygon_lib.rasterize_surface(rings, z, source.grid, surface_method)
+        features, rows, cols, cell_z = cells[grid]
+
+        values = raster_lib.read_cells(source, rows, cols)
+        for name, surface, statistic in statistics:
+            if surface != surface_name:
+                continue
+            if statistic == "CLEARANCE":
+                results[name] = zonal_reduce(features, cell_z - values, count, "MINIMUM")
+            else:
+                results[name] = zonal_reduce(features, values, count, statistic)
+
+    return results
+
+
+def combine(results, heights, decimals=HEIGHT_DECIMALS):
+    # heights is a list of (name, added names, subtracted names) over the results, rounded unless decimals is None
+    for name, added, subtracted in heights:
+        total = sum(results[term] for term in added)
+        for term in subtracted:
+            total = total - results[term]
+        results[name] = total if decimals is None else np.round(total, decimals)
+    return results
+
+
+# ----------------------------arcpy bridge---------------------------- #
+
+def attribute_features(input_features, surfaces, statistics, heights=(), fields=None, surface_method="LINEAR",
+                       decimals=HEIGHT_DECIMALS):
+    """
+    Adds zonal statistics of several rasters and height differences to polygon
+    features in one pass, replacing a ZonalStatisticsAsTable, JoinField and
+    CalculateField round per surface. surfaces maps names to rasters, statistics
+    and heights are as in feature_statistics and combine, where the vertex
+    Z_MIN / Z_MAX of the features can be used as terms. fields are the result
+    names written as DOUBLE fields, all statistics and heights by default.
+    """
+    rings, z = polygon_lib.read_rings(input_features, with_z=True)
+    count = int(arcpy.GetCount_management(input_features).getOutput(0))
+
+    sources = dict((name, raster_lib.RasterSource(raster)) for name, raster in surfaces.items())
+    results = feature_z(rings, z, count)
+    results.update(feature_statistics(rings, z, count, sources, statistics, surface_method))
+    combine(results, heights, decimals)
+
+    if fields is None:
+        fields = [name for name, surface, statistic in statistics] + [name for name, added, subtracted in heights]
+
+    existing = [field.name.upper() for field in arcpy.ListFields(input_features)]
+    for field in fields:
+        if field.upper() not in existing:
+            arcpy.AddField_management(input_features, field, "DOUBLE")
+
+    columns = [results[field] for field in fields]
+    with arcpy.da.UpdateCursor(input_features, fields) as cursor:
+        for i, row in enumerate(cursor):
+            cursor.updateRow([None if np.isnan(column[i]) else float(column[i]) for column in columns])
+
+    return results